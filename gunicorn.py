@@ -15,6 +15,7 @@
 
 """Configure the gunicorn server."""
 
+import gc
 import os
 
 _config = os.environ["ENVIRONMENT"]
@@ -25,15 +26,77 @@ timeout = 20
 accesslog = "-"
 
 
+def _read_first_line(path):
+    try:
+        with open(path) as limit_file:
+            return limit_file.readline().strip()
+    except OSError:
+        return None
+
+
+def _cpu_limit():
+    """CPUs available to the container according to its cgroup, or to the machine if not limited."""
+    quota = _read_first_line("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota> <period>" or "max <period>"
+    if quota:
+        quota, period = quota.split()
+        if quota != "max":
+            return max(1, int(quota) // int(period))
+    quota = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")  # cgroup v1
+    period = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return max(1, int(quota) // int(period))
+    return os.cpu_count() or 1
+
+
+def _memory_limit():
+    """Bytes of memory available to the container according to its cgroup, or None if not limited."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        limit = _read_first_line(path)
+        # cgroup v1 reports no limit as a huge number
+        if limit and limit != "max" and int(limit) < 2 ** 60:
+            return int(limit)
+    return None
+
+
+def _workers():
+    """Number of workers, WEB_CONCURRENCY if set, otherwise as many as the CPU and memory limits allow."""
+    if "WEB_CONCURRENCY" in os.environ:
+        return int(os.environ["WEB_CONCURRENCY"])
+    # two workers I/O bound and a third processing a request per CPU
+    count = 2 * _cpu_limit() + 1
+    memory = _memory_limit()
+    if memory is not None:
+        worker_memory = int(os.environ.get("WORKER_MEMORY", 512 * 1024 ** 2))
+        count = min(count, memory // worker_memory)
+    return max(1, count)
+
+
+def when_ready(server):
+    """Warm up the preloaded application and freeze its heap before workers are forked.
+
+    Objects created while loading and warming up are moved to the permanent generation so that the garbage collector
+    of the workers does not touch, and thereby copy, the memory pages they share with the master process.
+    """
+    if not preload_app:
+        return
+    from upload.app import warmup
+    warmup()
+    gc.collect()
+    if os.environ.get("GC_FREEZE", "1") == "1" and hasattr(gc, "freeze"):
+        gc.freeze()
+        server.log.info("froze %d objects before forking workers", gc.get_freeze_count())
+
+
 if _config == "production":
     # Our resource policy is that each web service is granted at least a single
-    # vCPU when available. The number of workers is then a guess that having two
-    # workers I/O bound and a third processing a request will utilize available
-    # resources well, but that guess needs to be tested and benchmarked.
-    workers = 3
+    # vCPU when available. The number of workers follows the CPU and memory
+    # limits of the container unless set with WEB_CONCURRENCY.
+    workers = _workers()
     preload_app = True
+    timeout = 150
     loglevel = "INFO"
 else:
     workers = 1
+    preload_app = False
     reload = True
     loglevel = "DEBUG"
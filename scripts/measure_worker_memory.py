@@ -0,0 +1,74 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Report the memory unique to each gunicorn worker, i.e. not shared with the master or other workers.
+
+Run inside the container, giving the pid of the gunicorn master, after the workers have served some requests::
+
+    python scripts/measure_worker_memory.py 1
+
+Compare a server started with GC_FREEZE=0 to one started with the default GC_FREEZE=1 to see the effect of freezing
+the preloaded heap before forking.
+"""
+
+import os
+import sys
+
+FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty', 'Shared_Clean', 'Shared_Dirty')
+
+
+def memory(pid):
+    """kB of each of `FIELDS` for a process, from /proc/<pid>/smaps_rollup"""
+    values = dict.fromkeys(FIELDS, 0)
+    path = '/proc/{}/smaps_rollup'.format(pid)
+    if not os.path.exists(path):
+        path = '/proc/{}/smaps'.format(pid)
+    with open(path) as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(':')
+            if name in values:
+                values[name] += int(rest.split()[0])
+    return values
+
+
+def workers(master_pid):
+    children = []
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(pid)) as stat:
+                parent = int(stat.read().rpartition(')')[2].split()[1])
+        except OSError:
+            continue
+        if parent == master_pid:
+            children.append(int(pid))
+    return sorted(children)
+
+
+def main(master_pid):
+    print('{:>8} {:>10} {:>10} {:>10} {:>10}'.format('pid', 'rss', 'pss', 'unique', 'shared'))
+    total = 0
+    for pid in [master_pid] + workers(master_pid):
+        values = memory(pid)
+        unique = values['Private_Clean'] + values['Private_Dirty']
+        shared = values['Shared_Clean'] + values['Shared_Dirty']
+        if pid != master_pid:
+            total += unique
+        print('{:>8} {:>10} {:>10} {:>10} {:>10}'.format(pid, values['Rss'], values['Pss'], unique, shared))
+    print('unique memory of all workers: {} kB'.format(total))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]))
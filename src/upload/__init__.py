@@ -12,22 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging
-
-from potion_client import Client
-from potion_client.auth import HTTPBearerAuth
-import requests
-import numpy as np
-from raven import Client as RavenClient
+import logging.config
+import math
 
 from .settings import Default
 
 
-logging.config.dictConfig(Default.LOGGING)
-raven_client = RavenClient(Default.SENTRY_DSN)
+_raven_client = None
+
+
+def configure_logging():
+    logging.config.dictConfig(Default.LOGGING)
+
+
+def get_raven_client():
+    """the Sentry client, created at first use"""
+    global _raven_client
+    if _raven_client is None:
+        from raven import Client as RavenClient
+        _raven_client = RavenClient(Default.SENTRY_DSN)
+    return _raven_client
 
 
 def iloop_client(api, token):
+    from potion_client import Client
+    from potion_client.auth import HTTPBearerAuth
+    import requests
     requests.packages.urllib3.disable_warnings()
     return Client(
         api,
@@ -39,7 +49,7 @@ def iloop_client(api, token):
 def _isnan(value):
     if isinstance(value, str):
         return False
-    return np.isnan(value)
+    return math.isnan(value)
 
 
 __author__ = 'Henning Redestig'
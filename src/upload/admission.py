@@ -0,0 +1,228 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import os
+import re
+from collections import deque
+from functools import wraps
+
+from aiohttp import web
+
+from upload.multipart import close_form, read_form
+from upload.settings import Default
+
+
+logger = logging.getLogger(__name__)
+
+# rough peak memory of processing an upload relative to its size
+TYPE_FACTORS = {'strains': 2, 'media': 2, 'fermentation': 4, 'fluxes': 4, 'protein_abundances': 4, 'screen': 6}
+
+
+class _Admission(object):
+    """async context manager holding a weight of the controller's capacity"""
+
+    def __init__(self, controller, weight):
+        self.controller = controller
+        self.weight = weight
+
+    async def __aenter__(self):
+        self.weight = await self.controller.acquire(self.weight)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.controller.release(self.weight)
+
+    def reduce(self, weight):
+        """lower the weight held to `weight`, e.g. once the request is known to be lighter than estimated"""
+        if weight < self.weight:
+            self.controller.reduce(self.weight - weight)
+            self.weight = weight
+
+
+class AdmissionController(object):
+    """limit the total weight, e.g. estimated memory use, of the requests a worker processes at a time
+
+    Requests that do not fit wait in a first-in first-out queue of at most `max_queue` requests for at most `timeout`
+    seconds. Requests that find the queue full are rejected with 429, requests that time out with 503, both with a
+    Retry-After header. A request heavier than the capacity is admitted when it is the only one.
+
+    :param capacity: total weight of the requests processed at a time
+    :param max_queue: maximum number of waiting requests
+    :param timeout: seconds a request may wait before being rejected
+    :param retry_after: seconds clients are asked to wait before retrying a rejected request
+    """
+
+    def __init__(self, capacity, max_queue, timeout, retry_after):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.in_use = 0
+        self.active = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _fits(self, weight):
+        return self.in_use + weight <= self.capacity
+
+    def _reject(self, exception_class, reason):
+        return exception_class(headers={'Retry-After': str(self.retry_after)},
+                               text='{{"status": "{}, retry later"}}'.format(reason))
+
+    async def acquire(self, weight):
+        """wait until `weight` fits in the capacity and take it
+
+        :param weight: the weight of the request
+        :return int: the weight taken, at most the capacity
+        :raise HTTPTooManyRequests: if the queue is full
+        :raise HTTPServiceUnavailable: if the weight did not fit within the timeout
+        """
+        weight = min(weight, self.capacity)
+        if not self.waiters and self._fits(weight):
+            self._take(weight)
+            return weight
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            logger.warning('rejecting request of weight {}, {} requests waiting'.format(weight, len(self.waiters)))
+            raise self._reject(web.HTTPTooManyRequests, 'too many uploads waiting')
+        waiter = (weight, asyncio.get_event_loop().create_future())
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.timeout)
+        except asyncio.TimeoutError:
+            if waiter[1].done():
+                # admitted just as the timeout expired
+                return weight
+            self.waiters.remove(waiter)
+            self.timed_out += 1
+            self._wake()
+            logger.warning('request of weight {} timed out waiting for admission'.format(weight))
+            raise self._reject(web.HTTPServiceUnavailable, 'too busy')
+        except asyncio.CancelledError:
+            # the client went away while waiting
+            if waiter[1].done():
+                self.release(weight)
+            else:
+                self.waiters.remove(waiter)
+                self._wake()
+            raise
+        return weight
+
+    def _take(self, weight):
+        self.in_use += weight
+        self.active += 1
+        self.admitted += 1
+
+    def _wake(self):
+        while self.waiters and self._fits(self.waiters[0][0]):
+            weight, future = self.waiters.popleft()
+            self._take(weight)
+            future.set_result(None)
+
+    def release(self, weight):
+        """give back the weight taken by `acquire` and admit waiting requests that now fit"""
+        self.in_use -= weight
+        self.active -= 1
+        self._wake()
+
+    def reduce(self, weight):
+        """give back part of the weight taken by `acquire` and admit waiting requests that now fit"""
+        self.in_use -= weight
+        self._wake()
+
+    def admit(self, weight):
+        """async context manager for processing a request of `weight`
+
+        :param weight: the weight of the request
+        """
+        return _Admission(self, weight)
+
+    def metrics(self):
+        return {'capacity': self.capacity,
+                'in-use': self.in_use,
+                'active': self.active,
+                'queue-depth': len(self.waiters),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed-out': self.timed_out}
+
+
+FILE_FIELD = re.compile(r'^file(?:\[(\d+)\])?\[\d+\]$')
+
+
+def _posted_size(content):
+    position = content.file.tell()
+    size = content.file.seek(0, os.SEEK_END)
+    content.file.seek(position)
+    return size
+
+
+def content_weight(request):
+    """estimated memory needed to process an upload request before reading it, from its Content-Length and the
+    largest type factor
+
+    A request without Content-Length, e.g. a chunked one, weighs the whole capacity of `admission`.
+
+    :param request: the request
+    """
+    if request.content_length is None:
+        return admission.capacity
+    return request.content_length * max(TYPE_FACTORS.values())
+
+
+def request_weight(form):
+    """estimated memory needed to process an upload request, from the sizes and types of its posted files
+
+    The type of the files 'file[k]' is the posted 'what', that of the files 'file[n][k]' of a batch 'what[n]'. The
+    largest factor is assumed for files of an unknown type.
+
+    :param form: the posted form, see `upload.multipart.read_form`
+    """
+    weight = 0
+    for name, content in form.items():
+        match = FILE_FIELD.match(name)
+        if match is None or not hasattr(content, 'file'):
+            continue
+        what = form.get('what[{}]'.format(match.group(1)) if match.group(1) is not None else 'what')
+        weight += _posted_size(content) * TYPE_FACTORS.get(what, max(TYPE_FACTORS.values()))
+    return weight
+
+
+admission = AdmissionController(Default.ADMISSION_CAPACITY, Default.ADMISSION_MAX_QUEUE,
+                                Default.ADMISSION_TIMEOUT, Default.ADMISSION_RETRY_AFTER)
+
+
+def admitted(f):
+    """decorate a request handler to only process the request once admitted by `admission`
+
+    The request is admitted by its Content-Length before its body is read, so that a busy worker rejects it without
+    reading it. The posted form is then read, streaming files to temporary files, and the weight held is lowered to
+    that of the type and size of the posted files. The handler is called with the form as last argument, its files
+    are closed and removed once the handler is done.
+    """
+    @wraps(f)
+    async def wrapper(request, *args):
+        async with admission.admit(content_weight(request)) as admission_:
+            form = await read_form(request)
+            try:
+                admission_.reduce(request_weight(form))
+                return await f(request, *args, form)
+            finally:
+                close_form(form)
+
+    return wrapper
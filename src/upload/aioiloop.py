@@ -0,0 +1,332 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""asyncio client for the iloop Potion api, an alternative to potion_client for use from aiohttp handlers
+
+Resources and their routes are discovered from the api's json schema like potion_client does, so that e.g.
+``await iloop.Medium.one(where={'name': 'LB'})`` and ``await medium.update_contents(ingredients)`` mirror the
+synchronous client. Clients for different tokens share one aiohttp session and thereby its connection pool.
+"""
+
+import json
+import logging
+import re
+from datetime import date, datetime, timezone
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from upload.settings import Default
+
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'iloop_session'
+
+
+class IloopError(Exception):
+    """iloop answered with an error status
+
+    :param status: the http status
+    :param message: the error message
+    """
+
+    def __init__(self, status, message):
+        super(IloopError, self).__init__('iloop responded {}: {}'.format(status, message))
+        self.status = status
+
+
+def _item_not_found(message):
+    from potion_client.exceptions import ItemNotFound
+    return ItemNotFound(message)
+
+
+def _snake_case(name):
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).replace('-', '_').lower()
+
+
+def _camel_case(name):
+    return ''.join(part.capitalize() for part in re.split(r'[_-]', name))
+
+
+async def open_session(app):
+    connector = aiohttp.TCPConnector(limit=Default.ILOOP_CONNECTIONS, ssl=False)
+    app[SESSION_KEY] = aiohttp.ClientSession(connector=connector)
+
+
+async def close_session(app):
+    await app[SESSION_KEY].close()
+
+
+def setup_session(app):
+    """give an application an aiohttp session for iloop requests, opened when it starts and closed with it
+
+    :param app: the aiohttp application, before it is started
+    """
+    app.on_startup.append(open_session)
+    app.on_cleanup.append(close_session)
+
+
+def get_session(app):
+    """the aiohttp session for iloop requests of an application, see `setup_session`"""
+    return app[SESSION_KEY]
+
+
+class Reference(object):
+    """reference to an item by uri, as found in the properties of other items"""
+
+    def __init__(self, client, uri):
+        self.client = client
+        self.uri = uri
+
+    @property
+    def id(self):
+        return _uri_id(self.uri)
+
+    async def fetch(self):
+        """the referenced item"""
+        return await self.client.get(self.uri)
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and self.uri == other.uri
+
+    def __hash__(self):
+        return hash(self.uri)
+
+    def __repr__(self):
+        return '<Reference {}>'.format(self.uri)
+
+
+def _uri_id(uri):
+    identifier = uri.rstrip('/').rsplit('/', 1)[-1]
+    return int(identifier) if identifier.isdigit() else identifier
+
+
+class Item(Reference):
+    """an item of a resource with its properties, and the resource's instance routes as coroutine methods"""
+
+    def __init__(self, resource, uri, properties):
+        super(Item, self).__init__(resource.client, uri)
+        self.resource = resource
+        self.properties = properties
+
+    def __getattr__(self, name):
+        if name in ('properties', 'resource'):
+            raise AttributeError(name)
+        if name in self.properties:
+            return self.properties[name]
+        link = self.resource.links.get(name)
+        if link is None or '{id}' not in link[1]:
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.client.call_link(link, self.id, *args, **kwargs)
+        return call
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.resource.class_name, self.uri)
+
+
+class Resource(object):
+    """a resource of the api, e.g. Strain, with the resource level routes as coroutine methods"""
+
+    def __init__(self, client, name, links):
+        self.client = client
+        self.name = name
+        self.class_name = _camel_case(name)
+        self.links = links
+
+    def __getattr__(self, name):
+        link = self.links.get(name)
+        if link is None or '{id}' in link[1]:
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.client.call_link(link, None, *args, **kwargs)
+        return call
+
+    async def instances(self, where=None, sort=None, per_page=100):
+        """iterate over all items, optionally filtered by `where`, fetching a page at a time"""
+        page = 1
+        while True:
+            params = {'page': page, 'per_page': per_page}
+            if where:
+                params['where'] = json.dumps(self.client.encode(where))
+            if sort:
+                params['sort'] = json.dumps(sort)
+            items, total = await self.client.request('GET', '/{}'.format(self.name), params=params)
+            for item in items:
+                yield item
+            if not items or len(items) < per_page or (total is not None and page * per_page >= total):
+                break
+            page += 1
+
+    async def first(self, where=None, sort=None):
+        """the first matching item
+
+        :raise ItemNotFound: if there is no such item
+        """
+        async for item in self.instances(where=where, sort=sort, per_page=1):
+            return item
+        raise _item_not_found('no {} matching {}'.format(self.name, where))
+
+    async def one(self, where=None):
+        """the matching item
+
+        :raise ItemNotFound: if there is no such item
+        """
+        return await self.first(where=where)
+
+    async def get(self, identifier):
+        return await self.client.get('/{}/{}'.format(self.name, identifier))
+
+    async def create(self, **properties):
+        """create an item
+
+        :return Item: the created item
+        """
+        item, _ = await self.client.request('POST', '/{}'.format(self.name), body=properties)
+        return item
+
+
+class AsyncIloop(object):
+    """asyncio iloop client
+
+    Resources are attributes named like in potion_client, e.g. ``iloop.ExperimentPhase``, after `load` has read the
+    api schema.
+
+    :param api: url of the iloop api
+    :param token: bearer token
+    :param session: aiohttp client session to send the requests with
+    """
+
+    # schemas per api url, shared by the clients of all tokens
+    _schemas = {}
+
+    def __init__(self, api, token, session):
+        self.api = api.rstrip('/')
+        self.path = urlsplit(self.api).path
+        self.token = token
+        self.session = session
+        self.resources = {}
+
+    async def load(self):
+        """read the schema of the api, once per api url
+
+        :return AsyncIloop: the client
+        """
+        schemas = self._schemas.get(self.api)
+        if schemas is None:
+            root, _ = await self.request('GET', '/schema', decode=False)
+            schemas = {}
+            for name in root.get('properties', {}):
+                schemas[name], _ = await self.request('GET', '/{}/schema'.format(name), decode=False)
+            self._schemas[self.api] = schemas
+        for name, schema in schemas.items():
+            links = {}
+            for link in schema.get('links', []):
+                href = link['href'][len(self.path):] if link['href'].startswith(self.path + '/') else link['href']
+                links[_snake_case(link['rel'])] = (link.get('method', 'GET'), href)
+            self.resources[_camel_case(name)] = Resource(self, name, links)
+        return self
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['resources'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def encode(self, value):
+        """convert items, references and dates to their json representation"""
+        if isinstance(value, Reference):
+            return {'$ref': value.uri}
+        if isinstance(value, datetime):
+            value = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+            return {'$date': int(value.timestamp() * 1000)}
+        if isinstance(value, date):
+            return {'$date': int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp() * 1000)}
+        if isinstance(value, dict):
+            return {key: self.encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        return value
+
+    def decode(self, value):
+        """convert the json representation of items, references and dates"""
+        if isinstance(value, dict):
+            if set(value) == {'$ref'}:
+                return Reference(self, value['$ref'])
+            if set(value) == {'$date'}:
+                return datetime.fromtimestamp(value['$date'] / 1000, timezone.utc)
+            properties = {key: self.decode(item) for key, item in value.items() if key != '$uri'}
+            if '$uri' in value:
+                name = value['$uri'].split('/')[-2]
+                resource = self.resources.get(_camel_case(name)) or Resource(self, name, {})
+                return Item(resource, value['$uri'], properties)
+            return properties
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        return value
+
+    async def request(self, method, path, params=None, body=None, decode=True):
+        """send a request to the api
+
+        :return tuple: the decoded response and the total count of a listing, None if not given
+        :raise ItemNotFound: for 404 responses
+        :raise IloopError: for other error responses
+        """
+        if path.startswith(self.path + '/'):
+            path = path[len(self.path):]
+        headers = {'Authorization': 'Bearer {}'.format(self.token), 'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            data = json.dumps(self.encode(body))
+        async with self.session.request(method, self.api + path, params=params, data=data,
+                                        headers=headers) as response:
+            text = await response.text()
+            if response.status == 404:
+                raise _item_not_found('{} {} not found'.format(method, path))
+            if response.status >= 400:
+                raise IloopError(response.status, text)
+            total = response.headers.get('X-Total-Count')
+        content = json.loads(text) if text else None
+        return (self.decode(content) if decode else content), (int(total) if total is not None else None)
+
+    async def get(self, uri):
+        item, _ = await self.request('GET', uri)
+        return item
+
+    async def call_link(self, link, identifier, *args, **kwargs):
+        """call a route of a resource or item, a single positional argument is sent as is, keywords as an object"""
+        method, href = link
+        path = href.replace('{id}', str(identifier)) if identifier is not None else href
+        body = args[0] if args else (kwargs or None)
+        if method == 'GET':
+            params = {key: json.dumps(self.encode(value)) for key, value in (kwargs or {}).items()}
+            result, _ = await self.request(method, path, params=params or None)
+        else:
+            result, _ = await self.request(method, path, body=body)
+        return result
+
+
+async def async_iloop_client(app, api, token):
+    """asyncio iloop client sharing the application's connection pool
+
+    :param app: the aiohttp application
+    :param api: url of the iloop api
+    :param token: bearer token
+    :return AsyncIloop: the client, with the api schema loaded
+    """
+    return await AsyncIloop(api, token, get_session(app)).load()
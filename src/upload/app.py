@@ -12,27 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# pandas, goodtables, potion_client and the uploaders are imported by the handlers that need them, so that the
+# service starts quickly and light requests such as version or schema do not load them
+
 import asyncio
 from aiohttp import web
 import aiohttp_cors
-import pandas as pd
 import csv
 import re
-from pandas.io.common import CParserError
-import io
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import codecs
+import os
 import json
 import logging
 from functools import wraps, partial
-from upload.upload import (MediaUploader, StrainsUploader, FermentationUploader, ScreenUploader,
-                           XrefMeasurementUploader, get_schema)
-from tempfile import mkstemp
-from potion_client.exceptions import ItemNotFound
-from upload import iloop_client, __version__
+from upload.admission import admission, admitted
+from upload.aioiloop import async_iloop_client, setup_session
+from upload.checkpoint import Checkpoint
+from upload.projects import project_lists
+from upload.schemas import etag_matches, schema_registry
+from upload.readers import WorkbookReader, columnar_format, read_columnar, workbook_format
+from upload.validation import ValidationError, error_report, inspect_table, merge_reports
+from os.path import abspath, exists, join
+from tempfile import TemporaryDirectory, mkstemp
+from upload import configure_logging, iloop_client, __version__
 from upload.settings import Default
-from upload.checks import (compound_name_unknown, medium_name_unknown, strain_alias_unknown,
-                           reaction_id_unknown, protein_id_unknown, synonym_to_chebi_name, check_safe_partial,
-                           medium_name_already_defined, iloop_cache)
 from upload.middleware import raven_middleware
 
 
@@ -40,16 +44,40 @@ logger = logging.getLogger(__name__)
 
 UPLOAD_TYPES = frozenset(['strains', 'media', 'fermentation', 'screen', 'fluxes', 'protein_abundances'])
 
+def iloop_credentials(request):
+    """the iloop api and token to use for a request
+
+    :return tuple: api url and token
+    """
+    api, token = Default.ILOOP_API, Default.ILOOP_TOKEN
+    if 'Authorization' in request.headers:
+        if 'Origin' in request.headers and 'cfb' in request.headers['Origin']:
+            api = Default.ILOOP_BIOSUSTAIN
+        token = request.headers['Authorization'].replace('Bearer ', '')
+    return api, token
+
+
+upload_executor = ThreadPoolExecutor(max_workers=Default.UPLOAD_WORKERS)
+
+
+async def in_executor(func, *args, **kwargs):
+    """run blocking work, e.g. validating or uploading files, in `upload_executor` so that the event loop keeps
+    serving other requests meanwhile"""
+    future = asyncio.get_event_loop().run_in_executor(upload_executor, partial(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # the work cannot be interrupted, the request keeps its admission and posted files until it is done
+        await asyncio.wait([future])
+        raise
+
+
 def call_iloop_with_token(f):
     @wraps(f)
-    async def wrapper(request):
-        api, token = Default.ILOOP_API, Default.ILOOP_TOKEN
-        if 'Authorization' in request.headers:
-            if 'Origin' in request.headers and 'cfb' in request.headers['Origin']:
-                api = Default.ILOOP_BIOSUSTAIN
-            token = request.headers['Authorization'].replace('Bearer ', '')
-        iloop = iloop_client(api, token)
-        response = await f(request, iloop)
+    async def wrapper(request, *args):
+        # the client reads the api schema when created
+        iloop = await in_executor(iloop_client, *iloop_credentials(request))
+        response = await f(request, iloop, *args)
         assert response.status == 200, 'call to iloop failed with {}'.format(response.status)
         return response
 
@@ -73,112 +101,436 @@ def guess_delimiter(string):
     return delimiter
 
 
-def write_temp_csv(content):
-    file_description, tmp_file_name = mkstemp(suffix='.csv')
-    if content.content_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or re.match(
-            '^.*.xlsx{0,1}$', content.filename, flags=re.IGNORECASE):
-        df = pd.read_excel(content.file)
-    else:
-        data_string = content.file.read().decode()
-        delimiter = guess_delimiter(data_string)
-        df = pd.read_csv(io.StringIO(data_string), delimiter=delimiter)
-    with open(tmp_file_name, 'w') as tmp_file:
-        df.to_csv(tmp_file, index=False)
-    return tmp_file_name
+def write_temp_csv(content, sheet=None, temp_dir=None):
+    """write a posted csv or excel file to a temporary csv file
 
+    csv files are read in chunks of `CSV_CHUNK_ROWS` rows, values are kept as text.
 
-@call_iloop_with_token
-async def list_projects(request, iloop):
-    projects = [{'display': project.name, 'value': project.id} for project in iloop.Project.instances()]
-    return web.json_response(data=projects)
+    :param content: the posted file
+    :param sheet: for workbooks, name of the sheet to read if the workbook has such a sheet, otherwise the first sheet
+    :param temp_dir: directory to write to, e.g. one removed after the request, the default temporary directory if
+    None
+    :return tuple: name of the temporary file and, for workbooks, the `RowNumbers` of its rows in the sheet, None
+    for csv files
+    :raise ValidationError: if a csv file cannot be parsed
+    """
+    excel_format = workbook_format(content.content_type, content.filename)
+    if excel_format:
+        with WorkbookReader(content.file, excel_format) as workbook:
+            return workbook.to_csv(workbook.find_sheet(sheet), dir=temp_dir)
+    import pandas as pd
+    from pandas.errors import ParserError
+    file_description, tmp_file_name = mkstemp(suffix='.csv', dir=temp_dir)
+    text = codecs.getreader('utf-8')(content.file)
+    try:
+        sample = text.read(SNIFF_SIZE)
+        delimiter = guess_delimiter(sample[:sample.rfind('\n') + 1] or sample)
+        text.seek(0)
+        with os.fdopen(file_description, 'w', newline='') as tmp_file:
+            chunks = pd.read_csv(text, delimiter=delimiter, dtype=str, chunksize=CSV_CHUNK_ROWS)
+            for number, chunk in enumerate(chunks):
+                chunk.to_csv(tmp_file, index=False, header=number == 0)
+    except ParserError as error:
+        raise ValidationError(error_report('failed to parse csv file {}: {}'.format(content.filename, error)))
+    finally:
+        content.file.seek(0)
+    return tmp_file_name, None
 
 
-@call_iloop_with_token
-async def upload(request, iloop):
-    data = await request.post()
+def read_table(content, sheet=None, temp_dir=None):
+    """the table of a posted file in the form the uploaders take
+
+    :param content: the posted file
+    :param sheet: for workbooks, name of the sheet to read, see `write_temp_csv`
+    :param temp_dir: directory to write temporary files to, see `write_temp_csv`
+    :return tuple: a data frame for parquet and arrow/feather files, for other files the name of a temporary csv
+    file, and the row numbers to report for its rows, see `write_temp_csv`
+    """
+    columnar = columnar_format(content.content_type, content.filename)
+    if columnar:
+        try:
+            return read_columnar(content.file, columnar), None
+        except (ValueError, OSError) as error:
+            raise ValidationError(error_report('failed to read {} file {}: {}'.format(columnar, content.filename,
+                                                                                     error)))
+        finally:
+            content.file.seek(0)
+    return write_temp_csv(content, sheet=sheet, temp_dir=temp_dir)
+
+
+def write_temp_csvs(content, sheets, temp_dir=None):
+    """write named sheets of a posted workbook to temporary csv files
+
+    Sheets for other upload types are not read with these sheets, they are reported instead of being ignored.
+
+    :param content: the posted file
+    :param sheets: names of the sheets to read
+    :param temp_dir: directory to write to, see `write_temp_csv`
+    :return list: name and `RowNumbers` of the temporary files in the same order as `sheets`
+    :raise ValidationError: if the workbook has sheets for other upload types
+    """
+    excel_format = workbook_format(content.content_type, content.filename)
+    if not excel_format:
+        raise web.HTTPBadRequest(text='{{"status": "expected a workbook with sheets {}"}}'.format(', '.join(sheets)))
+    with WorkbookReader(content.file, excel_format) as workbook:
+        missing = [sheet for sheet in sheets if not workbook.find_sheet(sheet)]
+        if missing:
+            raise web.HTTPBadRequest(text='{{"status": "missing sheets {}"}}'.format(', '.join(missing)))
+        unsupported = [name for name in workbook.sheet_names if name.strip().lower() in UPLOAD_TYPES]
+        if unsupported:
+            raise ValidationError(error_report(
+                'sheet(s) {} of {} are not uploaded together with sheets {}, post them as separate uploads'.format(
+                    ', '.join(unsupported), content.filename, ', '.join(sheets))))
+        return [workbook.to_csv(workbook.find_sheet(sheet), dir=temp_dir) for sheet in sheets]
+
+
+REPORT_CHUNK_SIZE = 64 * 1024
+SNIFF_SIZE = 64 * 1024
+CSV_CHUNK_ROWS = 50000
+
+
+async def report_response(request, report):
+    """stream a validation report as compact json, compressed if the client accepts it
+
+    :param request: the request to respond to
+    :param report: the report to send
+    :return StreamResponse: the prepared and finished response
+    """
+    response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+    response.enable_compression()
+    await response.prepare(request)
+    buffer = []
+    buffered = 0
+    for fragment in json.JSONEncoder(separators=(',', ':')).iterencode(report):
+        buffer.append(fragment)
+        buffered += len(fragment)
+        if buffered >= REPORT_CHUNK_SIZE:
+            await response.write(''.join(buffer).encode())
+            buffer, buffered = [], 0
+    await response.write(''.join(buffer).encode())
+    await response.write_eof()
+    return response
+
+
+async def list_projects(request):
+    """projects visible with the request's token, cached per api and token for `Default.PROJECTS_CACHE_TTL` seconds"""
+    api, token = iloop_credentials(request)
+    listing = project_lists.get(api, token)
+    if listing is None:
+        iloop = await async_iloop_client(request.app, api, token)
+        listing = project_lists.put(api, token, [{'display': project.name, 'value': project.id}
+                                                 async for project in iloop.Project.instances()])
+    headers = {'ETag': listing.etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Authorization, Origin'}
+    if etag_matches(request.headers.get('If-None-Match'), listing.etag):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=listing.body, headers=headers, content_type='application/json')
+
+
+UPLOAD_STAGES = (frozenset(['strains', 'media']),
+                 frozenset(['fermentation', 'screen', 'fluxes', 'protein_abundances']))
+BATCH_WHAT = re.compile(r'^what\[(\d+)\]$')
+UPLOAD_MODES = ('replace', 'incremental')
+
+
+def get_project(iloop, data):
+    import requests
     try:
-        project = iloop.Project(data['project_id'])
+        return iloop.Project(data['project_id'])
     except requests.exceptions.HTTPError:
-        raise web.HTTPBadRequest(text='{"status": "failed to resolve project identifier {}"}'.format(data['project_id']))
-    if data['what'] not in UPLOAD_TYPES:
-        raise web.HTTPBadRequest(text='{"status": "expected {} component of post"}'.format(', '.join(UPLOAD_TYPES)))
-    uploader = None
-    iloop_cache.update(iloop, lite=True)
-    try:
-        if data['what'] == 'media':
-            content = data['file[0]']
-            uploader = MediaUploader(project, write_temp_csv(content),
-                                     custom_checks=[check_safe_partial(compound_name_unknown, None),
-                                                    check_safe_partial(medium_name_already_defined, None)],
-                                     synonym_mapper=partial(synonym_to_chebi_name, None))
-        if data['what'] == 'strains':
-            content = data['file[0]']
-            uploader = StrainsUploader(project, write_temp_csv(content))
-        if data['what'] == 'screen':
-            content = data['file[0]']
-            uploader = ScreenUploader(project, write_temp_csv(content),
-                                      custom_checks=[check_safe_partial(compound_name_unknown, None),
-                                                     check_safe_partial(medium_name_unknown, None),
-                                                     check_safe_partial(strain_alias_unknown, project)],
-                                      synonym_mapper=partial(synonym_to_chebi_name, None))
-        if data['what'] == 'fermentation':
-            content_samples = data['file[0]']
-            content_physiology = data['file[1]']
-            uploader = FermentationUploader(project, write_temp_csv(content_samples),
-                                            write_temp_csv(content_physiology),
-                                            custom_checks=[check_safe_partial(compound_name_unknown, None),
-                                                           check_safe_partial(medium_name_unknown, None),
-                                                           check_safe_partial(strain_alias_unknown, project)],
-                                            synonym_mapper=partial(synonym_to_chebi_name, None))
-        if data['what'] == 'fluxes':
-            content = data['file[0]']
-            uploader = XrefMeasurementUploader(project, write_temp_csv(content),
-                                               custom_checks=[check_safe_partial(medium_name_unknown, None),
-                                                              check_safe_partial(reaction_id_unknown, None),
-                                                              check_safe_partial(strain_alias_unknown, project)],
-                                               subject_type='reaction')
-        if data['what'] == 'protein_abundances':
-            content = data['file[0]']
-            uploader = XrefMeasurementUploader(project, write_temp_csv(content),
-                                               custom_checks=[check_safe_partial(medium_name_unknown, None),
-                                                              check_safe_partial(protein_id_unknown, None),
-                                                              check_safe_partial(strain_alias_unknown, project)],
-                                               subject_type='protein')
-    except CParserError:
-        return web.json_response(
-            data={'valid': False, 'tables': [{'errors': [{'message': 'failed to parse csv file '}]}]})
-    except ValueError as error:
-        return web.json_response(data=json.loads(str(error)))
+        raise web.HTTPBadRequest(
+            text='{{"status": "failed to resolve project identifier {}"}}'.format(data['project_id']))
+
+
+async def resolve_project(request, iloop, data):
+    """the posted project, used to check that the cached project listing of the request's token includes it"""
+    project = await in_executor(get_project, iloop, data)
+    project_lists.saw_project(*iloop_credentials(request), project.id)
+    return project
+
+
+def check_what(what):
+    if what not in UPLOAD_TYPES:
+        raise web.HTTPBadRequest(text='{{"status": "expected {} component of post"}}'.format(', '.join(UPLOAD_TYPES)))
+
+
+def upload_mode(data):
+    """the posted 'mode', 'replace' (the default) to archive and recreate experiments that differ, 'incremental' to
+    only send the differences"""
+    mode = data.get('mode') or 'replace'
+    if mode not in UPLOAD_MODES:
+        raise web.HTTPBadRequest(text='{{"status": "expected mode {}"}}'.format(' or '.join(UPLOAD_MODES)))
+    return mode
+
+
+def make_uploader(what, project, files, mode='replace', temp_dir=None):
+    """read and validate the files of an upload
+
+    :param what: the type of upload, one of UPLOAD_TYPES
+    :param project: project object
+    :param files: the posted files, 'file[0]' and for fermentation, fluxes and protein abundance uploads optionally
+    'file[1]', the physiology or the value matrix with 'file[0]' the table of samples
+    :param mode: the upload mode, see `upload_mode`, only used for fermentation and screen uploads
+    :param temp_dir: directory for the temporary files the uploader reads, it must be kept until the upload is done
+    :return AbstractDataUploader: the uploader, ready to upload
+    :raise ValidationError: if the files are not valid
+    """
+    from upload.upload import (MediaUploader, StrainsUploader, FermentationUploader, ScreenUploader,
+                               XrefMeasurementUploader, XrefMatrixUploader)
+    from upload.checks import (compound_name_unknown, medium_name_unknown, strain_alias_unknown,
+                               reaction_id_unknown, protein_id_unknown, synonym_to_chebi_name, check_safe_partial)
+    if what == 'media':
+        table, row_numbers = read_table(files['file[0]'], sheet='media', temp_dir=temp_dir)
+        return MediaUploader(project, table, custom_checks=[check_safe_partial(compound_name_unknown, None)],
+                             synonym_mapper=partial(synonym_to_chebi_name, None), row_numbers=row_numbers,
+                             temp_dir=temp_dir)
+    if what == 'strains':
+        table, row_numbers = read_table(files['file[0]'], sheet='strains', temp_dir=temp_dir)
+        return StrainsUploader(project, table, row_numbers=row_numbers, temp_dir=temp_dir)
+    if what == 'screen':
+        table, row_numbers = read_table(files['file[0]'], sheet='screen', temp_dir=temp_dir)
+        return ScreenUploader(project, table,
+                              custom_checks=[check_safe_partial(compound_name_unknown, None),
+                                             check_safe_partial(medium_name_unknown, None),
+                                             check_safe_partial(strain_alias_unknown, project)],
+                              synonym_mapper=partial(synonym_to_chebi_name, None),
+                              incremental=mode == 'incremental', row_numbers=row_numbers, temp_dir=temp_dir)
+    if what == 'fermentation':
+        if files.get('file[1]') is not None:
+            samples, physiology = (read_table(files['file[0]'], sheet='samples', temp_dir=temp_dir),
+                                   read_table(files['file[1]'], sheet='physiology', temp_dir=temp_dir))
+        else:
+            samples, physiology = write_temp_csvs(files['file[0]'], ['samples', 'physiology'], temp_dir=temp_dir)
+        return FermentationUploader(project, samples[0], physiology[0],
+                                    custom_checks=[check_safe_partial(compound_name_unknown, None),
+                                                   check_safe_partial(medium_name_unknown, None),
+                                                   check_safe_partial(strain_alias_unknown, project)],
+                                    synonym_mapper=partial(synonym_to_chebi_name, None),
+                                    incremental=mode == 'incremental', samples_row_numbers=samples[1],
+                                    physiology_row_numbers=physiology[1], temp_dir=temp_dir)
+    if what in ('fluxes', 'protein_abundances'):
+        subject_id_unknown = reaction_id_unknown if what == 'fluxes' else protein_id_unknown
+        custom_checks = [check_safe_partial(medium_name_unknown, None),
+                         check_safe_partial(subject_id_unknown, None),
+                         check_safe_partial(strain_alias_unknown, project)]
+        subject_type = 'reaction' if what == 'fluxes' else 'protein'
+        if files.get('file[1]') is not None:
+            samples = read_table(files['file[0]'], sheet='samples', temp_dir=temp_dir)
+            matrix = read_table(files['file[1]'], sheet=what, temp_dir=temp_dir)
+            return XrefMatrixUploader(project, samples[0], matrix[0], custom_checks=custom_checks,
+                                      subject_type=subject_type, samples_row_numbers=samples[1],
+                                      matrix_row_numbers=matrix[1], temp_dir=temp_dir)
+        table, row_numbers = read_table(files['file[0]'], sheet=what, temp_dir=temp_dir)
+        return XrefMeasurementUploader(project, table, custom_checks=custom_checks, subject_type=subject_type,
+                                       row_numbers=row_numbers, temp_dir=temp_dir)
+
+
+def success_data(uploader):
+    data = {'valid': True}
+    if uploader.results:
+        data['results'] = dict(uploader.results)
+    return data
+
+
+def run_upload(uploader, iloop, checkpoint):
+    """upload to iloop, resuming from the checkpoint of earlier failed attempts of the same upload
+
+    :return dict: None if the upload finished, otherwise a report of the error that stopped it
+    """
+    from potion_client.exceptions import ItemNotFound
+    from requests.exceptions import HTTPError
+    from upload.upload import UploadError
+    uploader.checkpoint = checkpoint
     try:
         uploader.upload(iloop=iloop)
-    except (ItemNotFound, requests.exceptions.HTTPError) as error:
-        return web.json_response(
-            data={'valid': False, 'tables': [{'errors': [{'message': str(error)}]}]})
-    else:
-        return web.json_response(data={'valid': True})
+    except ValidationError as error:
+        return error.report
+    except (ItemNotFound, HTTPError, UploadError) as error:
+        report = error.report if isinstance(error, UploadError) else error_report(str(error))
+        report['resumable'] = True
+        report['completed-units'] = len(checkpoint)
+        return report
+    checkpoint.clear()
+    return None
+
+
+def plan_data(uploader, iloop):
+    """what the upload would do, see `AbstractDataUploader.plan`, nothing is written to iloop
+
+    :return tuple: the report of what failed, or None and the data to respond with
+    """
+    try:
+        plan = uploader.plan(iloop)
+    except ValidationError as error:
+        return error.report, None
+    return None, {'valid': True, 'plan': plan.as_dict()}
+
+
+def process_upload(iloop, project, data, mode):
+    """validate and upload, or plan, the file(s) of an upload request, blocking
+
+    Temporary csv files written for the request are removed when it is done.
+
+    :return tuple: the report of what failed, or None and the data to respond with
+    """
+    from upload.checks import iloop_cache
+    iloop_cache.update(iloop, lite=True, project=project)
+    with TemporaryDirectory(prefix='upload-') as temp_dir:
+        try:
+            uploader = make_uploader(data['what'], project, data, mode=mode, temp_dir=temp_dir)
+        except ValidationError as error:
+            return error.report, None
+        if data.get('plan', '').lower() in ('1', 'true', 'yes'):
+            return plan_data(uploader, iloop)
+        checkpoint = Checkpoint.for_upload(project, data['what'], [data['file[0]'], data.get('file[1]')])
+        report = run_upload(uploader, iloop, checkpoint)
+    if report is not None:
+        return report, None
+    return None, success_data(uploader)
+
+
+@admitted
+@call_iloop_with_token
+async def upload(request, iloop, data):
+    """upload a file, or with 'plan' posted as true only report what the upload would create, reuse, update or
+    archive
+
+    Validating and uploading run in `upload_executor` while the request holds its admission.
+    """
+    check_what(data.get('what'))
+    mode = upload_mode(data)
+    project = await resolve_project(request, iloop, data)
+    report, response_data = await in_executor(process_upload, iloop, project, data, mode)
+    if report is not None:
+        return await report_response(request, report)
+    return web.json_response(data=response_data)
+
+
+def batch_items(data):
+    """the uploads of a batch post
+
+    Each upload n is posted as 'what[n]' with its files as 'file[n][0]' and, for fermentation, 'file[n][1]'.
+
+    :param data: the posted form
+    :return list: tuples of what and the files in the form expected by `make_uploader`, in order of n
+    """
+    items = []
+    for key in data:
+        match = BATCH_WHAT.match(key)
+        if match:
+            number = match.group(1)
+            check_what(data[key])
+            files = {'file[0]': data.get('file[{}][0]'.format(number)),
+                     'file[1]': data.get('file[{}][1]'.format(number))}
+            if files['file[0]'] is None:
+                raise web.HTTPBadRequest(text='{{"status": "missing file[{}][0]"}}'.format(number))
+            items.append((int(number), data[key], files))
+    if not items:
+        raise web.HTTPBadRequest(text='{"status": "expected what[n] and file[n][0] components of post"}')
+    return [(what, files) for _, what, files in sorted(items, key=lambda item: item[0])]
+
+
+def _validate(what, project, files, mode, temp_dir=None):
+    try:
+        return make_uploader(what, project, files, mode=mode, temp_dir=temp_dir), None
+    except ValidationError as error:
+        report = error.report
+    for table in report['tables']:
+        table['what'] = what
+        table['file'] = files['file[0]'].filename
+    return None, report
+
+
+@admitted
+@call_iloop_with_token
+async def upload_batch(request, iloop, data):
+    """upload several files in one request
+
+    Files are processed in stages so that strains and media are uploaded before the experiments that refer to them.
+    The files of a stage are validated in parallel, and strains and media created by a stage are added to the
+    identifier cache so that the next stage is checked against them without refreshing the cache. Posting the same
+    batch again after a failure skips what was already uploaded. Validating and uploading run in `upload_executor`
+    while the request holds its admission.
+    """
+    items = batch_items(data)
+    mode = upload_mode(data)
+    project = await resolve_project(request, iloop, data)
+    report = await in_executor(process_batch, iloop, project, items, mode)
+    if report is not None:
+        return await report_response(request, report)
+    return web.json_response(data={'valid': True})
+
+
+def process_batch(iloop, project, items, mode):
+    """validate and upload the files of a batch request, blocking, see `run_batch`
+
+    Temporary csv files written for the batch are removed when it is done.
+    """
+    from upload.checks import iloop_cache
+    iloop_cache.update(iloop, lite=True, project=project)
+    with TemporaryDirectory(prefix='upload-') as temp_dir:
+        return run_batch(items, project, iloop, mode, temp_dir=temp_dir)
+
+
+def run_batch(items, project, iloop, mode, temp_dir=None):
+    """validate and upload the files of a batch stage by stage, see `upload_batch`
+
+    :param items: tuples of what and files, see `batch_items`
+    :param temp_dir: directory for temporary files, see `make_uploader`
+    :return dict: None if all files were uploaded, otherwise the report of the stage or upload that failed
+    """
+    for stage in UPLOAD_STAGES:
+        stage_items = [(what, files) for what, files in items if what in stage]
+        if not stage_items:
+            continue
+        checkpoints = [Checkpoint.for_upload(project, what, [files['file[0]'], files['file[1]']])
+                       for what, files in stage_items]
+        with ThreadPoolExecutor(max_workers=len(stage_items)) as executor:
+            results = list(executor.map(lambda item: _validate(item[0], project, item[1], mode, temp_dir),
+                                        stage_items))
+        reports = [report for _, report in results if report is not None]
+        if reports:
+            return merge_reports(reports)
+        for (uploader, _), checkpoint in zip(results, checkpoints):
+            report = run_upload(uploader, iloop, checkpoint)
+            if report is not None:
+                return report
+    return None
 
 
 async def version(request):
     return web.Response(text='v' + __version__)
 
 
+async def metrics(request):
+    """admission control state of this worker, e.g. for autoscaling on the queue depth"""
+    return web.json_response(data=admission.metrics())
+
+
 async def schema(request):
     what = request.match_info.get('what', None)
-    if not what:
-        raise ValueError('bad schema request')
-    with open(get_schema(what)) as schema_file:
-        schema_object = json.load(schema_file)
-    return web.json_response(data=schema_object)
+    if what not in schema_registry:
+        raise web.HTTPNotFound(text='{"status": "unknown schema"}')
+    body, etag, encoding = schema_registry[what].representation(request.headers.get('Accept-Encoding'))
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, headers=headers, content_type='application/json')
 
 
 ROUTE_CONFIG = [
     ('POST', '/upload', upload),
+    ('POST', '/upload/batch', upload_batch),
     ('GET', '/upload/version', version),
+    ('GET', '/upload/metrics', metrics),
     ('GET', '/upload/list_projects', list_projects),
     ('GET', '/upload/schema/{what}', schema),
 ]
 def get_app():
+    configure_logging()
     app = web.Application(middlewares=[raven_middleware])
+    setup_session(app)
     # Configure default CORS settings.
     cors = aiohttp_cors.setup(app, defaults={
         "*": aiohttp_cors.ResourceOptions(
@@ -199,6 +551,20 @@ def get_app():
     return app
 
 
+def warmup():
+    """import the lazily loaded modules, load the identifier cache and exercise the validation, e.g. before forking
+    workers"""
+    import openpyxl  # noqa: F401
+    import xlrd  # noqa: F401
+    import upload.upload  # noqa: F401
+    from upload.checks import iloop_cache
+    iloop_cache.identifiers
+    example = join(abspath(join('data', 'examples')), 'media.csv')
+    if exists(example):
+        inspect_table(example, schema_registry['media'].descriptor())
+    logger.info('warmed up')
+
+
 async def start(loop):
     app = get_app()
     await loop.create_server(app.make_handler(), '0.0.0.0', 8001)
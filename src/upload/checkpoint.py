@@ -0,0 +1,121 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from os.path import exists, join
+
+from upload.settings import Default
+
+
+logger = logging.getLogger(__name__)
+
+
+def _key(unit):
+    return json.dumps([str(part) for part in unit])
+
+
+class Checkpoint(object):
+    """record of the completed units of an upload, e.g. created strains or experiments with added samples
+
+    Units are tuples such as ('strain', alias). Completed units are appended to a file as json lines, so that a failed
+    upload that is submitted again can skip the units that were already done.
+
+    :param path: file to keep the checkpoint in, None to only keep it in memory
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.completed = {}
+        self._lock = threading.Lock()
+        if path and exists(path):
+            self._load()
+            logger.info('resuming upload with {} completed units from {}'.format(len(self.completed), path))
+
+    def _load(self):
+        with open(self.path, 'rb+') as checkpoint_file:
+            end = 0
+            for line in checkpoint_file:
+                try:
+                    key, value = json.loads(line.decode())
+                except ValueError:
+                    # incomplete last line of an interrupted write, cut so that later marks are not appended to it
+                    logger.warning('dropping incomplete checkpoint record in {}'.format(self.path))
+                    checkpoint_file.truncate(end)
+                    break
+                self.completed[key] = value
+                end += len(line)
+                if not line.endswith(b'\n'):
+                    # complete record of a write interrupted before its line break
+                    checkpoint_file.seek(0, os.SEEK_END)
+                    checkpoint_file.write(b'\n')
+
+    def __len__(self):
+        return len(self.completed)
+
+    def done(self, *unit):
+        """whether a unit has been completed"""
+        return _key(unit) in self.completed
+
+    def get(self, *unit):
+        """the value recorded when a unit was completed, None if not completed"""
+        return self.completed.get(_key(unit))
+
+    def mark(self, *unit, value=True):
+        """record a unit as completed
+
+        :param unit: parts of the unit, e.g. 'strain', alias
+        :param value: json serializable value to record with the unit
+        """
+        key = _key(unit)
+        with self._lock:
+            self.completed[key] = value
+            if self.path:
+                with open(self.path, 'a') as checkpoint_file:
+                    checkpoint_file.write(json.dumps([key, value]) + '\n')
+
+    def clear(self):
+        """forget all completed units, e.g. after the upload finished"""
+        with self._lock:
+            self.completed = {}
+            if self.path and exists(self.path):
+                os.remove(self.path)
+
+    @classmethod
+    def for_upload(cls, project, what, files):
+        """the checkpoint of an upload, identified by project, type of upload and the contents of the posted files
+
+        Checkpoints older than `Default.CHECKPOINT_MAX_AGE` seconds are discarded.
+
+        :param project: project object
+        :param what: type of upload
+        :param files: the posted files
+        :return Checkpoint: the checkpoint, with the units completed by earlier attempts of the same upload
+        """
+        digest = hashlib.sha256('{}:{}'.format(project.id, what).encode())
+        for content in files:
+            if content is None:
+                continue
+            for block in iter(lambda: content.file.read(1 << 16), b''):
+                digest.update(block)
+            content.file.seek(0)
+        os.makedirs(Default.CHECKPOINT_DIR, exist_ok=True)
+        path = join(Default.CHECKPOINT_DIR, digest.hexdigest())
+        if exists(path) and time.time() - os.path.getmtime(path) > Default.CHECKPOINT_MAX_AGE:
+            os.remove(path)
+        return cls(path)
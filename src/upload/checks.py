@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 from functools import lru_cache, partial
-from goodtables import check
-from potion_client.exceptions import ItemNotFound
-import gnomic
+import hashlib
+import json
+import threading
+import time
 import os
 import pickle
 import logging
@@ -23,39 +25,191 @@ import logging
 from upload.constants import skip_list, synonym_to_chebi_name_dict, compound_skip
 from upload import iloop_client
 from upload.settings import Default
+from upload.validation import check
 
 
 logger = logging.getLogger(__name__)
 
+def recipe_fingerprint(ingredients, ph):
+    """canonical hash of a medium recipe, independent of the order of the ingredients
+
+    :param ingredients: iterable of dicts with 'compound', the chebi name or a compound object, and 'concentration'
+    :param ph: the pH of the medium
+    :return str: hex digest identifying the recipe
+    """
+    recipe = []
+    for ingredient in ingredients:
+        compound = ingredient['compound']
+        name = compound if isinstance(compound, str) else getattr(compound, 'chebi_name', None) or compound.name
+        recipe.append((name.strip().lower(), round(float(ingredient['concentration']), 9)))
+    canonical = json.dumps([sorted(recipe), round(float(ph), 9)], separators=(',', ':'))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def _load_compounds():
+    with open('data/chebi.pickle', 'rb') as compounds_pickle:
+        return pickle.load(compounds_pickle)
+
+
 class IloopCache:
+    """identifiers of the objects in iloop, for checking uploaded tables without querying iloop for every row
 
-    def __init__(self):
-        with open('data/chebi.pickle', 'rb') as compounds_pickle:
-            compounds = pickle.load(compounds_pickle)
+    Nothing is loaded when the cache is created. Identifiers shared by all projects are loaded from iloop when first
+    needed, strain aliases and experiment identifiers per project when first needed for that project so that only
+    the projects in use are kept and refreshed.
+
+    :param max_projects: maximum number of projects whose identifiers are kept, the least recently used are dropped
+    :param ttl: seconds identifiers that tend to change are kept before `update` refreshes them in lite mode
+    """
+
+    def __init__(self, max_projects=64, ttl=Default.ILOOP_CACHE_TTL):
         self.cache_fun = {'protein': lambda iloop: frozenset(iloop.Xref.subset(type='protein')),
                           'reaction': lambda iloop: frozenset(iloop.Xref.subset(type='reaction')),
                           # would do this but extremely slow https://github.com/biosustain/iloop/issues/107
                           # 'compound': lambda: frozenset(x.chebi_name for x in
                           #                               self.iloop.ChemicalEntity.instances(per_page=100)),
-                          'compound': lambda iloop: compounds,
-                          'medium': lambda iloop: frozenset(x.name for x in iloop.Medium.instances()),
-                          'experiment': lambda iloop: frozenset((x.identifier, x.project.id) for x in
-                                                                iloop.Experiment.instances()),
-                          'strain': lambda iloop: frozenset((x.alias, x.project.id) for x in iloop.Strain.instances())}
-        self.identifiers = {}
-        self.update(iloop_client(Default.ILOOP_API, Default.ILOOP_TOKEN), lite=False)
-
-    def update(self, iloop, lite=False):
+                          'compound': lambda iloop: _load_compounds(),
+                          'medium': lambda iloop: frozenset(x.name for x in iloop.Medium.instances())}
+        # identifiers of a project, filtered by iloop rather than by fetching the project of every object
+        self.project_cache_fun = {
+            'experiment': lambda iloop, project: frozenset(
+                x.identifier for x in iloop.Experiment.instances(where={'project': project})),
+            'strain': lambda iloop, project: frozenset(
+                x.alias for x in iloop.Strain.instances(where={'project': project}))}
+        self.max_projects = max_projects
+        self.ttl = ttl
+        self._identifiers = None
+        # time.monotonic() of the last refresh of the identifiers shared by all projects, and of those of each project
+        self._refreshed = None
+        self._project_refreshed = {}
+        self._load_lock = threading.Lock()
+        # project id to identifiers by type of object, least recently used first
+        self._projects = OrderedDict()
+        self._projects_lock = threading.RLock()
+        # (name, recipe fingerprint) to medium identifier, filled on demand as media contents are only available one
+        # medium at a time, with the names whose media have been read from iloop
+        self.recipes = {}
+        self._recipe_names = set()
+        self._recipes_lock = threading.Lock()
+
+    @property
+    def identifiers(self):
+        """identifiers by type of object, loaded with the default iloop client on first access"""
+        if self._identifiers is None:
+            with self._load_lock:
+                if self._identifiers is None:
+                    self.update(iloop_client(Default.ILOOP_API, Default.ILOOP_TOKEN), lite=False)
+        return self._identifiers
+
+    def project_identifiers(self, obj, project, iloop=None):
+        """identifiers of the objects of a project, loaded on first use for that project
+
+        :param obj: the type of object, 'strain' or 'experiment'
+        :param project: the project
+        :param iloop: iloop client to load with, the default client if None
+        :return frozenset: the identifiers
+        """
+        with self._projects_lock:
+            if project.id not in self._projects:
+                self.update_project(iloop or iloop_client(Default.ILOOP_API, Default.ILOOP_TOKEN), project)
+            self._projects.move_to_end(project.id)
+            return self._projects[project.id][obj]
+
+    def update(self, iloop, lite=False, project=None):
         """Update the cached identifiers
 
         :param iloop: iloop client
-        :param lite: bool, update all identifiers or only those that tend to change (medium, experiment and strains)
+        :param lite: bool, update all identifiers or only those that tend to change (medium, and strains and
+        experiments of `project`) and were refreshed more than `ttl` seconds ago, all are updated if nothing has been
+        loaded yet. Objects created by this process meanwhile are added with `add`.
+        :param project: the project to update the strains and experiments of, if any
+        """
+        now = time.monotonic()
+        lite = lite and self._identifiers is not None
+        if not (lite and self._fresh(self._refreshed, now)):
+            identifiers = dict(self._identifiers or {})
+            objects = ['medium'] if lite else list(self.cache_fun.keys())
+            for obj in objects:
+                identifiers[obj] = self.cache_fun[obj](iloop)
+                logger.info('{} {} identifiers cached'.format(len(identifiers[obj]), obj))
+            self._identifiers = identifiers
+            self._refreshed = now
+        if project is not None:
+            with self._projects_lock:
+                fresh = project.id in self._projects and self._fresh(self._project_refreshed.get(project.id), now)
+            if not (lite and fresh):
+                self.update_project(iloop, project)
+
+    def _fresh(self, refreshed, now):
+        return refreshed is not None and now - refreshed < self.ttl
+
+    def update_project(self, iloop, project):
+        """Update the cached strains and experiments of a project
+
+        :param iloop: iloop client
+        :param project: the project
+        """
+        refreshed = time.monotonic()
+        identifiers = {obj: fun(iloop, project) for obj, fun in self.project_cache_fun.items()}
+        logger.info('{} identifiers of project {} cached'.format(
+            ', '.join('{} {}'.format(len(identifiers[obj]), obj) for obj in sorted(identifiers)), project.id))
+        with self._projects_lock:
+            self._projects[project.id] = identifiers
+            self._project_refreshed[project.id] = refreshed
+            self._projects.move_to_end(project.id)
+            while len(self._projects) > self.max_projects:
+                dropped, _ = self._projects.popitem(last=False)
+                del self._project_refreshed[dropped]
+
+    def add(self, obj, identifiers, project=None):
+        """Add identifiers of newly created objects without refreshing from iloop
+
+        Identifiers not loaded yet are left alone, they include the new objects once loaded.
+
+        :param obj: the type of object, e.g. 'strain' or 'medium'
+        :param identifiers: iterable of identifiers in the form used by the cache for that type
+        :param project: the project of the objects, for strains and experiments
+        """
+        if obj in self.project_cache_fun:
+            with self._projects_lock:
+                # only projects already loaded are updated, others are loaded with the new objects when needed
+                if project.id in self._projects:
+                    known = self._projects[project.id]
+                    known[obj] = known[obj] | frozenset(identifiers)
+            return
+        if self._identifiers is not None:
+            self._identifiers[obj] = self._identifiers[obj] | frozenset(identifiers)
+
+    def add_recipe(self, identifier, name, fingerprint):
+        """Add the recipe of a newly created medium
+
+        :param identifier: the identifier of the medium
+        :param name: the name of the medium
+        :param fingerprint: the fingerprint of its recipe, see `recipe_fingerprint`
+        """
+        with self._recipes_lock:
+            self.recipes.setdefault((name, fingerprint), identifier)
+
+    def find_medium(self, iloop, name, fingerprint):
+        """Identifier of an existing medium with the given name and recipe
+
+        The recipes of the media with that name are read from iloop the first time the name is looked up and kept,
+        media created later are added by `add_recipe`.
+
+        :param iloop: iloop client
+        :param name: the name of the medium
+        :param fingerprint: the fingerprint of its recipe, see `recipe_fingerprint`
+        :return str: the identifier of the medium, None if there is no such medium
         """
-        objects = ['medium', 'experiment', 'strain'] if lite else list(self.cache_fun.keys())
-        for obj in objects:
-            self.identifiers[obj] = self.cache_fun[obj](iloop)
-            len_ids = len(self.identifiers[obj])
-            logger.info('{} {} identifiers cached'.format(len_ids, obj))
+        with self._recipes_lock:
+            loaded = name in self._recipe_names
+        if not loaded and name in self.identifiers['medium']:
+            for medium in iloop.Medium.instances(where={'name': name}):
+                self.add_recipe(medium.identifier, name, recipe_fingerprint(medium.read_contents(), medium.ph))
+            with self._recipes_lock:
+                self._recipe_names.add(name)
+        with self._recipes_lock:
+            return self.recipes.get((name, fingerprint))
 
 iloop_cache = IloopCache()
 
@@ -94,11 +248,11 @@ def synonym_to_chebi_name(project, synonym):
 
 
 def valid_experiment_identifier(project, identifier):
-    assert (identifier, project.id) in iloop_cache.identifiers['experiment']
+    assert identifier in iloop_cache.project_identifiers('experiment', project)
 
 
 def valid_strain_alias(project, alias):
-    assert (alias, project.id) in iloop_cache.identifiers['strain']
+    assert alias in iloop_cache.project_identifiers('strain', project)
 
 
 def valid_medium_name(project, name):
@@ -120,6 +274,7 @@ def valid_protein_identifier(project, identifier):
 @check('genotype-not-gnomic', type='structure', context='body', after='duplicate-row')
 def genotype_not_gnomic(errors, columns, row_number, state):
     """ checker logging if any columns named genotype have rows with non-gnomic strings """
+    import gnomic
     gnomic_parser = gnomic.GnomicParser()
     for column in columns:
         if 'header' in column and 'genotype' in column['header']:
@@ -140,6 +295,7 @@ def genotype_not_gnomic(errors, columns, row_number, state):
 
 
 def identifier_unknown(project, entity, check_function, message, errors, columns, row_number):
+    from potion_client.exceptions import ItemNotFound
     for column in columns:
         if 'header' in column and entity in column['header']:
             try:
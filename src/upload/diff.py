@@ -0,0 +1,84 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""differences between the scalars of an experiment in iloop and those of an upload
+
+Scalars are in the form sent to iloop with `Experiment.add_samples`, a list of dicts with the 'test', optionally
+the 'phase', and 'measurements' mapping sample names to lists of values. Each measured value is identified by its
+sample, test and phase.
+"""
+
+import json
+import math
+from collections import OrderedDict, namedtuple
+
+
+ScalarDiff = namedtuple('ScalarDiff', ['changed', 'removed'])
+
+
+def _phase_key(phase):
+    if phase is None:
+        return None
+    return float(phase['start'] if isinstance(phase, dict) else phase.start), \
+        float(phase['end'] if isinstance(phase, dict) else phase.end)
+
+
+def _test_key(test):
+    return json.dumps(test, sort_keys=True)
+
+
+def scalar_values(scalars):
+    """measured values by (sample name, test, phase) key
+
+    :param scalars: list of scalars
+    :return OrderedDict: key to list of values
+    """
+    values = OrderedDict()
+    for scalar in scalars:
+        test, phase = _test_key(scalar['test']), _phase_key(scalar.get('phase'))
+        for sample, measurements in scalar['measurements'].items():
+            values[(sample, test, phase)] = [float(value) for value in measurements]
+    return values
+
+
+def _same(first, second):
+    return len(first) == len(second) and all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12) or
+                                             (math.isnan(a) and math.isnan(b)) for a, b in zip(first, second))
+
+
+def diff_scalars(current, scalars):
+    """what to send to iloop to turn the `current` scalars of an experiment into `scalars`
+
+    :param current: the scalars stored in iloop
+    :param scalars: the scalars of the upload
+    :return ScalarDiff: the keys of added or changed values and the keys of values no longer in the upload
+    """
+    current_values = scalar_values(current)
+    new_values = scalar_values(scalars)
+    changed = {key for key, values in new_values.items()
+               if key not in current_values or not _same(current_values[key], values)}
+    removed = {key for key in current_values if key not in new_values}
+    return ScalarDiff(changed, removed)
+
+
+def select_scalars(scalars, keys):
+    """the part of `scalars` with the values identified by `keys`, scalars without any such value are left out"""
+    selected = []
+    for scalar in scalars:
+        test, phase = _test_key(scalar['test']), _phase_key(scalar.get('phase'))
+        measurements = {sample: values for sample, values in scalar['measurements'].items()
+                        if (sample, test, phase) in keys}
+        if measurements:
+            selected.append(dict(scalar, measurements=measurements))
+    return selected
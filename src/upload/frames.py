@@ -0,0 +1,128 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+
+
+def downcast_float(values):
+    """float32 version of a float column if that represents every value exactly, otherwise the column as is
+
+    :param values: Series or array of floats
+    :return: Series or array with float32 values, or `values`
+    """
+    if values.dtype != np.float64:
+        return values
+    downcast = values.astype(np.float32)
+    if np.array_equal(np.asarray(downcast, dtype=np.float64), np.asarray(values), equal_nan=True):
+        return downcast
+    return values
+
+
+def compact_frame(df):
+    """convert the columns of a data frame in place to a compact representation
+
+    String columns become categoricals so that repeated identifiers are stored once, float columns are downcast to
+    float32 where no precision is lost.
+
+    :param df: the data frame
+    :return DataFrame: the same data frame
+    """
+    for column in df.columns:
+        if df[column].dtype == np.float64:
+            df[column] = downcast_float(df[column])
+        elif df[column].dtype == object or pd.api.types.is_string_dtype(df[column].dtype):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def map_categorical(column, func):
+    """apply a function to each distinct value of a column rather than to each row
+
+    :param column: Series
+    :param func: function to apply, also applied to missing values
+    :return Categorical: the mapped values
+    """
+    categorical = pd.Categorical(column)
+    mapped = [func(value) for value in categorical.categories] + [func(np.nan)]
+    codes, categories = pd.factorize(pd.Series(mapped, dtype=object))
+    # code -1 of missing values picks the last mapped value, that of nan
+    return pd.Categorical.from_codes(codes[categorical.codes], categories)
+
+
+def join_columns(df, columns, sep='_'):
+    """categorical of the string values of several columns joined with a separator, e.g. 'ml_rate_glucose_nan'
+
+    Values are formatted with `str`, missing values as 'nan'. Each distinct combination of values is only joined
+    once.
+
+    :param df: the data frame
+    :param columns: names of the columns to join
+    :param sep: the separator
+    :return Categorical: the joined values
+    """
+    combined = np.zeros(len(df), dtype=np.int64)
+    labels = []
+    for column in columns:
+        categorical = pd.Categorical(df[column])
+        column_labels = [str(value) for value in categorical.categories] + ['nan']
+        combined = combined * len(column_labels) + categorical.codes % len(column_labels)
+        labels.append(column_labels)
+    combinations, inverse = np.unique(combined, return_inverse=True)
+    joined = []
+    for combination in combinations:
+        parts = []
+        for column_labels in reversed(labels):
+            combination, code = divmod(int(combination), len(column_labels))
+            parts.append(column_labels[code])
+        joined.append(sep.join(reversed(parts)))
+    codes, categories = pd.factorize(pd.Series(joined, dtype=object))
+    return pd.Categorical.from_codes(codes[inverse.ravel()], categories)
+
+
+def _tile(values, reps):
+    """`values` repeated `reps` times, kept categorical for strings"""
+    if values.dtype == np.float64:
+        return np.tile(downcast_float(values.to_numpy()), reps)
+    if pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+        return np.tile(values.to_numpy(), reps)
+    categorical = pd.Categorical(values)
+    return pd.Categorical.from_codes(np.tile(categorical.codes, reps), categorical.categories)
+
+
+def melt_samples(wide, id_vars, samples, sample_cols):
+    """long format of a table with a column of values per sample, with the columns describing each sample
+
+    Equivalent to melting `wide` to a 'sample_id' and a 'value' column and inner joining the result with
+    `samples` on 'sample_id', but with categorical identifiers and float32 values where that is exact, and without
+    the intermediate copies of melt and merge.
+
+    :param wide: data frame with the `id_vars` columns and a column per sample id
+    :param id_vars: the columns to keep for each value
+    :param samples: data frame with a 'sample_id' column and the `sample_cols` columns
+    :param sample_cols: the sample columns to add, other than 'sample_id'
+    :return DataFrame: the long data frame
+    """
+    samples = samples.drop_duplicates('sample_id').set_index('sample_id')
+    sample_ids = [column for column in wide.columns if column not in id_vars and column in samples.index]
+    n_rows = len(wide)
+    columns = {column: _tile(wide[column], len(sample_ids)) for column in id_vars}
+    sample_categories = pd.Index(sample_ids)
+    sample_codes = np.repeat(np.arange(len(sample_ids)), n_rows)
+    columns['sample_id'] = pd.Categorical.from_codes(sample_codes, sample_categories)
+    columns['value'] = downcast_float(np.asarray(wide[sample_ids], dtype=np.float64).ravel(order='F'))
+    for column in sample_cols:
+        categorical = pd.Categorical(samples.loc[sample_ids, column])
+        columns[column] = pd.Categorical.from_codes(categorical.codes[sample_codes], categorical.categories)
+    return pd.DataFrame(columns)
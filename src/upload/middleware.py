@@ -12,20 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import aiohttp
+from aiohttp import web
 
-from . import raven_client
+from . import get_raven_client
 
 
-async def raven_middleware(app, handler):
+@web.middleware
+async def raven_middleware(request, handler):
     """aiohttp middleware which captures any uncaught exceptions to Sentry before re-raising"""
-    async def middleware_handler(request):
-        try:
-            return await handler(request)
-        except aiohttp.web.HTTPClientError:
-            # Do not capture client errors (like 404s)
-            raise
-        except Exception:
-            raven_client.captureException()
-            raise
-    return middleware_handler
+    try:
+        return await handler(request)
+    except web.HTTPClientError:
+        # Do not capture client errors (like 404s)
+        raise
+    except web.HTTPServiceUnavailable:
+        # Do not capture uploads rejected by admission control
+        raise
+    except Exception:
+        get_raven_client().captureException()
+        raise
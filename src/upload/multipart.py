@@ -0,0 +1,102 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from collections import namedtuple
+from tempfile import SpooledTemporaryFile
+
+from aiohttp import web
+from aiohttp.hdrs import CONTENT_TYPE
+
+from upload.settings import Default
+
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# a posted file, with the same attributes as the file fields of `request.post()`
+UploadedFile = namedtuple('UploadedFile', ['name', 'filename', 'file', 'content_type'])
+
+
+class RequestEntityTooLarge(web.HTTPClientError):
+    """413 response, `web.HTTPRequestEntityTooLarge` takes different arguments across aiohttp versions"""
+    status_code = 413
+
+
+def _too_large(what, limit):
+    return RequestEntityTooLarge(text='{{"status": "{} exceeds the limit of {} bytes"}}'.format(what, limit))
+
+
+async def read_form(request, max_file_size=None, max_request_size=None):
+    """read the fields of a posted form, streaming files to temporary files instead of keeping them in memory
+
+    Files are written to spooled temporary files a chunk at a time, kept in memory up to `Default.UPLOAD_SPOOL_SIZE`
+    bytes and on disk beyond that. Other fields are read as text.
+
+    :param request: the request
+    :param max_file_size: maximum size of a posted file in bytes, `Default.MAX_UPLOAD_SIZE` if None
+    :param max_request_size: maximum size of all posted data in bytes, `Default.MAX_REQUEST_SIZE` if None
+    :return dict: field name to str, or to `UploadedFile` for files positioned at the start
+    :raise RequestEntityTooLarge: as soon as a limit is exceeded
+    """
+    max_file_size = max_file_size or Default.MAX_UPLOAD_SIZE
+    max_request_size = max_request_size or Default.MAX_REQUEST_SIZE
+    if request.content_length is not None and request.content_length > max_request_size:
+        raise _too_large('request', max_request_size)
+    if not request.headers.get(CONTENT_TYPE, '').startswith('multipart/'):
+        return dict(await request.post())
+    form = {}
+    total = 0
+    reader = await request.multipart()
+    while True:
+        part = await reader.next()
+        if part is None:
+            break
+        if not hasattr(part, 'read_chunk'):
+            raise web.HTTPBadRequest(text='{"status": "nested multipart content is not supported"}')
+        if part.filename is None:
+            value = await part.read(decode=True)
+            total += len(value)
+            if total > max_request_size:
+                raise _too_large('request', max_request_size)
+            form[part.name] = value.decode(part.get_charset(default='utf-8'))
+            continue
+        spooled = SpooledTemporaryFile(max_size=Default.UPLOAD_SPOOL_SIZE)
+        size = 0
+        while True:
+            chunk = await part.read_chunk(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            total += len(chunk)
+            if size > max_file_size:
+                spooled.close()
+                raise _too_large('file {}'.format(part.filename), max_file_size)
+            if total > max_request_size:
+                spooled.close()
+                raise _too_large('request', max_request_size)
+            spooled.write(chunk)
+        spooled.seek(0)
+        logger.info('received {} ({} bytes)'.format(part.filename, size))
+        form[part.name] = UploadedFile(part.name, part.filename, spooled,
+                                       part.headers.get(CONTENT_TYPE, 'application/octet-stream'))
+    return form
+
+
+def close_form(form):
+    """close the temporary files of a form read by `read_form`, removing those that were written to disk"""
+    for value in form.values():
+        if isinstance(value, UploadedFile):
+            value.file.close()
@@ -0,0 +1,56 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+
+class UploadPlan(object):
+    """what an upload would do in iloop, per kind of object, and how many write requests that takes
+
+    Objects are classified as 'create', 'reuse' (left as is), 'update' (changed in place), 'archive' (archived and
+    created anew), 'delete' or 'conflict' (the upload would fail on it).
+    """
+
+    ACTIONS = ('create', 'reuse', 'update', 'archive', 'delete', 'conflict')
+
+    def __init__(self):
+        self.objects = OrderedDict()
+        self.write_calls = 0
+
+    def add(self, kind, action, identifier, writes=0):
+        """record the action for an object
+
+        :param kind: the kind of object, e.g. 'strain'
+        :param action: one of ACTIONS
+        :param identifier: identifier of the object, e.g. the strain alias
+        :param writes: number of write requests the action takes
+        """
+        if action not in self.ACTIONS:
+            raise ValueError('unknown action {}'.format(action))
+        self.objects.setdefault(kind, OrderedDict()).setdefault(action, []).append(str(identifier))
+        self.write_calls += writes
+
+    def count(self, kind, action):
+        return len(self.objects.get(kind, {}).get(action, []))
+
+    def as_dict(self, max_items=100):
+        """json serializable summary of the plan
+
+        :param max_items: maximum number of identifiers listed per kind and action, all are counted
+        """
+        return {'write-calls': self.write_calls,
+                'counts': {kind: {action: len(identifiers) for action, identifiers in actions.items()}
+                           for kind, actions in self.objects.items()},
+                'objects': {kind: {action: identifiers[:max_items] for action, identifiers in actions.items()}
+                            for kind, actions in self.objects.items()}}
@@ -0,0 +1,88 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+from upload.settings import Default
+
+
+logger = logging.getLogger(__name__)
+
+ProjectList = namedtuple('ProjectList', ['projects', 'body', 'etag', 'expires'])
+
+
+def _cache_key(api, token):
+    # tokens are not kept in memory in the clear
+    return api, hashlib.sha256((token or '').encode()).hexdigest()
+
+
+class ProjectListCache(object):
+    """project listings per iloop api and token, kept for `ttl` seconds
+
+    :param ttl: seconds a listing is kept
+    :param max_entries: maximum number of listings kept, the least recently stored are dropped first
+    """
+
+    def __init__(self, ttl, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, api, token):
+        """the cached listing for an api and token
+
+        :return ProjectList: the listing, None if not cached or expired
+        """
+        key = _cache_key(api, token)
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def put(self, api, token, projects):
+        """store the listing for an api and token
+
+        :param projects: list of dicts with 'display' and 'value' of each project
+        :return ProjectList: the stored listing
+        """
+        key = _cache_key(api, token)
+        body = json.dumps(projects, separators=(',', ':')).encode()
+        entry = ProjectList(projects, body, '"{}"'.format(hashlib.sha1(body).hexdigest()), time.monotonic() + self.ttl)
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, api=None, token=None):
+        """drop the listing of an api and token, or all listings if no token is given"""
+        if token is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(_cache_key(api, token), None)
+
+    def saw_project(self, api, token, project_id):
+        """drop the listing of an api and token if it lacks a project that was used with them, e.g. a new project"""
+        entry = self.get(api, token)
+        if entry is not None and project_id not in {project['value'] for project in entry.projects}:
+            logger.info('project {} not in cached listing, invalidating'.format(project_id))
+            self.invalidate(api, token)
+
+
+project_lists = ProjectListCache(Default.PROJECTS_CACHE_TTL)
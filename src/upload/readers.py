@@ -0,0 +1,226 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import logging
+import os
+from bisect import bisect_right
+from datetime import date, datetime, time
+from tempfile import mkstemp
+
+
+logger = logging.getLogger(__name__)
+
+WORKBOOK_CONTENT_TYPES = {'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx',
+                          'application/vnd.ms-excel': 'xls'}
+
+
+def workbook_format(content_type, file_name):
+    """the excel format of an uploaded file, or None if it is not a workbook
+
+    :param content_type: the content type the file was posted with
+    :param file_name: the name of the posted file
+    :return str: 'xlsx', 'xls' or None
+    """
+    extension = os.path.splitext(file_name or '')[1].lower()
+    if extension in ('.xlsx', '.xls'):
+        return extension[1:]
+    return WORKBOOK_CONTENT_TYPES.get(content_type)
+
+
+COLUMNAR_CONTENT_TYPES = {'application/vnd.apache.parquet': 'parquet',
+                          'application/x-parquet': 'parquet',
+                          'application/vnd.apache.arrow.file': 'feather'}
+COLUMNAR_EXTENSIONS = {'.parquet': 'parquet', '.pq': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+
+
+def columnar_format(content_type, file_name):
+    """the columnar format of an uploaded file, or None if it is not a parquet or arrow/feather file
+
+    :param content_type: the content type the file was posted with
+    :param file_name: the name of the posted file
+    :return str: 'parquet', 'feather' or None
+    """
+    extension = os.path.splitext(file_name or '')[1].lower()
+    return COLUMNAR_EXTENSIONS.get(extension) or COLUMNAR_CONTENT_TYPES.get(content_type)
+
+
+def read_columnar(file, format):
+    """read a parquet or arrow/feather file to a data frame
+
+    Columns are converted from arrow without copies where the types allow, dictionary encoded columns become
+    categoricals.
+
+    :param file: file object with the file contents
+    :param format: 'parquet' or 'feather'
+    :return DataFrame: the table
+    """
+    if format == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(file)
+    elif format == 'feather':
+        import pyarrow.feather
+        table = pyarrow.feather.read_table(file)
+    else:
+        raise ValueError('unsupported columnar format {}'.format(format))
+    logger.info('read {} rows and {} columns from {} file'.format(table.num_rows, table.num_columns, format))
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _cell_value(value):
+    if isinstance(value, datetime):
+        if value.time() == time(0):
+            return value.date().isoformat()
+        return value.isoformat(' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class RowNumbers(object):
+    """the sheet row numbers of the rows of a csv file written without the blank rows of the sheet
+
+    Only the rows after which rows were skipped are stored, so the mapping stays small for large sheets.
+    """
+
+    def __init__(self):
+        self._rows = []
+        self._skipped = []
+
+    def skip(self, row_number):
+        """record a blank sheet row skipped before the csv row `row_number` (1-based, the header is row 1)"""
+        if self._rows and self._rows[-1] == row_number:
+            self._skipped[-1] += 1
+        else:
+            self._rows.append(row_number)
+            self._skipped.append((self._skipped[-1] if self._skipped else 0) + 1)
+
+    def __bool__(self):
+        return bool(self._rows)
+
+    def __call__(self, row_number):
+        """the sheet row number of a csv row number"""
+        index = bisect_right(self._rows, row_number) - 1
+        return row_number + (self._skipped[index] if index >= 0 else 0)
+
+
+class WorkbookReader(object):
+    """read-only access to the sheets of an excel workbook, one row at a time
+
+    xlsx files are opened with openpyxl in read-only mode so that rows are parsed while iterating rather than loading
+    the whole workbook, xls files are read with xlrd.
+
+    :param file: file object with the workbook contents
+    :param format: 'xlsx' or 'xls'
+    """
+
+    def __init__(self, file, format):
+        self.format = format
+        if format == 'xlsx':
+            import openpyxl
+            self._book = openpyxl.load_workbook(file, read_only=True, data_only=True)
+            self.sheet_names = list(self._book.sheetnames)
+        elif format == 'xls':
+            import xlrd
+            self._book = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+            self.sheet_names = self._book.sheet_names()
+        else:
+            raise ValueError('unsupported workbook format {}'.format(format))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.format == 'xlsx':
+            self._book.close()
+        else:
+            self._book.release_resources()
+
+    def find_sheet(self, name):
+        """name of the sheet matching `name` ignoring case, or None if the workbook has no such sheet"""
+        if name is None:
+            return None
+        for sheet_name in self.sheet_names:
+            if sheet_name.strip().lower() == name.lower():
+                return sheet_name
+        return None
+
+    def _raw_rows(self, sheet):
+        if self.format == 'xlsx':
+            worksheet = self._book[sheet] if sheet else self._book.worksheets[0]
+            for row in worksheet.iter_rows():
+                yield [cell.value for cell in row]
+        else:
+            import xlrd
+            worksheet = self._book.sheet_by_name(sheet) if sheet else self._book.sheet_by_index(0)
+            for row in worksheet.get_rows():
+                values = []
+                for cell in row:
+                    if cell.ctype == xlrd.XL_CELL_DATE:
+                        values.append(xlrd.xldate.xldate_as_datetime(cell.value, self._book.datemode))
+                    elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                        values.append(None)
+                    else:
+                        values.append(cell.value)
+                yield values
+
+    def rows(self, sheet=None):
+        """iterate over the non-empty rows of a sheet
+
+        Rows are cut or padded to the width of the header row, dates are given as iso formatted strings.
+
+        :param sheet: name of the sheet, the first sheet if None
+        """
+        for _, row in self.numbered_rows(sheet):
+            yield row
+
+    def numbered_rows(self, sheet=None):
+        """iterate over the non-empty rows of a sheet, see `rows`, together with their 1-based row number in the
+        sheet"""
+        width = None
+        for row_number, row in enumerate(self._raw_rows(sheet), 1):
+            if all(value is None or value == '' for value in row):
+                continue
+            if width is None:
+                width = len(row)
+                while width and row[width - 1] is None:
+                    width -= 1
+            row = [_cell_value(value) for value in row[:width]]
+            yield row_number, row + [None] * (width - len(row))
+
+    def to_csv(self, sheet=None, dir=None):
+        """write a sheet to a temporary csv file
+
+        Blank rows are left out, the sheet row numbers of the written rows are returned with the file so that
+        validation errors can refer to the rows of the sheet, see `upload.validation.inspect_table`.
+
+        :param sheet: name of the sheet, the first sheet if None
+        :param dir: directory to write the file to, the default temporary directory if None
+        :return tuple: name of the written file and its `RowNumbers`
+        """
+        file_description, tmp_file_name = mkstemp(suffix='.csv', dir=dir)
+        row_numbers = RowNumbers()
+        with os.fdopen(file_description, 'w', newline='') as tmp_file:
+            writer = csv.writer(tmp_file)
+            n_rows = 0
+            for row_number, row in self.numbered_rows(sheet):
+                n_rows += 1
+                while row_numbers(n_rows) < row_number:
+                    row_numbers.skip(n_rows)
+                writer.writerow(row)
+        logger.info('wrote {} rows from sheet {} to {}'.format(n_rows, sheet or 0, tmp_file_name))
+        return tmp_file_name, row_numbers
@@ -0,0 +1,161 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import json
+import logging
+from os.path import abspath, dirname, join, exists
+from types import MappingProxyType
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILES = MappingProxyType({'strains': 'strains_schema.json',
+                                 'media': 'media_schema.json',
+                                 'sample_information': 'sample_information_schema.json',
+                                 'physiology': 'physiology_schema.json',
+                                 'screen': 'screen_schema.json',
+                                 'fluxes': 'fluxes_schema.json',
+                                 'protein_abundances': 'protein_abundances_schema.json',
+                                 'xref_samples': 'xref_samples_schema.json',
+                                 'xref_matrix': 'xref_matrix_schema.json'})
+
+# the schemas of the repository, independent of the working directory
+SCHEMA_DIR = abspath(join(dirname(__file__), '..', '..', 'data', 'schemas'))
+
+
+def accepts_encoding(accept_encoding, coding):
+    """whether an Accept-Encoding header allows a content coding, honouring quality values such as 'gzip;q=0'
+
+    :param accept_encoding: value of the header, None if not given
+    :param coding: the content coding, e.g. 'gzip'
+    :return bool: True if the coding, or '*' when the coding is not listed, has a non-zero quality
+    """
+    qualities = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, parameters = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    if coding in qualities:
+        return qualities[coding] > 0
+    return qualities.get('*', 0) > 0
+
+
+def etag_matches(if_none_match, etag):
+    """whether an If-None-Match header lists an entity tag, using the weak comparison the header calls for
+
+    :param if_none_match: value of the header, None if not given
+    :param etag: the quoted entity tag of the current representation
+    :return bool: True if the header is '*' or one of its comma separated tags equals `etag`, ignoring 'W/'
+    """
+    for tag in (if_none_match or '').split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class CompiledSchema(object):
+    """a table schema loaded once and kept together with its serialized forms
+
+    :param name: the name the schema is registered under, e.g. 'media'
+    :param path: path to the json file the schema was read from
+    """
+
+    __slots__ = ('name', 'path', 'body', 'gzipped', 'etag', 'gzip_etag', '_descriptor')
+
+    def __init__(self, name, path):
+        with open(path) as schema_file:
+            descriptor = json.load(schema_file)
+        self.name = name
+        self.path = path
+        self.body = json.dumps(descriptor, separators=(',', ':')).encode()
+        self.gzipped = gzip.compress(self.body)
+        digest = hashlib.sha1(self.body).hexdigest()
+        # the representations differ in their bytes so each has its own entity tag
+        self.etag = '"{}"'.format(digest)
+        self.gzip_etag = '"{}-gzip"'.format(digest)
+        self._descriptor = descriptor
+
+    def representation(self, accept_encoding):
+        """the body to send for an Accept-Encoding header
+
+        :param accept_encoding: value of the request's Accept-Encoding header, None if not given
+        :return tuple: the body, its entity tag and its content encoding, None if not compressed
+        """
+        if accepts_encoding(accept_encoding, 'gzip'):
+            return self.gzipped, self.gzip_etag, 'gzip'
+        return self.body, self.etag, None
+
+    def descriptor(self, extra_fields=()):
+        """the schema descriptor, optionally with extra fields appended
+
+        The returned dict is a new object with a new list of fields, so callers can extend it without affecting the
+        registry. Field definitions themselves are shared and must not be modified, goodtables copies the descriptor
+        before using it.
+
+        :param extra_fields: iterable of field definitions to add after the schema's own fields
+        :return dict: the schema descriptor
+        """
+        descriptor = dict(self._descriptor)
+        descriptor['fields'] = self._descriptor['fields'] + list(extra_fields)
+        return descriptor
+
+
+class SchemaRegistry(object):
+    """read-only collection of the table schemas, compiled once when created
+
+    :param schema_dir: directory containing the schema files, `SCHEMA_DIR` if None
+    """
+
+    def __init__(self, schema_dir=None):
+        schema_dir = schema_dir or SCHEMA_DIR
+        schemas = {}
+        for name, file_name in SCHEMA_FILES.items():
+            path = join(schema_dir, file_name)
+            if not exists(path):
+                raise FileNotFoundError('missing schema %s' % path)
+            schemas[name] = CompiledSchema(name, path)
+        self._schemas = MappingProxyType(schemas)
+        logger.info('{} schemas compiled'.format(len(schemas)))
+
+    def __getitem__(self, name):
+        return self._schemas[name]
+
+    def __contains__(self, name):
+        return name in self._schemas
+
+    def __iter__(self):
+        return iter(self._schemas)
+
+    def __len__(self):
+        return len(self._schemas)
+
+
+schema_registry = SchemaRegistry()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import os
+from tempfile import gettempdir
 
 
 class Default(object):
@@ -21,6 +22,36 @@ class Default(object):
     ILOOP_BIOSUSTAIN = 'https://iloop.biosustain.dtu.dk/api'
     NOT_PUBLIC = {'NPC'}
     SENTRY_DSN = os.environ.get('SENTRY_DSN', '')
+    # distinct errors reported per upload file, in total and per check, and rows inspected at a time
+    VALIDATION_ERROR_LIMIT = int(os.environ.get('VALIDATION_ERROR_LIMIT', 1000))
+    VALIDATION_CHECK_ERROR_LIMIT = int(os.environ.get('VALIDATION_CHECK_ERROR_LIMIT', 100))
+    VALIDATION_CHUNK_SIZE = int(os.environ.get('VALIDATION_CHUNK_SIZE', 50000))
+    # where progress of uploads is recorded so that failed uploads can be resumed, and for how long (seconds)
+    CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', os.path.join(gettempdir(), 'upload-checkpoints'))
+    CHECKPOINT_MAX_AGE = int(os.environ.get('CHECKPOINT_MAX_AGE', 7 * 24 * 3600))
+    # estimated memory (bytes) of the uploads a worker processes at a time, uploads waiting for admission and for how
+    # long (seconds), and when clients should retry a rejected upload (seconds)
+    ADMISSION_CAPACITY = int(os.environ.get('ADMISSION_CAPACITY', 1024 ** 3))
+    ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 4))
+    ADMISSION_TIMEOUT = float(os.environ.get('ADMISSION_TIMEOUT', 60))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 30))
+    # threads of a worker validating and uploading admitted requests, off the event loop
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 4))
+    # size limits (bytes) of posted files and whole requests, and how much of a posted file is kept in memory
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 256 * 1024 ** 2))
+    MAX_REQUEST_SIZE = int(os.environ.get('MAX_REQUEST_SIZE', 512 * 1024 ** 2))
+    UPLOAD_SPOOL_SIZE = int(os.environ.get('UPLOAD_SPOOL_SIZE', 1024 ** 2))
+    # media, and samples of xref measurement uploads, created in parallel by an upload
+    MEDIA_UPLOAD_CONCURRENCY = int(os.environ.get('MEDIA_UPLOAD_CONCURRENCY', 8))
+    SAMPLE_UPLOAD_CONCURRENCY = int(os.environ.get('SAMPLE_UPLOAD_CONCURRENCY', 8))
+    # experiments (and plates) of fermentation and screen uploads sent to iloop in parallel
+    EXPERIMENT_UPLOAD_CONCURRENCY = int(os.environ.get('EXPERIMENT_UPLOAD_CONCURRENCY', 4))
+    # seconds the projects listed for a token are kept
+    PROJECTS_CACHE_TTL = int(os.environ.get('PROJECTS_CACHE_TTL', 60))
+    # seconds the cached media names, and strains and experiments of a project, are used before uploads refresh them
+    ILOOP_CACHE_TTL = int(os.environ.get('ILOOP_CACHE_TTL', 60))
+    # connections to iloop kept by the asyncio client of a worker
+    ILOOP_CONNECTIONS = int(os.environ.get('ILOOP_CONNECTIONS', 20))
 
     LOGGING = {
         'version': 1,
@@ -16,15 +16,23 @@ import logging
 import pandas as pd
 from datetime import datetime
 from potion_client.exceptions import ItemNotFound
-from goodtables import Inspector
 from dateutil.parser import parse as parse_date
-import json
-from os.path import abspath, join, exists
 from requests import HTTPError
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, defaultdict, deque
+from functools import partial
 
 from upload.constants import measurement_test, compound_skip
-from upload.checks import genotype_not_gnomic
+from upload.checks import genotype_not_gnomic, iloop_cache, recipe_fingerprint
+from upload.checkpoint import Checkpoint
+from upload.diff import diff_scalars, scalar_values, select_scalars
+from upload.frames import compact_frame, join_columns, map_categorical, melt_samples
+from upload.plan import UploadPlan
+from upload.schemas import schema_registry
+from upload.settings import Default
+from upload.validation import (ValidationError, cast_frame, error_report, inspect_frame, inspect_table,
+                               merge_reports)
 from upload import _isnan
 
 
@@ -35,106 +43,205 @@ def place_holder_compound_synonym_mapper(synonym):
 
 
 def get_schema(schema_name):
-    default_schemas = {'strains': 'strains_schema.json',
-                       'media': 'media_schema.json',
-                       'sample_information': 'sample_information_schema.json',
-                       'physiology': 'physiology_schema.json',
-                       'screen': 'screen_schema.json',
-                       'fluxes': 'fluxes_schema.json',
-                       'protein_abundances': 'protein_abundances_schema.json'}
-    schema_name = default_schemas[schema_name]
-    schema_dir = abspath(join("data", "schemas"))
-    schema = join(schema_dir, schema_name)
-    if not exists(schema):
-        raise FileNotFoundError('missing schema %s' % schema)
-    return schema
+    """path to the json file for a schema, see `upload.schemas.schema_registry` for the compiled schemas"""
+    return schema_registry[schema_name].path
 
 
 class DataFrameInspector(object):
     """ class for inspecting a table and reading it to a DataFrame
 
+    tables read from columnar files are given as data frames, they are inspected on their typed columns with
+    `inspect_frame` and cast to the types of the schema when read.
 
-    :param file_name: name of the csv file to read
+    :param file_name: name of the csv file to read, or a data frame
     :param schema_name: name of the json file specifying the scheme, possibly one of the schema in this package
     without path
     :param custom_checks: list of additional custom check functions to apply
+    :param error_limit: maximum number of distinct errors to report
+    :param check_error_limit: maximum number of distinct errors to report per check
+    :param chunk_size: number of rows to inspect at a time
+    :param row_numbers: the row numbers to report for the rows of the csv file, e.g. the `RowNumbers` of a file
+    written from a sheet, see `inspect_table`
+    :param temp_dir: directory for the temporary files of the inspection, e.g. that of the request
     """
 
-    def __init__(self, file_name, schema_name, custom_checks=None):
-        self.schema = get_schema(schema_name)
+    def __init__(self, file_name, schema_name, custom_checks=None, error_limit=Default.VALIDATION_ERROR_LIMIT,
+                 check_error_limit=Default.VALIDATION_CHECK_ERROR_LIMIT, chunk_size=Default.VALIDATION_CHUNK_SIZE,
+                 row_numbers=None, temp_dir=None):
+        self.schema = schema_registry[schema_name].descriptor()
         self.file_name = file_name
+        self.row_numbers = row_numbers
+        self.temp_dir = temp_dir
         self.custom_checks = custom_checks if custom_checks else []
+        self.error_limit = error_limit
+        self.check_error_limit = check_error_limit
+        self.chunk_size = chunk_size
+
+    def report(self):
+        """ inspect the table and return the error report """
+        if isinstance(self.file_name, pd.DataFrame):
+            return inspect_frame(self.file_name, self.schema, custom_checks=self.custom_checks,
+                                 error_limit=self.error_limit, check_error_limit=self.check_error_limit)
+        return inspect_table(self.file_name, self.schema, custom_checks=self.custom_checks,
+                             error_limit=self.error_limit, check_error_limit=self.check_error_limit,
+                             chunk_size=self.chunk_size, row_numbers=self.row_numbers, temp_dir=self.temp_dir)
 
     def inspect(self):
-        """ inspect the data frame and return an error report """
-        inspector = Inspector(custom_checks=self.custom_checks, order_fields=True)
-        report = inspector.inspect(self.file_name, preset='table', schema=self.schema)
+        """ inspect the table and raise a ValidationError if it is not valid """
+        report = self.report()
         if not report['valid']:
-            raise ValueError(json.dumps(report, indent=4))
+            raise ValidationError(report)
+
+    def read(self):
+        """ read the table to a DataFrame without inspecting it """
+        if isinstance(self.file_name, pd.DataFrame):
+            return cast_frame(self.file_name, self.schema)
+        return pd.read_csv(self.file_name)
 
     def __call__(self):
         """ inspect and read to DataFrame """
         self.inspect()
-        return pd.read_csv(self.file_name)
+        return self.read()
 
 
-def inspected_data_frame(file_name, schema_name, custom_checks=None):
+def inspected_data_frame(file_name, schema_name, custom_checks=None, row_numbers=None, temp_dir=None):
     """inspect and read a csv file
 
-    :param file_name: name of the csv file to read
+    :param file_name: name of the csv file to read, or a data frame
     :param schema_name: name of the json file specifying the scheme, possibly one of the schema in this package
     without path
     :param custom_checks: list of additional custom check functions to apply
+    :param row_numbers: the row numbers to report for the rows of the file, see `DataFrameInspector`
+    :param temp_dir: directory for the temporary files of the inspection, see `DataFrameInspector`
     :return DataFrame: the inspected data frame
     """
     return DataFrameInspector(file_name=file_name, schema_name=schema_name,
-                              custom_checks=custom_checks)()
+                              custom_checks=custom_checks, row_numbers=row_numbers, temp_dir=temp_dir)()
+
+
+def inspect_concurrently(inspectors):
+    """inspect several tables in parallel threads
+
+    :param inspectors: list of DataFrameInspector
+    :raise ValidationError: with a single report covering the tables of all inspectors if any of them is invalid
+    """
+    with ThreadPoolExecutor(max_workers=len(inspectors)) as executor:
+        reports = list(executor.map(DataFrameInspector.report, inspectors))
+    report = merge_reports(reports)
+    if not report['valid']:
+        raise ValidationError(report)
+
+
+def read_sample_ids(file_name):
+    """sample identifiers ('experiment_reactor') from a sample information file, without inspecting the file
+
+    :param file_name: name of the csv file to read, or a data frame
+    :return list: sorted sample identifiers, empty if the file lacks the experiment or reactor columns
+    """
+    try:
+        if isinstance(file_name, pd.DataFrame):
+            samples = file_name[['experiment', 'reactor']]
+            samples = samples.astype(str).where(samples.notna())
+        else:
+            samples = pd.read_csv(file_name, usecols=['experiment', 'reactor'], dtype=str)
+    except (KeyError, ValueError):
+        return []
+    return sorted(set(samples.dropna().apply(lambda x: '_'.join(x), axis=1)))
+
+
+def read_sample_names(file_name):
+    """sample names from a sample table of an xref matrix upload, without inspecting the file
+
+    :param file_name: name of the csv file to read, or a data frame
+    :return list: sorted sample names, empty if the file lacks the sample_name column
+    """
+    try:
+        if isinstance(file_name, pd.DataFrame):
+            names = file_name['sample_name']
+        else:
+            names = pd.read_csv(file_name, usecols=['sample_name'], dtype=str)['sample_name']
+    except (KeyError, ValueError):
+        return []
+    return sorted(set(str(name) for name in names.dropna()))
+
+
+class UploadError(Exception):
+    """uploading to iloop failed for some items of an upload
+
+    :param report: report with an error per failed item
+    """
+
+    def __init__(self, report):
+        super(UploadError, self).__init__('{} item(s) failed to upload'.format(report['error-count']))
+        self.report = report
 
 
 class AbstractDataUploader(object):
-    """ abstract class for uploading data to iloop """
+    """ abstract class for uploading data to iloop
+
+    completed parts of the upload are recorded in `checkpoint`, set it to the checkpoint of an earlier failed attempt
+    to resume that upload. Uploaders that report the outcome per item keep it in `results`.
+    """
 
     def __init__(self, project):
         self.project = project
+        self.checkpoint = Checkpoint()
+        self.results = OrderedDict()
 
     def upload(self, iloop):
         raise NotImplementedError
 
+    def plan(self, iloop):
+        """what `upload` would create, reuse, update or archive, without writing to iloop
+
+        :param iloop: iloop client
+        :return UploadPlan: the plan
+        """
+        raise NotImplementedError
+
 
 class MediaUploader(AbstractDataUploader):
     """upload media definitions
 
     inspect file using 'media_schema.json'. Upload if no existing medium with the exact same recipe. Key for the
-    medium is generated using current date.
+    medium is generated using current date. A medium with the name of an existing medium but a different recipe is
+    rejected.
 
     :param project: project object
     :param file_name: name of the csv file to read
+    :param row_numbers: the row numbers to report for the rows of the file, see `DataFrameInspector`
+    :param temp_dir: directory for the temporary files of the inspection, see `DataFrameInspector`
     """
 
-    def __init__(self, project, file_name, custom_checks, synonym_mapper=place_holder_compound_synonym_mapper):
+    def __init__(self, project, file_name, custom_checks, synonym_mapper=place_holder_compound_synonym_mapper,
+                 row_numbers=None, temp_dir=None):
         super(MediaUploader, self).__init__(project)
-        self.df = inspected_data_frame(file_name, 'media', custom_checks=custom_checks)
+        self.df = inspected_data_frame(file_name, 'media', custom_checks=custom_checks, row_numbers=row_numbers,
+                                       temp_dir=temp_dir)
         self.iloop_args = []
+        self.fingerprints = {}
         self.synonym_mapper = synonym_mapper
         self.prepare_upload()
 
     def prepare_upload(self):
         # directly naming the column 'compound' triggers a curious error when slicing
-        self.df['chebi_name'] = pd.Series(
-            [self.synonym_mapper(synonym) for synonym in
-             self.df['compound_name']],
-            index=self.df.index)
+        synonyms = {synonym: self.synonym_mapper(synonym) for synonym in self.df['compound_name'].unique()}
+        self.df['chebi_name'] = self.df['compound_name'].map(synonyms)
 
         self.df = self.df[self.df.chebi_name != compound_skip]
-        grouped_media = self.df.groupby(['medium'])
-        for medium_name, medium in grouped_media:
-            ingredients_df = medium[['chebi_name', 'concentration']]
-            ingredients_df.columns = ['compound', 'concentration']
-            ingredients = list(ingredients_df.T.to_dict().values())
-            if len(medium.pH.unique()) > 1:
-                raise ValueError('expected only on pH per medium')
-            ph = float(medium.iloc[0].pH)
-            now = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+        ph_counts = self.df.groupby('medium', observed=True)['pH'].nunique(dropna=False)
+        if (ph_counts > 1).any():
+            medium_name = ph_counts.index[ph_counts > 1][0]
+            raise ValidationError(error_report('expected only one pH for medium {}'.format(medium_name)))
+        phs = self.df.groupby('medium', observed=True)['pH'].first()
+        all_ingredients = defaultdict(list)
+        for medium_name, compound, concentration in zip(self.df['medium'].tolist(), self.df['chebi_name'].tolist(),
+                                                        self.df['concentration'].tolist()):
+            all_ingredients[medium_name].append({'compound': compound, 'concentration': concentration})
+        now = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+        for medium_name in sorted(all_ingredients):
+            ingredients = all_ingredients[medium_name]
+            ph = float(phs[medium_name])
             self.iloop_args.append((
                 medium_name,
                 ingredients,
@@ -144,14 +251,78 @@ class MediaUploader(AbstractDataUploader):
                     'ph': ph
                 })
             )
+            self.fingerprints[medium_name] = recipe_fingerprint(ingredients, ph)
+
+    def check_recipes(self, iloop):
+        """raise a ValidationError for media with the name of an existing medium but a different recipe"""
+        for medium_name, fingerprint in self.fingerprints.items():
+            if self.checkpoint.get('medium-created', medium_name):
+                # created by an earlier attempt that failed before adding the contents
+                continue
+            name = medium_name.strip()
+            if name in iloop_cache.identifiers['medium'] and not iloop_cache.find_medium(iloop, name, fingerprint):
+                raise ValidationError(error_report('medium {} already exists with a different recipe, choose a '
+                                                   'different name'.format(name)))
+
+    def plan(self, iloop):
+        self.check_recipes(iloop)
+        plan = UploadPlan()
+        for medium_name, fingerprint in self.fingerprints.items():
+            if iloop_cache.find_medium(iloop, medium_name.strip(), fingerprint):
+                plan.add('medium', 'reuse', medium_name)
+            else:
+                # create and add the contents
+                plan.add('medium', 'create', medium_name, writes=2)
+        return plan
+
+    def upload_medium(self, iloop, medium_name, ingredients, item):
+        """create a medium unless it exists with the same recipe
+
+        :return str: 'created', 'existing' or 'done' if created by an earlier attempt of the upload
+        """
+        if self.checkpoint.done('medium', medium_name):
+            return 'done'
+        item = {k: v.strip() if isinstance(v, str) else v for k, v in item.items()}
+        fingerprint = self.fingerprints[medium_name]
+        if iloop_cache.find_medium(iloop, item['name'], fingerprint):
+            logger.info('medium {} already exists with the same recipe'.format(item['name']))
+            self.checkpoint.mark('medium', medium_name)
+            return 'existing'
+        identifier = self.checkpoint.get('medium-created', medium_name)
+        if identifier:
+            media_object = iloop.Medium.one(where={'identifier': identifier})
+        else:
+            media_object = iloop.Medium.create(**item, organization=self.project.organization)
+            self.checkpoint.mark('medium-created', medium_name, value=item['identifier'])
+        media_object.update_contents(ingredients)
+        iloop_cache.add_recipe(media_object.identifier, item['name'], fingerprint)
+        self.checkpoint.mark('medium', medium_name)
+        return 'created'
 
     def upload(self, iloop):
-        for medium_name, ingredients, item in self.iloop_args:
-            for k, v in item.items():
-                if isinstance(v, str):
-                    item[k] = v.strip()
-            media_object = iloop.Medium.create(**item, organization=self.project.organization)
-            media_object.update_contents(ingredients)
+        """upload the media, `Default.MEDIA_UPLOAD_CONCURRENCY` at a time
+
+        The outcome for each medium is kept in `results`.
+
+        :raise UploadError: listing the media that failed, after all media have been tried
+        """
+        self.check_recipes(iloop)
+        with ThreadPoolExecutor(max_workers=Default.MEDIA_UPLOAD_CONCURRENCY) as executor:
+            futures = [(medium_name, executor.submit(self.upload_medium, iloop, medium_name, ingredients, item))
+                       for medium_name, ingredients, item in self.iloop_args]
+        errors = []
+        for medium_name, future in futures:
+            try:
+                self.results[medium_name] = future.result()
+            except (ItemNotFound, HTTPError) as error:
+                logger.warning('failed to upload medium {}: {}'.format(medium_name, error))
+                self.results[medium_name] = 'failed'
+                errors.append({'message': 'failed to upload medium {}: {}'.format(medium_name, error)})
+        iloop_cache.add('medium', (medium_name.strip() for medium_name, result in self.results.items()
+                                   if result != 'failed'))
+        if errors:
+            raise UploadError({'valid': False, 'error-count': len(errors), 'tables': [{'errors': errors}],
+                               'results': dict(self.results)})
 
 
 class StrainsUploader(AbstractDataUploader):
@@ -162,11 +333,14 @@ class StrainsUploader(AbstractDataUploader):
 
     :param project: project object
     :param file_name: name of the csv file to read
+    :param row_numbers: the row numbers to report for the rows of the file, see `DataFrameInspector`
+    :param temp_dir: directory for the temporary files of the inspection, see `DataFrameInspector`
     """
 
-    def __init__(self, project, file_name):
+    def __init__(self, project, file_name, row_numbers=None, temp_dir=None):
         super(StrainsUploader, self).__init__(project)
-        self.df = inspected_data_frame(file_name, 'strains', custom_checks=[genotype_not_gnomic])
+        self.df = inspected_data_frame(file_name, 'strains', custom_checks=[genotype_not_gnomic],
+                                       row_numbers=row_numbers, temp_dir=temp_dir)
         self.iloop_args = []
         self.prepare_upload()
 
@@ -200,8 +374,38 @@ class StrainsUploader(AbstractDataUploader):
             })
 
     def upload(self, iloop):
+        """upload the strains, the uploaded aliases are added to the identifier cache even if a later strain fails"""
+        uploaded = []
+        try:
+            self.upload_strains(iloop, uploaded)
+        finally:
+            iloop_cache.add('strain', uploaded, project=self.project)
+
+    def plan(self, iloop):
+        plan = UploadPlan()
+        strains = iloop_cache.project_identifiers('strain', self.project, iloop)
+        pools = set(pool.alias for pool in iloop.Pool.instances(where={'project': self.project}))
+        planned_pools = set()
         for item in self.iloop_args:
             item = {k: v.strip() for k, v in item.items() if isinstance(v, str)}
+            if item['strain_alias'] in strains:
+                plan.add('strain', 'reuse', item['strain_alias'])
+                continue
+            if item['pool_alias'] not in planned_pools:
+                planned_pools.add(item['pool_alias'])
+                if item['pool_alias'] in pools:
+                    plan.add('pool', 'reuse', item['pool_alias'])
+                else:
+                    plan.add('pool', 'create', item['pool_alias'], writes=1)
+            plan.add('strain', 'create', item['strain_alias'], writes=1)
+        return plan
+
+    def upload_strains(self, iloop, uploaded):
+        for item in self.iloop_args:
+            item = {k: v.strip() for k, v in item.items() if isinstance(v, str)}
+            if self.checkpoint.done('strain', item['strain_alias']):
+                uploaded.append(item['strain_alias'])
+                continue
             try:
                 iloop.Strain.one(where={'alias': item['strain_alias'], 'project': self.project})
             except ItemNotFound:
@@ -235,16 +439,23 @@ class StrainsUploader(AbstractDataUploader):
                                     is_reference=bool(item.get('is_reference', False)),
                                     organism=item['organism'],
                                     genotype=item['genotype'])
+            self.checkpoint.mark('strain', item['strain_alias'])
+            uploaded.append(item['strain_alias'])
 
 
 class ExperimentUploader(AbstractDataUploader):
     """uploader for experiment data
+
+    an existing experiment with a different date is archived and created anew if `overwrite`. With `incremental`,
+    existing experiments are instead updated in place, only measurements that were added, changed or removed
+    compared to iloop are sent, and samples no longer in the upload are deleted.
     """
 
     def __init__(self, project, type, sample_name, overwrite=True,
-                 synonym_mapper=place_holder_compound_synonym_mapper):
+                 synonym_mapper=place_holder_compound_synonym_mapper, incremental=False):
         super(ExperimentUploader, self).__init__(project)
         self.overwrite = overwrite
+        self.incremental = incremental
         self.synonym_mapper = synonym_mapper
         self.type = type
         self.sample_name = sample_name
@@ -252,11 +463,13 @@ class ExperimentUploader(AbstractDataUploader):
         self.assay_cols = ['unit', 'parameter', 'numerator_chebi', 'denominator_chebi']
         self.samples_df = None
         self.df = None
+        self._strains = {}
+        self._media = {}
 
     def extra_transformations(self):
-        self.df['numerator_chebi'] = self.df['numerator_compound_name'].apply(self.synonym_mapper)
-        self.df['denominator_chebi'] = self.df['denominator_compound_name'].apply(self.synonym_mapper)
-        self.df['test_id'] = self.df[self.assay_cols].apply(lambda x: '_'.join(str(i) for i in x), axis=1)
+        self.df['numerator_chebi'] = map_categorical(self.df['numerator_compound_name'], self.synonym_mapper)
+        self.df['denominator_chebi'] = map_categorical(self.df['denominator_compound_name'], self.synonym_mapper)
+        self.df['test_id'] = join_columns(self.df, self.assay_cols)
         if self.df[['sample_id', 'test_id']].duplicated().any():
             raise ValueError('found duplicated rows, should not have happened')
 
@@ -264,13 +477,46 @@ class ExperimentUploader(AbstractDataUploader):
         pass
 
     def upload_experiment_info(self, iloop):
+        """create the experiments, their identifiers are added to the identifier cache even if a later one fails"""
+        uploaded = []
+        try:
+            self.upload_experiments(iloop, uploaded)
+        finally:
+            iloop_cache.add('experiment', uploaded, project=self.project)
+
+    def experiment_properties(self):
+        """the experiments of the upload
+
+        :return: iterator of tuples with the experiment identifier, the row of experiment information and the
+        properties to create the experiment with
+        """
         conditions_keys = list(set(self.samples_df.columns.values).difference(set(self.experiment_keys)))
-        grouped_experiment = self.samples_df.groupby('experiment')
+        grouped_experiment = self.samples_df.groupby('experiment', observed=True)
         for exp_id, experiment in grouped_experiment:
             exp_info = experiment[self.experiment_keys].drop_duplicates()
             exp_info = next(exp_info.itertuples())
+            sample_info = experiment[conditions_keys].set_index(self.sample_name)
+            conditions = _cast_non_str_to_float(experiment[self.experiment_keys].iloc[0].to_dict())
+            conditions = {key: value for key, value in conditions.items() if not _isnan(value)}
+            yield exp_id, exp_info, {'date': parse_date(exp_info.date),
+                                     'description': exp_info.description,
+                                     'attributes': {'conditions': conditions,
+                                                    'operation': sample_info.to_dict()['operation'],
+                                                    'temperature': float(exp_info.temperature)}}
+
+    def upload_experiments(self, iloop, uploaded):
+        for exp_id, exp_info, properties in self.experiment_properties():
+            if self.checkpoint.done('experiment', exp_id):
+                uploaded.append(exp_id)
+                continue
             try:
                 existing = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
+                if self.incremental:
+                    self.update_experiment(existing, exp_info, properties)
+                    # the samples of the experiment are diffed against iloop rather than added
+                    self.checkpoint.mark('experiment', exp_id, value='existing')
+                    uploaded.append(exp_id)
+                    continue
                 timestamp = existing.date.strftime('%Y-%m-%d')
                 if str(timestamp) != exp_info.date:
                     if not self.overwrite:
@@ -281,17 +527,171 @@ class ExperimentUploader(AbstractDataUploader):
                         raise ItemNotFound
             except ItemNotFound:
                 logger.info('creating new experiment {}'.format(exp_id))
-                sample_info = experiment[conditions_keys].set_index(self.sample_name)
-                conditions = _cast_non_str_to_float(experiment[self.experiment_keys].iloc[0].to_dict())
-                conditions = {key: value for key, value in conditions.items() if not _isnan(value)}
-                iloop.Experiment.create(project=self.project,
-                                        type=self.type,
-                                        identifier=exp_id,
-                                        date=parse_date(exp_info.date),
-                                        description=exp_info.description,
-                                        attributes={'conditions': conditions,
-                                                    'operation': sample_info.to_dict()['operation'],
-                                                    'temperature': float(exp_info.temperature)})
+                iloop.Experiment.create(project=self.project, type=self.type, identifier=exp_id, **properties)
+            self.checkpoint.mark('experiment', exp_id)
+            uploaded.append(exp_id)
+
+    def plan_experiments(self, iloop, plan):
+        """add the experiments to a plan
+
+        :param iloop: iloop client
+        :param plan: the plan
+        :return dict: experiment identifier to the existing experiment, for the experiments that are kept
+        """
+        existing = {experiment.identifier: experiment
+                    for experiment in iloop.Experiment.instances(where={'project': self.project})}
+        kept = {}
+        for exp_id, exp_info, properties in self.experiment_properties():
+            experiment = existing.get(exp_id)
+            if experiment is None:
+                plan.add('experiment', 'create', exp_id, writes=1)
+            elif self.incremental:
+                changed = self.changed_properties(experiment, exp_info, properties)
+                plan.add('experiment', 'update' if changed else 'reuse', exp_id, writes=1 if changed else 0)
+                kept[exp_id] = experiment
+            elif experiment.date.strftime('%Y-%m-%d') != exp_info.date:
+                if self.overwrite:
+                    plan.add('experiment', 'archive', exp_id, writes=2)
+                else:
+                    plan.add('experiment', 'conflict', exp_id)
+            else:
+                plan.add('experiment', 'reuse', exp_id)
+                kept[exp_id] = experiment
+        return kept
+
+    def plan_samples(self, iloop, plan, exp_id, sample_names, experiment):
+        """add the samples of an experiment added with `add_samples` to a plan
+
+        :param iloop: iloop client
+        :param plan: the plan
+        :param exp_id: the experiment identifier
+        :param sample_names: the names of the samples in the upload
+        :param experiment: the existing experiment if it is kept, otherwise None
+        """
+        if experiment is None or not self.incremental:
+            for name in sample_names:
+                plan.add('sample', 'create', name)
+            plan.add('scalars', 'create', exp_id, writes=1)
+            return
+        existing = set(sample.name for sample in iloop.Sample.instances(where={'experiment': experiment}))
+        for name in sample_names:
+            plan.add('sample', 'update' if name in existing else 'create', name)
+        for name in sorted(existing - set(sample_names)):
+            plan.add('sample', 'delete', name, writes=1)
+        # which values differ is only known when uploading, expect them to be sent and some removed
+        plan.add('scalars', 'update', exp_id, writes=2)
+
+    def plan_phases(self, iloop, plan, exp_id, df, experiment):
+        """add the phases of an experiment to a plan
+
+        :param df: data frame with the 'phase_start' and 'phase_end' of the upload to the experiment
+        :param experiment: the existing experiment if it is kept, otherwise None
+        """
+        existing = PhaseRegistry(iloop).existing(experiment) if experiment is not None else {}
+        for start, end in df[['phase_start', 'phase_end']].drop_duplicates().itertuples(index=False):
+            phase = float(start), float(end)
+            title = '{} {}__{}'.format(exp_id, *phase)
+            if phase in existing:
+                plan.add('phase', 'reuse', title)
+            else:
+                plan.add('phase', 'create', title, writes=1)
+
+    @staticmethod
+    def changed_properties(existing, exp_info, properties):
+        """the properties of an existing experiment that differ from the upload"""
+        changed = {}
+        if existing.date.strftime('%Y-%m-%d') != exp_info.date:
+            changed['date'] = properties['date']
+        for key in ('description', 'attributes'):
+            if getattr(existing, key, None) != properties[key]:
+                changed[key] = properties[key]
+        return changed
+
+    def update_experiment(self, existing, exp_info, properties):
+        """update the properties of an existing experiment that differ from the upload"""
+        changed = self.changed_properties(existing, exp_info, properties)
+        if changed:
+            logger.info('updating {} of experiment {}'.format(', '.join(sorted(changed)), existing.identifier))
+            existing.update(**changed)
+
+    def pipeline(self, what, units, prepare, send):
+        """prepare the payload of each unit of an upload, e.g. an experiment, and send it to iloop
+
+        Payloads are sent `Default.EXPERIMENT_UPLOAD_CONCURRENCY` at a time by worker threads while the next ones are
+        prepared, so that preparing and sending overlap. At most that many prepared payloads wait to be sent.
+
+        :param what: the kind of unit, for error messages
+        :param units: iterable of the key of a unit and its data frame
+        :param prepare: function of key and data frame returning the payload, called in the calling thread
+        :param send: function of key and payload sending it to iloop
+        :raise UploadError: listing the units that failed to send, after all units have been tried
+        """
+        concurrency = Default.EXPERIMENT_UPLOAD_CONCURRENCY
+        errors = []
+
+        def collect(key, future):
+            try:
+                future.result()
+            except (ItemNotFound, HTTPError) as error:
+                logger.warning('failed to upload {} {}: {}'.format(what, key, error))
+                errors.append({'message': 'failed to upload {} {}: {}'.format(what, key, error)})
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            sending = deque()
+            for key, df in units:
+                sending.append((key, executor.submit(send, key, prepare(key, df))))
+                if len(sending) > concurrency:
+                    collect(*sending.popleft())
+            while sending:
+                collect(*sending.popleft())
+        if errors:
+            raise UploadError({'valid': False, 'error-count': len(errors), 'tables': [{'errors': errors}]})
+
+    def strain(self, iloop, alias):
+        """the strain of the project with an alias, looked up once per upload"""
+        if alias not in self._strains:
+            self._strains[alias] = iloop.Strain.one(where={'alias': alias, 'project': self.project})
+        return self._strains[alias]
+
+    def medium(self, iloop, name):
+        """the medium with a name, looked up once per upload"""
+        if name not in self._media:
+            self._media[name] = iloop.Medium.one(where={'name': name})
+        return self._media[name]
+
+    def add_samples(self, iloop, exp_id, experiment_object, samples, scalars):
+        """add the samples and scalars of an experiment, or only the difference to iloop for experiments updated
+        incrementally
+
+        :param iloop: iloop client
+        :param exp_id: the experiment identifier
+        :param experiment_object: the experiment
+        :param samples: dict of sample name to the sample definition
+        :param scalars: list of scalars, see `upload.diff`
+        """
+        if self.checkpoint.get('experiment', exp_id) != 'existing':
+            experiment_object.add_samples({'samples': samples, 'scalars': scalars})
+            return
+        current = experiment_object.read_scalars()
+        diff = diff_scalars(current, scalars)
+        # changed values are removed before the new ones are added, iloop would otherwise keep both
+        replaced = diff.changed & set(scalar_values(current))
+        # samples without any values are not in the scalars, so the samples of the experiment are listed
+        existing = {sample.name: sample for sample in iloop.Sample.instances(where={'experiment': experiment_object})}
+        removed_samples = set(existing) - set(samples)
+        new_samples = set(samples) - set(existing)
+        logger.info('experiment {}: {} values added or changed, {} removed, {} samples added, {} removed'.format(
+            exp_id, len(diff.changed), len(diff.removed), len(new_samples), len(removed_samples)))
+        removed = select_scalars(current, diff.removed | replaced)
+        # the values of removed samples go with the samples
+        removed = [scalar for scalar in removed if not set(scalar['measurements']) <= removed_samples]
+        if removed:
+            experiment_object.remove_scalars({'scalars': removed})
+        for sample_name in sorted(removed_samples):
+            existing[sample_name].delete()
+        if new_samples or diff.changed:
+            experiment_object.add_samples({'samples': {name: samples[name] for name in new_samples},
+                                           'scalars': select_scalars(scalars, diff.changed)})
 
 
 class FermentationUploader(ExperimentUploader):
@@ -305,60 +705,73 @@ class FermentationUploader(ExperimentUploader):
     :param project: project object
     :param samples_file_name: name of the csv file to read
     :param physiology_file_name: name of the csv file to read
+    :param incremental: update existing experiments with only the differences, see `ExperimentUploader`
+    :param samples_row_numbers: the row numbers to report for the rows of the samples file, see `DataFrameInspector`
+    :param physiology_row_numbers: the row numbers to report for the rows of the physiology file
+    :param temp_dir: directory for the temporary files of the inspection, see `DataFrameInspector`
     """
 
     def __init__(self, project, samples_file_name, physiology_file_name, custom_checks, overwrite=True,
-                 synonym_mapper=place_holder_compound_synonym_mapper):
+                 synonym_mapper=place_holder_compound_synonym_mapper, incremental=False, samples_row_numbers=None,
+                 physiology_row_numbers=None, temp_dir=None):
         super(FermentationUploader, self).__init__(project, type='fermentation', sample_name='reactor',
-                                                   overwrite=overwrite, synonym_mapper=synonym_mapper)
+                                                   overwrite=overwrite, synonym_mapper=synonym_mapper,
+                                                   incremental=incremental)
         self.assay_cols.extend(['phase_start', 'phase_end'])
         self.experiment_keys = ['experiment', 'description', 'date', 'do', 'gas', 'gasflow', 'ph_set', 'ph_correction',
                                 'stirrer', 'temperature']
-        self.samples_df = inspected_data_frame(samples_file_name, 'sample_information', custom_checks=custom_checks)
+        samples_validator = DataFrameInspector(samples_file_name, 'sample_information', custom_checks=custom_checks,
+                                               row_numbers=samples_row_numbers, temp_dir=temp_dir)
+        physiology_validator = DataFrameInspector(physiology_file_name, 'physiology', custom_checks=custom_checks,
+                                                  row_numbers=physiology_row_numbers, temp_dir=temp_dir)
+        physiology_validator.schema = schema_registry['physiology'].descriptor(
+            {'name': sample_id,
+             'title': 'measurements for {}'.format(sample_id),
+             'type': 'number'} for sample_id in read_sample_ids(samples_file_name))
+        inspect_concurrently([samples_validator, physiology_validator])
+        self.samples_df = samples_validator.read()
         self.samples_df['sample_id'] = self.samples_df[['experiment', 'reactor']].apply(lambda x: '_'.join(x), axis=1)
-        sample_ids = self.samples_df['sample_id'].copy()
-        sample_ids.sort_values(inplace=True)
-        physiology_validator = DataFrameInspector(physiology_file_name, 'physiology', custom_checks=custom_checks)
-        with open(physiology_validator.schema) as json_schema:
-            physiology_schema = json.load(json_schema)
-        for sample_id in sample_ids:
-            physiology_schema['fields'].append({
-                'name': sample_id,
-                'title': 'measurements for {}'.format(sample_id),
-                'type': 'number'
-            })
-        physiology_validator.schema = json.dumps(physiology_schema)
-        self.physiology_df = physiology_validator()
-        sample_cols = ['sample_id', 'experiment', 'reactor', 'operation',
-                       'feed_medium', 'batch_medium', 'strain']
-        self.df = (pd.melt(self.physiology_df,
-                           id_vars=['phase_start', 'phase_end', 'quantity', 'parameter',
-                                    'denominator_compound_name', 'numerator_compound_name', 'unit'],
-                           var_name='sample_id')
-                   .merge(self.samples_df[sample_cols], on='sample_id'))
+        self.physiology_df = physiology_validator.read()
+        sample_cols = ['experiment', 'reactor', 'operation', 'feed_medium', 'batch_medium', 'strain']
+        self.df = melt_samples(self.physiology_df,
+                               id_vars=['phase_start', 'phase_end', 'quantity', 'parameter',
+                                        'denominator_compound_name', 'numerator_compound_name', 'unit'],
+                               samples=self.samples_df, sample_cols=sample_cols)
         self.extra_transformations()
 
     def upload(self, iloop):
         self.upload_experiment_info(iloop)
         self.upload_physiology(iloop)
 
+    def plan(self, iloop):
+        plan = UploadPlan()
+        kept = self.plan_experiments(iloop, plan)
+        for exp_id, experiment in self.df.groupby('experiment', observed=True):
+            self.plan_phases(iloop, plan, exp_id, experiment, kept.get(exp_id))
+            self.plan_samples(iloop, plan, exp_id, experiment['reactor'].unique(), kept.get(exp_id))
+        return plan
+
     def upload_physiology(self, iloop):
-        for exp_id, experiment in self.df.groupby(['experiment']):
+        phases = PhaseRegistry(iloop)
+        experiments = {}
+
+        def prepare(exp_id, experiment):
             scalars = []
             sample_dict = {}
-            experiment_object = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
+            experiments[exp_id] = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
             sample_info = experiment[['feed_medium', 'batch_medium', 'reactor', 'strain']].drop_duplicates()
             for sample in sample_info.itertuples():
                 sample_dict[sample.reactor] = {
                     'name': sample.reactor,
-                    'strain': iloop.Strain.one(where={'alias': sample.strain, 'project': self.project}),
-                    'medium': iloop.Medium.one(where={'name': sample.batch_medium}),
-                    'feed_medium': iloop.Medium.one(where={'name': sample.feed_medium})
+                    'strain': self.strain(iloop, sample.strain),
+                    'medium': self.medium(iloop, sample.batch_medium),
+                    'feed_medium': self.medium(iloop, sample.feed_medium)
                 }
-            for phase_num, phase in experiment.groupby(['phase_start', 'phase_end']):
-                phase_object = get_create_phase(iloop, float(phase.phase_start.iloc[0]),
-                                                float(phase.phase_end.iloc[0]), experiment_object)
-                for test_id, assay in phase.groupby('test_id'):
+            phase_bounds = experiment[['phase_start', 'phase_end']].drop_duplicates()
+            phases.prepare(experiments[exp_id], phase_bounds.itertuples(index=False))
+            for phase_num, phase in experiment.groupby(['phase_start', 'phase_end'], observed=True):
+                phase_object = phases.get(experiments[exp_id], phase.phase_start.iloc[0], phase.phase_end.iloc[0])
+                for test_id, assay in phase.groupby('test_id', observed=True):
                     row = assay.iloc[0].copy()
                     test = measurement_test(row.unit, row.parameter, row.numerator_chebi, row.denominator_chebi,
                                             row.quantity)
@@ -368,25 +781,39 @@ class FermentationUploader(ExperimentUploader):
                         'phase': phase_object
                     }
                     scalars.append(a_scalar)
-            experiment_object.add_samples({'samples': sample_dict, 'scalars': scalars})
+            return sample_dict, scalars
+
+        def send(exp_id, payload):
+            self.add_samples(iloop, exp_id, experiments.pop(exp_id), *payload)
+            self.checkpoint.mark('samples', exp_id)
+
+        self.pipeline('experiment', ((exp_id, experiment)
+                                     for exp_id, experiment in self.df.groupby('experiment', observed=True)
+                                     if not self.checkpoint.done('samples', exp_id)), prepare, send)
 
 
 class ScreenUploader(ExperimentUploader):
     """uploader for screening data
+
+    :param row_numbers: the row numbers to report for the rows of the file, see `DataFrameInspector`
+    :param temp_dir: directory for the temporary files of the inspection, see `DataFrameInspector`
     """
 
     def __init__(self, project, file_name, custom_checks, overwrite=True,
-                 synonym_mapper=place_holder_compound_synonym_mapper):
+                 synonym_mapper=place_holder_compound_synonym_mapper, incremental=False, row_numbers=None,
+                 temp_dir=None):
         super(ScreenUploader, self).__init__(project, type='screening', sample_name='well',
-                                             overwrite=overwrite, synonym_mapper=synonym_mapper)
+                                             overwrite=overwrite, synonym_mapper=synonym_mapper,
+                                             incremental=incremental)
         self.experiment_keys = ['project', 'experiment', 'description', 'date', 'temperature']
-        self.df = inspected_data_frame(file_name, 'screen', custom_checks=custom_checks)
+        self.df = compact_frame(inspected_data_frame(file_name, 'screen', custom_checks=custom_checks,
+                                                     row_numbers=row_numbers, temp_dir=temp_dir))
         self.df['project'] = self.project.code
-        self.df['barcode'] = self.df[['project', 'experiment', 'plate_name']].apply(lambda x: '_'.join(x), axis=1)
-        self.df['well'] = self.df[['row', 'column']].apply(lambda x: ''.join(str(y) for y in x), axis=1)
-        self.df['sample_id'] = self.df[['barcode', 'well']].apply(lambda x: '_'.join(x), axis=1)
+        self.df['barcode'] = join_columns(self.df, ['project', 'experiment', 'plate_name'])
+        self.df['well'] = join_columns(self.df, ['row', 'column'], sep='')
+        self.df['sample_id'] = join_columns(self.df, ['barcode', 'well'])
         self.samples_df = self.df
-        self.df.dropna(0, subset=['value'], inplace=True)
+        self.df.dropna(subset=['value'], inplace=True)
         self.extra_transformations()
 
     def upload(self, iloop):
@@ -394,32 +821,56 @@ class ScreenUploader(ExperimentUploader):
         self.upload_plates(iloop)
         self.upload_screen(iloop)
 
+    def plan(self, iloop):
+        plan = UploadPlan()
+        kept = self.plan_experiments(iloop, plan)
+        plates = set(plate.barcode for plate in iloop.Plate.instances(where={'project': self.project}))
+        for barcode in self.df['barcode'].unique():
+            # existing plates get their contents updated
+            plan.add('plate', 'update' if barcode in plates else 'create', barcode, writes=1)
+        for exp_id, experiment in self.df.groupby('experiment', observed=True):
+            self.plan_samples(iloop, plan, exp_id, experiment['sample_id'].unique(), kept.get(exp_id))
+        return plan
+
     def upload_plates(self, iloop):
-        for exp_id, experiment in self.df.groupby(['experiment']):
-            experiment_object = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
-            plates_df = self.df[['experiment', 'barcode', 'well', 'medium', 'strain', 'plate_model']].drop_duplicates()
-            for barcode, plate in plates_df.groupby(['barcode']):
-                plate_info = plate[['well', 'medium', 'strain']].set_index('well')
-                contents = {}
-                for well in plate_info.itertuples():
-                    contents[well.Index] = {
-                        'strain': iloop.Strain.one(where={'alias': well.strain, 'project': self.project}),
-                        'medium': iloop.Medium.one(where={'name': well.medium})
-                    }
-                try:
-                    plate = iloop.Plate.one(where={'barcode': barcode, 'project': self.project})
-                    plate.update_contents(contents)
-                except ItemNotFound:
-                    iloop.Plate.create(barcode=barcode, experiment=experiment_object, contents=contents,
-                                       type=plate.plate_model[0], project=self.project)
+        experiments = {}
+        plates_df = self.df[['experiment', 'barcode', 'well', 'medium', 'strain', 'plate_model']].drop_duplicates()
+
+        def prepare(barcode, plate):
+            exp_id = plate['experiment'].iat[0]
+            if exp_id not in experiments:
+                experiments[exp_id] = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
+            plate_info = plate[['well', 'medium', 'strain']].set_index('well')
+            contents = {}
+            for well in plate_info.itertuples():
+                contents[well.Index] = {
+                    'strain': self.strain(iloop, well.strain),
+                    'medium': self.medium(iloop, well.medium)
+                }
+            return experiments[exp_id], contents, plate.plate_model.iat[0]
+
+        def send(barcode, payload):
+            experiment_object, contents, plate_model = payload
+            try:
+                plate = iloop.Plate.one(where={'barcode': barcode, 'project': self.project})
+                plate.update_contents(contents)
+            except ItemNotFound:
+                iloop.Plate.create(barcode=barcode, experiment=experiment_object, contents=contents,
+                                   type=plate_model, project=self.project)
+            self.checkpoint.mark('plate', barcode)
+
+        self.pipeline('plate', ((barcode, plate) for barcode, plate in plates_df.groupby('barcode', observed=True)
+                                if not self.checkpoint.done('plate', barcode)), prepare, send)
 
     def upload_screen(self, iloop):
-        for exp_id, experiment in self.df.groupby(['experiment']):
-            experiment_object = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
+        experiments = {}
+
+        def prepare(exp_id, experiment):
+            experiments[exp_id] = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
             sample_dict = {}
             scalars = []
 
-            for barcode, plate in experiment.groupby(['barcode']):
+            for barcode, plate in experiment.groupby('barcode', observed=True):
                 sample_info = plate[['sample_id', 'well']].drop_duplicates()
                 plate_object = iloop.Plate.one(where={'barcode': barcode, 'project': self.project})
                 for sample in sample_info.itertuples():
@@ -428,7 +879,7 @@ class ScreenUploader(ExperimentUploader):
                         'position': sample.well,
                     }
 
-            for test_id, assay in experiment.groupby('test_id'):
+            for test_id, assay in experiment.groupby('test_id', observed=True):
                 row = assay.iloc[0].copy()
                 test = measurement_test(row.unit, row.parameter, row.numerator_chebi, row.denominator_chebi,
                                         row.quantity)
@@ -438,65 +889,232 @@ class ScreenUploader(ExperimentUploader):
                     'test': deepcopy(test),
                 }
                 scalars.append(a_scalar)
-            experiment_object.add_samples({'samples': sample_dict, 'scalars': scalars})
+            return sample_dict, scalars
 
+        def send(exp_id, payload):
+            self.add_samples(iloop, exp_id, experiments.pop(exp_id), *payload)
+            self.checkpoint.mark('samples', exp_id)
 
-class XrefMeasurementUploader(ExperimentUploader):
-    """uploader for data associated with an entity define in an external database, e.g. a sequence or a reaction
+        self.pipeline('experiment', ((exp_id, experiment)
+                                     for exp_id, experiment in self.df.groupby('experiment', observed=True)
+                                     if not self.checkpoint.done('samples', exp_id)), prepare, send)
+
+
+class XrefUploader(ExperimentUploader):
+    """base of the uploaders for data associated with an entity defined in an external database, e.g. a sequence or a
+    reaction
+
+    `df` has a row per sample, or per measurement of a sample, with its experiment, phase, medium and strain.
+    Subclasses read the upload and send its measurements with `upload_measurements`.
+
+    :param project: project object
+    :param subject_type: 'protein' or 'reaction'
     """
 
-    def __init__(self, project, file_name, custom_checks, subject_type, overwrite=True):
-        super(XrefMeasurementUploader, self).__init__(project, type='fermentation', sample_name='sample_name',
-                                                      overwrite=overwrite)
+    def __init__(self, project, subject_type, overwrite=True):
+        super(XrefUploader, self).__init__(project, type='fermentation', sample_name='sample_name',
+                                           overwrite=overwrite)
         self.experiment_keys = ['project', 'experiment', 'description', 'date', 'temperature']
-        inspection_key = dict(protein='protein_abundances', reaction='fluxes')[subject_type]
-        self.df = inspected_data_frame(file_name, inspection_key, custom_checks=custom_checks)
-        self.df['project'] = self.project.code
-        self.samples_df = self.df
         self.subject_type = subject_type
-        self.df.dropna(0, subset=['value'], inplace=True)
 
     def upload(self, iloop):
         self.upload_experiment_info(iloop)
         self.upload_sample_info(iloop)
         self.upload_measurements(iloop)
 
+    def plan(self, iloop):
+        plan = UploadPlan()
+        kept = self.plan_experiments(iloop, plan)
+        for exp_id, experiment in self.df.groupby('experiment', observed=True):
+            existing = set()
+            if exp_id in kept:
+                existing = set(sample.name for sample in iloop.Sample.instances(where={'experiment': kept[exp_id]}))
+            for name in experiment['sample_name'].unique():
+                if name in existing:
+                    plan.add('sample', 'reuse', name)
+                else:
+                    plan.add('sample', 'create', name, writes=1)
+            self.plan_phases(iloop, plan, exp_id, experiment, kept.get(exp_id))
+            measurements = experiment[['sample_name', 'phase_start', 'phase_end']].drop_duplicates()
+            for sample_name, phase_start, phase_end in measurements.itertuples(index=False):
+                plan.add('measurements', 'create', '{} {}__{}'.format(sample_name, phase_start, phase_end), writes=1)
+        return plan
+
     def upload_sample_info(self, iloop):
+        """create the samples that are missing in their experiments
+
+        Experiments, media and strains are looked up once each, and the existing samples of an experiment are listed
+        with one request. Missing samples are created `Default.SAMPLE_UPLOAD_CONCURRENCY` at a time.
+
+        :raise UploadError: listing the samples that failed, after all samples have been tried
+        """
         sample_info = self.df[['experiment', 'medium', 'sample_name', 'strain']].drop_duplicates()
-        for sample in sample_info.itertuples():
-            experiment = iloop.Experiment.one(where={'identifier': sample.experiment, 'project': self.project})
+        samples = [sample for sample in sample_info.itertuples()
+                   if not self.checkpoint.done('sample', sample.experiment, sample.sample_name)]
+        experiments = {exp_id: iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
+                       for exp_id in sorted(set(sample.experiment for sample in samples))}
+        existing = {exp_id: set(sample.name for sample in iloop.Sample.instances(where={'experiment': experiment}))
+                    for exp_id, experiment in experiments.items()}
+        missing = []
+        for sample in samples:
+            if sample.sample_name in existing[sample.experiment]:
+                self.checkpoint.mark('sample', sample.experiment, sample.sample_name)
+            else:
+                missing.append(sample)
+        media = {name: iloop.Medium.one(where={'name': name}) for name in set(sample.medium for sample in missing)}
+        strains = {alias: iloop.Strain.one(where={'alias': alias, 'project': self.project})
+                   for alias in set(sample.strain for sample in missing)}
+        with ThreadPoolExecutor(max_workers=Default.SAMPLE_UPLOAD_CONCURRENCY) as executor:
+            futures = [(sample, executor.submit(self.create_sample, iloop, sample, experiments[sample.experiment],
+                                                media[sample.medium], strains[sample.strain]))
+                       for sample in missing]
+        errors = []
+        for sample, future in futures:
             try:
-                return iloop.Sample.one(where={'name': sample.sample_name, 'experiment': experiment})
-            except ItemNotFound:
-                logger.info('creating new sample {}'.format(sample.sample_name))
-                medium = iloop.Medium.one(where={'name': sample.medium})
-                strain = iloop.Strain.one(where={'alias': sample.strain, 'project': self.project})
-                iloop.Sample.create(experiment=experiment,
-                                    project=self.project,
-                                    name=sample.sample_name,
-                                    medium=medium,
-                                    strain=strain)
+                future.result()
+            except (ItemNotFound, HTTPError) as error:
+                logger.warning('failed to create sample {}: {}'.format(sample.sample_name, error))
+                errors.append({'message': 'failed to create sample {} of experiment {}: {}'.format(
+                    sample.sample_name, sample.experiment, error)})
+        if errors:
+            raise UploadError({'valid': False, 'error-count': len(errors), 'tables': [{'errors': errors}]})
+
+    def create_sample(self, iloop, sample, experiment, medium, strain):
+        logger.info('creating new sample {}'.format(sample.sample_name))
+        iloop.Sample.create(experiment=experiment,
+                            project=self.project,
+                            name=sample.sample_name,
+                            medium=medium,
+                            strain=strain)
+        self.checkpoint.mark('sample', sample.experiment, sample.sample_name)
+
+    def upload_measurements(self, iloop):
+        raise NotImplementedError
+
+    def measurement_targets(self, iloop, units):
+        """the samples and phases to add measurements to
+
+        Experiments, their samples and their phases are resolved once rather than per unit.
+
+        :param units: list of (experiment id, sample name, phase start, phase end)
+        :return generator: (sample, phase) for each unit, in order
+        :raise ItemNotFound: if a sample does not exist
+        """
+        experiments = {}
+        samples = {}
+        phases = PhaseRegistry(iloop)
+        for exp_id in sorted(set(unit[0] for unit in units)):
+            experiments[exp_id] = iloop.Experiment.one(where={'identifier': exp_id, 'project': self.project})
+            samples[exp_id] = {sample.name: sample
+                               for sample in iloop.Sample.instances(where={'experiment': experiments[exp_id]})}
+            phases.prepare(experiments[exp_id], [unit[2:] for unit in units if unit[0] == exp_id])
+        for exp_id, sample_name, phase_start, phase_end in units:
+            sample_object = samples[exp_id].get(sample_name)
+            if sample_object is None:
+                raise ItemNotFound('missing sample {} of experiment {}'.format(sample_name, exp_id))
+            yield sample_object, phases.get(experiments[exp_id], phase_start, phase_end)
+
+
+class XrefMeasurementUploader(XrefUploader):
+    """uploader for data associated with an entity define in an external database, e.g. a sequence or a reaction
+
+    :param row_numbers: the row numbers to report for the rows of the file, see `DataFrameInspector`
+    :param temp_dir: directory for the temporary files of the inspection, see `DataFrameInspector`
+    """
+
+    def __init__(self, project, file_name, custom_checks, subject_type, overwrite=True, row_numbers=None,
+                 temp_dir=None):
+        super(XrefMeasurementUploader, self).__init__(project, subject_type, overwrite=overwrite)
+        inspection_key = dict(protein='protein_abundances', reaction='fluxes')[subject_type]
+        self.df = compact_frame(inspected_data_frame(file_name, inspection_key, custom_checks=custom_checks,
+                                                     row_numbers=row_numbers, temp_dir=temp_dir))
+        self.df['project'] = self.project.code
+        self.samples_df = self.df
+        self.df.dropna(subset=['value'], inplace=True)
 
     def upload_measurements(self, iloop):
-        accessions_df = self.df['xref_id'].str.split(':', expand=True)
-        accessions_df.columns = ['db_name', 'accession']
-        self.df = self.df.join(accessions_df)
-        measurement_grouping = self.df.groupby(['sample_name', 'phase_start', 'phase_end'])
+        self.df['db_name'] = map_categorical(self.df['xref_id'], partial(_xref_part, 0))
+        self.df['accession'] = map_categorical(self.df['xref_id'], partial(_xref_part, 1))
+        measurement_grouping = self.df.groupby(['sample_name', 'phase_start', 'phase_end'], observed=True)
         unique_df = measurement_grouping[['mode', 'db_name']].nunique()
         if (unique_df['mode'] != 1).any() or (unique_df['db_name'] != 1).any():
             raise ValueError('multiple mode/db_names in upload not supported')
-        for grouping, df in measurement_grouping:
+        groups = [(grouping, df) for grouping, df in measurement_grouping
+                  if not self.checkpoint.done('measurements', *grouping)]
+        targets = self.measurement_targets(iloop, [(df['experiment'].iat[0],) + grouping for grouping, df in groups])
+        for (grouping, df), (sample_object, phase_object) in zip(groups, targets):
             sample_name, phase_start, phase_end = grouping
-            experiment_object = iloop.Experiment.one(where={'identifier': df['experiment'].iat[0],
-                                                            'project': self.project})
-            sample_object = iloop.Sample.one(where={'name': sample_name, 'experiment': experiment_object})
-            phase_object = get_create_phase(iloop, float(phase_start), float(phase_end),
-                                            sample_object.experiment)
             sample_object.add_xref_measurements(phase=phase_object, type=self.subject_type,
                                                 values=df['value'].tolist(),
                                                 accessions=df['accession'].tolist(),
                                                 db_name=df['db_name'].iat[0],
                                                 mode=df['mode'].iat[0])
+            self.checkpoint.mark('measurements', sample_name, phase_start, phase_end)
+
+
+class XrefMatrixUploader(XrefUploader):
+    """uploader for xref measurements given as a table of samples and a matrix of values
+
+    Like `XrefMeasurementUploader` but the measurements are a column of values per sample, with a row per reaction
+    or protein, and the experiment, phase, medium, strain and mode of each sample are in a separate table. Validate
+    with 'xref_samples_schema.json' and 'xref_matrix_schema.json'. The values are sent a sample column at a time
+    without making the long format table.
+
+    :param project: project object
+    :param samples_file_name: name of the csv file with a row per sample, or a data frame
+    :param matrix_file_name: name of the csv file with the 'xref_id' column and a column per sample, or a data frame
+    :param subject_type: 'protein' or 'reaction'
+    :param samples_row_numbers: the row numbers to report for the rows of the samples file, see `DataFrameInspector`
+    :param matrix_row_numbers: the row numbers to report for the rows of the matrix file
+    :param temp_dir: directory for the temporary files of the inspection, see `DataFrameInspector`
+    """
+
+    def __init__(self, project, samples_file_name, matrix_file_name, custom_checks, subject_type, overwrite=True,
+                 samples_row_numbers=None, matrix_row_numbers=None, temp_dir=None):
+        super(XrefMatrixUploader, self).__init__(project, subject_type, overwrite=overwrite)
+        samples_validator = DataFrameInspector(samples_file_name, 'xref_samples', custom_checks=custom_checks,
+                                               row_numbers=samples_row_numbers, temp_dir=temp_dir)
+        matrix_validator = DataFrameInspector(matrix_file_name, 'xref_matrix', custom_checks=custom_checks,
+                                              row_numbers=matrix_row_numbers, temp_dir=temp_dir)
+        matrix_validator.schema = schema_registry['xref_matrix'].descriptor(
+            {'name': sample_name,
+             'title': 'measurements for {}'.format(sample_name),
+             'type': 'number'} for sample_name in read_sample_names(samples_file_name))
+        inspect_concurrently([samples_validator, matrix_validator])
+        self.samples_df = compact_frame(samples_validator.read())
+        self.samples_df['project'] = self.project.code
+        self.df = self.samples_df
+        self.matrix_df = matrix_validator.read()
+        # xref identifiers are unique in the matrix, so they are split once each anyway
+        db_names = self.matrix_df['xref_id'].map(partial(_xref_part, 0))
+        if db_names.nunique() > 1:
+            raise ValidationError(error_report('expected identifiers of one database in column xref_id, found '
+                                               '{}'.format(', '.join(sorted(db_names.unique())))))
+        self.db_name = db_names.iat[0] if len(db_names) > 0 else None
+        self.accessions = self.matrix_df['xref_id'].map(partial(_xref_part, 1))
+
+    def upload_measurements(self, iloop):
+        samples = [sample for sample in self.samples_df[['experiment', 'sample_name', 'phase_start', 'phase_end',
+                                                         'mode']].itertuples(index=False)
+                   if not self.checkpoint.done('measurements', sample.sample_name, sample.phase_start,
+                                               sample.phase_end)]
+        targets = self.measurement_targets(iloop, [sample[:4] for sample in samples])
+        for sample, (sample_object, phase_object) in zip(samples, targets):
+            values = self.matrix_df[sample.sample_name]
+            measured = values.notna()
+            sample_object.add_xref_measurements(phase=phase_object, type=self.subject_type,
+                                                values=values[measured].astype(float).tolist(),
+                                                accessions=self.accessions[measured].tolist(),
+                                                db_name=self.db_name,
+                                                mode=sample.mode)
+            self.checkpoint.mark('measurements', sample.sample_name, sample.phase_start, sample.phase_end)
+
+
+def _xref_part(index, xref_id):
+    """database name (index 0) or accession (index 1) of an identifier such as 'bigg.reaction:PGI'"""
+    if not isinstance(xref_id, str):
+        return xref_id
+    return xref_id.split(':', 1)[index]
 
 
 def _cast_non_str_to_float(dictionary):
@@ -506,13 +1124,48 @@ def _cast_non_str_to_float(dictionary):
     return dictionary
 
 
-def get_create_phase(iloop, start, end, experiment):
-    try:
-        phase_object = iloop.ExperimentPhase.one(where={'start': start, 'end': end,
-                                                        'experiment': experiment})
-    except ItemNotFound:
-        phase_object = iloop.ExperimentPhase.create(experiment=experiment,
-                                                    start=start,
-                                                    end=end,
-                                                    title='{}__{}'.format(start, end))
-    return phase_object
+class PhaseRegistry(object):
+    """the phases of experiments, listed with one request per experiment and created when missing
+
+    Phases are identified by their experiment, start and end, so resolving the same phase again during an upload
+    takes no requests.
+
+    :param iloop: iloop client
+    """
+
+    def __init__(self, iloop):
+        self.iloop = iloop
+        # experiment id to (start, end) to the phase
+        self.phases = {}
+
+    def existing(self, experiment):
+        """the phases of an experiment, listed from iloop the first time
+
+        :return dict: (start, end) to the phase
+        """
+        if experiment.id not in self.phases:
+            self.phases[experiment.id] = {
+                (float(phase.start), float(phase.end)): phase
+                for phase in self.iloop.ExperimentPhase.instances(where={'experiment': experiment})}
+        return self.phases[experiment.id]
+
+    def prepare(self, experiment, phases):
+        """create the phases of an experiment that do not exist yet
+
+        :param experiment: the experiment
+        :param phases: iterable of (start, end) pairs
+        """
+        existing = self.existing(experiment)
+        for start, end in sorted(set((float(start), float(end)) for start, end in phases)):
+            if (start, end) not in existing:
+                existing[(start, end)] = self.iloop.ExperimentPhase.create(experiment=experiment,
+                                                                           start=start,
+                                                                           end=end,
+                                                                           title='{}__{}'.format(start, end))
+
+    def get(self, experiment, start, end):
+        """the phase of an experiment from start to end, created if it does not exist yet"""
+        start, end = float(start), float(end)
+        if (start, end) not in self.existing(experiment):
+            self.prepare(experiment, [(start, end)])
+        return self.phases[experiment.id][(start, end)]
@@ -0,0 +1,532 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import inspect
+import logging
+import os
+import re
+from collections import Counter, OrderedDict
+from functools import lru_cache, partial
+from tempfile import mkstemp
+
+
+logger = logging.getLogger(__name__)
+
+ROW_REFERENCE = re.compile(r'\b([Rr]ow) \d+\b')
+ROW_NUMBERS = re.compile(r'\b([Rr]ow(?:s|\(s\))?) (\d+(?:, \d+)*)\b')
+MAX_ROW_RANGES = 20
+
+
+class ValidationError(Exception):
+    """an uploaded table failed validation
+
+    :param report: goodtables style report describing the errors
+    """
+
+    def __init__(self, report):
+        super(ValidationError, self).__init__('{} validation error(s)'.format(report.get('error-count', 1)))
+        self.report = report
+
+
+def error_report(message):
+    """a report with a single error not tied to any row of the table
+
+    :param message: the error message
+    :return dict: the report
+    """
+    return {'valid': False, 'error-count': 1, 'tables': [{'errors': [{'message': message}]}]}
+
+
+def _renumber(error, row_numbers):
+    """copy of an error with its row numbers, also those in the message, mapped by `row_numbers`"""
+    error = dict(error)
+    if error.get('row-number') is not None:
+        error['row-number'] = row_numbers(error['row-number'])
+    error['message'] = ROW_NUMBERS.sub(
+        lambda match: '{} {}'.format(match.group(1), ', '.join(str(row_numbers(int(number)))
+                                                               for number in match.group(2).split(', '))),
+        error['message'])
+    return error
+
+
+def _format_ranges(ranges, count):
+    text = ', '.join(str(start) if start == end else '{}-{}'.format(start, end) for start, end in ranges)
+    n_listed = sum(end - start + 1 for start, end in ranges)
+    if count > n_listed:
+        text += ' and {} more'.format(count - n_listed)
+    return text
+
+
+class ErrorCollector(object):
+    """collect the errors of an inspection, collapsing identical errors and enforcing error caps
+
+    Errors that only differ in the row they were found in are kept as one entry listing the affected row ranges, up
+    to `MAX_ROW_RANGES` ranges per entry. At most `check_error_limit` entries are kept per check and error code, so
+    that one noisy custom check reporting e.g. 'bad-value' does not hide the errors of other checks, and at most
+    `error_limit` entries in total. Further errors are counted but not reported.
+
+    :param error_limit: maximum number of entries in the report
+    :param check_error_limit: maximum number of entries per check
+    :param row_numbers: function mapping the row numbers of the inspected table to those reported, e.g. the rows of
+    the sheet a csv file was written from, None to report them as is
+    """
+
+    def __init__(self, error_limit, check_error_limit, row_numbers=None):
+        self.error_limit = error_limit
+        self.check_error_limit = check_error_limit
+        self.row_numbers = row_numbers
+        self.entries = OrderedDict()
+        self.check_counts = Counter()
+        self.dropped = Counter()
+        self.error_count = 0
+
+    @property
+    def full(self):
+        return len(self.entries) >= self.error_limit
+
+    def add(self, error, check=None):
+        """add an error
+
+        :param error: goodtables error dict with row numbers relative to the whole table
+        :param check: name of the check that found the error, None for errors found by goodtables itself
+        :return bool: True if the error started a new entry in the report
+        """
+        self.error_count += 1
+        if self.row_numbers:
+            error = _renumber(error, self.row_numbers)
+        row_number = error.get('row-number')
+        key = (error['code'], error.get('column-number'), ROW_REFERENCE.sub(r'\1', error['message']))
+        if key in self.entries:
+            entry = self.entries[key]
+            if row_number is None:
+                # errors without a row, e.g. about the header, are found again in every chunk
+                self.error_count -= 1
+                return False
+            ranges = entry['row-ranges']
+            if ranges and ranges[-1][1] + 1 >= row_number:
+                ranges[-1][1] = max(ranges[-1][1], row_number)
+            elif len(ranges) < MAX_ROW_RANGES:
+                ranges.append([row_number, row_number])
+            entry['count'] += 1
+            return False
+        check_key = (check, error['code'])
+        if self.full or self.check_counts[check_key] >= self.check_error_limit:
+            self.dropped[check_key] += 1
+            return False
+        entry = dict(error)
+        entry['count'] = 1
+        entry['row-ranges'] = [[row_number, row_number]] if row_number is not None else []
+        self.entries[key] = entry
+        self.check_counts[check_key] += 1
+        return True
+
+    def errors(self):
+        """the collected entries, with messages of collapsed errors referring to all affected rows"""
+        errors = []
+        for entry in self.entries.values():
+            entry = dict(entry)
+            if entry['count'] > 1 and entry['row-ranges']:
+                rows = _format_ranges(entry['row-ranges'], entry['count'])
+                entry['message'] = ROW_REFERENCE.sub(lambda match: '{}s {}'.format(match.group(1), rows),
+                                                     entry['message'], count=1)
+            errors.append(entry)
+        return errors
+
+    def warnings(self):
+        warnings = []
+        for (check, code), count in sorted(self.dropped.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            found_by = ' of {}'.format(check) if check and check != code else ''
+            warnings.append('{} further "{}" error(s){} not reported, limit of {} errors per check or {} errors in '
+                            'total reached'.format(count, code, found_by, self.check_error_limit, self.error_limit))
+        return warnings
+
+
+def check(code, type=None, context=None, before=None, after=None):
+    """register a custom check like goodtables' `check` decorator, without importing goodtables"""
+    def decorator(func):
+        func.check = {'code': code, 'type': type, 'context': context, 'before': before, 'after': after}
+        return func
+    return decorator
+
+
+def check_name(func):
+    """name of a check function, its goodtables code if it is decorated with goodtables' `check`"""
+    spec = getattr(func, 'check', None)
+    if isinstance(spec, dict) and spec.get('code'):
+        return spec['code']
+    return getattr(getattr(func, 'func', func), '__name__', repr(func))
+
+
+class _CollectedCheck(object):
+    """body check passing its errors through an error collector
+
+    Row numbers are shifted by the offset of the chunk being inspected and the check state is kept across chunks,
+    so that e.g. duplicate rows are found in the whole table. Only errors that start a new report entry are handed on
+    to goodtables, so that its own error limit counts entries rather than repeated errors.
+    """
+
+    def __init__(self, func, collector):
+        self.check = func.check
+        self.name = check_name(func)
+        if 'order_fields' in inspect.signature(func).parameters:
+            func = partial(func, order_fields=True)
+        self.func = func
+        self.collector = collector
+        self.state = {}
+        self.offset = 0
+
+    def __call__(self, errors, columns, row_number, state):
+        found = []
+        self.func(found, columns, row_number + self.offset, self.state)
+        for error in found:
+            if self.collector.add(error, check=self.name):
+                error['_collected'] = True
+                errors.append(error)
+
+
+@lru_cache(maxsize=None)
+def builtin_body_checks():
+    """goodtables' own checks of table rows, imported at first use"""
+    from goodtables import checks as goodtables_checks
+    return [func for func in vars(goodtables_checks).values()
+            if hasattr(func, 'check') and 'row_number' in inspect.signature(func).parameters]
+
+
+def _chunks(file_name, chunk_size, temp_dir=None):
+    """split a csv file in files of at most `chunk_size` rows, each with the header of the original
+
+    Yields tuples of file name and row offset of the chunk. A file with no more than `chunk_size` rows is yielded
+    as is. Chunks are written to `temp_dir`, the default temporary directory if None, and removed once inspected.
+    """
+    with open(file_name, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        offset = 0
+        exhausted = False
+        while not exhausted:
+            file_description, chunk_file_name = mkstemp(suffix='.csv', dir=temp_dir)
+            n_rows = 0
+            with os.fdopen(file_description, 'w', newline='') as chunk_file:
+                writer = csv.writer(chunk_file)
+                writer.writerow(header or [])
+                for row in reader:
+                    writer.writerow(row)
+                    n_rows += 1
+                    if n_rows >= chunk_size:
+                        break
+                else:
+                    exhausted = True
+            if exhausted and offset == 0:
+                os.remove(chunk_file_name)
+                yield file_name, 0
+                return
+            try:
+                if n_rows or offset == 0:
+                    yield chunk_file_name, offset
+            finally:
+                os.remove(chunk_file_name)
+            offset += n_rows
+
+
+def inspect_table(file_name, schema, custom_checks=(), error_limit=1000, check_error_limit=100, chunk_size=None,
+                  row_numbers=None, temp_dir=None):
+    """inspect a csv file with goodtables in chunks of rows, with bounded error reporting
+
+    Chunks are inspected in order until the file is exhausted or `error_limit` distinct errors have been found.
+    Identical errors on different rows are collapsed to a single entry listing the row ranges, see `ErrorCollector`.
+
+    :param file_name: name of the csv file to inspect
+    :param schema: table schema descriptor
+    :param custom_checks: list of additional custom check functions to apply
+    :param error_limit: maximum number of errors in the report
+    :param check_error_limit: maximum number of errors per check in the report
+    :param chunk_size: number of rows to inspect at a time, all rows at once if None
+    :param row_numbers: function mapping the row numbers of the file to those to report, e.g. the `RowNumbers` of
+    a file written from a sheet, the row numbers of the file if None
+    :param temp_dir: directory to write the chunks to, e.g. that of the request, the default temporary directory if
+    None
+    :return dict: a goodtables report with one table
+    """
+    from goodtables import Inspector
+    collector = ErrorCollector(error_limit, check_error_limit, row_numbers=row_numbers)
+    checks = [_CollectedCheck(func, collector) for func in builtin_body_checks() + list(custom_checks)]
+    warnings = []
+    table = None
+    time = 0
+    row_count = 0
+    for chunk_file_name, offset in _chunks(file_name, chunk_size or float('inf'), temp_dir=temp_dir):
+        for check in checks:
+            check.offset = offset
+        inspector = Inspector(custom_checks=checks, order_fields=True,
+                              error_limit=error_limit - len(collector.entries),
+                              row_limit=(chunk_size or float('inf')) + 1)
+        report = inspector.inspect(chunk_file_name, preset='table', schema=schema)
+        time += report['time']
+        warnings.extend(warning for warning in report['warnings'] if 'limit' not in warning)
+        if not report['tables']:
+            break
+        chunk_table = report['tables'][0]
+        table = table or chunk_table
+        row_count = max(row_count, (chunk_table['row-count'] or 0) + offset)
+        for error in chunk_table['errors']:
+            if not error.pop('_collected', False):
+                collector.add(error)
+        if collector.full:
+            warnings.append('inspection of "{}" stopped after {} rows, error limit of {} reached'.format(
+                file_name, row_count, error_limit))
+            break
+    warnings.extend(collector.warnings())
+    errors = collector.errors()
+    tables = []
+    if table is not None:
+        table.update({
+            'time': time,
+            'valid': not errors,
+            'error-count': collector.error_count,
+            'row-count': row_count,
+            'source': file_name,
+            'errors': errors,
+        })
+        tables.append(table)
+    return {
+        'time': time,
+        'valid': all(item['valid'] for item in tables),
+        'error-count': collector.error_count,
+        'table-count': len(tables),
+        'tables': tables,
+        'warnings': warnings,
+    }
+
+
+# messages of the goodtables errors found by `inspect_frame`, as in goodtables' spec
+FRAME_MESSAGES = {
+    'extra-header': 'There is an extra header in column {column_number}',
+    'missing-header': 'There is a missing header in column {column_number}',
+    'blank-row': 'Row {row_number} is completely blank',
+    'duplicate-row': 'Row {row_number} is duplicated to row(s) {row_numbers}',
+    'non-castable-value': 'Row {row_number} has non castable value {value} in column {column_number} '
+                          '(type: {field_type}, format: {field_format})',
+    'required-constraint': 'Column {column_number} is a required field, but row {row_number} has no value',
+    'pattern-constraint': 'The value {value} in row {row_number} and column {column_number} does not conform to the '
+                          'pattern constraint of {constraint}',
+    'unique-constraint': 'Rows {row_numbers} has unique constraint violation in column {column_number}',
+    'enumerable-constraint': 'The value {value} in row {row_number} and column {column_number} does not conform to '
+                             'the given enumeration: {constraint}',
+    'minimum-constraint': 'The value {value} in row {row_number} and column {column_number} does not conform to the '
+                          'minimum constraint of {constraint}',
+    'maximum-constraint': 'The value {value} in row {row_number} and column {column_number} does not conform to the '
+                          'maximum constraint of {constraint}',
+}
+
+
+def _frame_error(code, row_number=None, column_number=None, **values):
+    return {'code': code,
+            'message': FRAME_MESSAGES[code].format(row_number=row_number, column_number=column_number, **values),
+            'row-number': row_number,
+            'column-number': column_number}
+
+
+def cast_frame(df, schema):
+    """the columns of a data frame cast to the types of the schema fields, in place
+
+    Number fields become floats, date fields iso formatted strings and string fields text, values that cannot be
+    cast become missing values.
+
+    :param df: the data frame
+    :param schema: table schema descriptor
+    :return DataFrame: the same data frame
+    """
+    import pandas as pd
+    for field in schema['fields']:
+        name = field['name']
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if field['type'] == 'number' and not pd.api.types.is_numeric_dtype(column.dtype):
+            df[name] = pd.to_numeric(column.astype(object), errors='coerce')
+        elif field['type'] == 'date' and not pd.api.types.is_string_dtype(column.dtype):
+            df[name] = pd.to_datetime(column, errors='coerce').dt.strftime('%Y-%m-%d')
+        elif field['type'] == 'string' and not (column.dtype == object or isinstance(column.dtype, pd.CategoricalDtype)
+                                                or pd.api.types.is_string_dtype(column.dtype)):
+            df[name] = column.astype(str).where(column.notna())
+    return df
+
+
+def _field_errors(df, field, column_number):
+    """errors of the cells of a column, found with vectorized operations on the typed column"""
+    import warnings
+    import numpy as np
+    import pandas as pd
+    column = df[field['name']]
+    constraints = field.get('constraints', {})
+    missing = column.isna().to_numpy().copy()
+    if column.dtype == object or pd.api.types.is_string_dtype(column.dtype):
+        missing |= (column.astype(object) == '').to_numpy()
+    if constraints.get('required') or field.get('required'):
+        for row in np.flatnonzero(missing):
+            yield _frame_error('required-constraint', row + 2, column_number)
+    if field['type'] == 'number':
+        values = column if pd.api.types.is_numeric_dtype(column.dtype) else \
+            pd.to_numeric(column.astype(object), errors='coerce')
+    elif field['type'] == 'date':
+        with warnings.catch_warnings():
+            # dates may be in any format, parsed value by value
+            warnings.simplefilter('ignore', UserWarning)
+            values = pd.to_datetime(column, errors='coerce')
+    elif field['type'] == 'boolean':
+        values = column if pd.api.types.is_bool_dtype(column.dtype) else column.astype(object).map(
+            lambda value: {'true': True, 'false': False, '1': True, '0': False}.get(str(value).strip().lower()))
+    else:
+        values = column
+    invalid = values.isna().to_numpy() & ~missing
+    for row in np.flatnonzero(invalid):
+        yield _frame_error('non-castable-value', row + 2, column_number, value=column.iat[row],
+                           field_type=field['type'], field_format=field.get('format', 'default'))
+    valid = ~invalid & ~missing
+    checks = []
+    if 'enum' in constraints:
+        checks.append(('enumerable-constraint', constraints['enum'], ~values.isin(constraints['enum']).to_numpy()))
+    if 'minimum' in constraints and field['type'] == 'number':
+        checks.append(('minimum-constraint', constraints['minimum'], (values < constraints['minimum']).to_numpy()))
+    if 'maximum' in constraints and field['type'] == 'number':
+        checks.append(('maximum-constraint', constraints['maximum'], (values > constraints['maximum']).to_numpy()))
+    if 'pattern' in constraints:
+        matches = column.astype(str).str.fullmatch(constraints['pattern']).to_numpy(dtype=bool, na_value=False)
+        checks.append(('pattern-constraint', constraints['pattern'], ~matches))
+    for code, constraint, failed in checks:
+        for row in np.flatnonzero(failed & valid):
+            yield _frame_error(code, row + 2, column_number, value=column.iat[row], constraint=constraint)
+    if constraints.get('unique'):
+        duplicated = column.duplicated(keep=False).to_numpy() & ~missing
+        rows = pd.Series(np.flatnonzero(duplicated) + 2).groupby(column[duplicated].to_numpy()).apply(list)
+        for row_numbers in rows:
+            yield _frame_error('unique-constraint', row_numbers[-1], column_number,
+                               row_numbers=', '.join(str(row) for row in row_numbers))
+
+
+def _custom_check_errors(df, fields, custom_checks):
+    """errors of custom checks of the string columns, each check is applied once per distinct value of a column and
+    its errors repeated for the rows with that value
+
+    :return generator: tuples of the name of the check and the error
+    """
+    import numpy as np
+    import pandas as pd
+    for check in custom_checks:
+        name = check_name(check)
+        state = {}
+        for column_number, field in fields:
+            categorical = pd.Categorical(df[field['name']])
+            for code, value in enumerate(categorical.categories):
+                rows = np.flatnonzero(categorical.codes == code)
+                found = []
+                check(found, [{'header': field['name'], 'value': str(value), 'number': column_number}],
+                      rows[0] + 2, state)
+                for error in found:
+                    for row in rows:
+                        yield name, dict(error, **{'row-number': row + 2,
+                                             'message': ROW_REFERENCE.sub(r'\1 {}'.format(row + 2),
+                                                                          error['message'])})
+
+
+def inspect_frame(df, schema, custom_checks=(), error_limit=1000, check_error_limit=100, source='data frame'):
+    """inspect a typed data frame, e.g. read from a parquet file, with the checks `inspect_table` applies to csv files
+
+    The schema's field types and constraints are checked with vectorized operations on the columns rather than
+    cell by cell. Custom checks are applied to the string columns, once per distinct value. Errors are collected as
+    by `inspect_table`, with row numbers counting the header as row 1.
+
+    :param df: the data frame
+    :param schema: table schema descriptor
+    :param custom_checks: list of additional custom check functions to apply
+    :param error_limit: maximum number of errors in the report
+    :param check_error_limit: maximum number of errors per check in the report
+    :param source: name of the table for the report
+    :return dict: a goodtables style report with one table
+    """
+    import time
+    import numpy as np
+    start = time.perf_counter()
+    collector = ErrorCollector(error_limit, check_error_limit)
+    fields = {field['name']: field for field in schema['fields']}
+    headers = [str(column) for column in df.columns]
+    typed = [(headers.index(name) + 1, field) for name, field in fields.items() if name in df.columns]
+
+    def builtin_errors():
+        for number, header in enumerate(headers, 1):
+            if header not in fields:
+                yield _frame_error('extra-header', column_number=number)
+        for number, field in enumerate(schema['fields'], 1):
+            if field['name'] not in df.columns:
+                yield _frame_error('missing-header', column_number=number)
+        if len(df.columns):
+            for row in np.flatnonzero(df.isna().all(axis=1).to_numpy()):
+                yield _frame_error('blank-row', row + 2)
+            duplicated = df.duplicated(keep=False).to_numpy()
+            if duplicated.any():
+                first_rows = {}
+                for row, key in zip(np.flatnonzero(duplicated), df[duplicated].itertuples(index=False, name=None)):
+                    if key in first_rows:
+                        yield _frame_error('duplicate-row', row + 2, row_numbers=first_rows[key] + 2)
+                    else:
+                        first_rows[key] = row
+        for column_number, field in typed:
+            yield from _field_errors(df, field, column_number)
+
+    def errors():
+        for error in builtin_errors():
+            yield None, error
+        yield from _custom_check_errors(df, [(number, field) for number, field in typed if field['type'] == 'string'],
+                                        custom_checks)
+
+    report_warnings = []
+    for check, error in errors():
+        collector.add(error, check=check)
+        if collector.full:
+            report_warnings.append('inspection of "{}" stopped, error limit of {} reached'.format(source, error_limit))
+            break
+    report_warnings.extend(collector.warnings())
+    table_errors = collector.errors()
+    seconds = round(time.perf_counter() - start, 3)
+    table = {'time': seconds,
+             'valid': not table_errors,
+             'error-count': collector.error_count,
+             'row-count': len(df) + 1,
+             'source': source,
+             'headers': headers,
+             'errors': table_errors}
+    return {'time': seconds,
+            'valid': table['valid'],
+            'error-count': collector.error_count,
+            'table-count': 1,
+            'tables': [table],
+            'warnings': report_warnings}
+
+
+def merge_reports(reports):
+    """combine reports of separately inspected tables into one report
+
+    :param reports: list of reports
+    :return dict: report with the tables and warnings of all reports
+    """
+    tables = [table for report in reports for table in report['tables']]
+    return {
+        'time': max([report.get('time', 0) for report in reports] or [0]),
+        'valid': all(report['valid'] for report in reports),
+        'error-count': sum(report['error-count'] for report in reports),
+        'table-count': len(tables),
+        'tables': tables,
+        'warnings': [warning for report in reports for warning in report.get('warnings', [])],
+    }
@@ -0,0 +1,262 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for admission control and processing of upload requests
+
+ """
+import asyncio
+import os
+import time
+from collections import namedtuple
+from io import BytesIO
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import upload.app as app
+from upload.admission import AdmissionController, admission, admitted, content_weight, request_weight
+from upload.multipart import UploadedFile, read_form
+from upload.settings import Default
+
+Project = namedtuple('Project', ['id', 'code'])
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def test_admission_queue():
+    controller = AdmissionController(capacity=100, max_queue=1, timeout=5, retry_after=7)
+    order = []
+
+    async def process(name, weight, hold):
+        async with controller.admit(weight):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def scenario():
+        first = asyncio.ensure_future(process('first', 80, 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(process('second', 500, 0))
+        await asyncio.sleep(0)
+        assert controller.metrics()['queue-depth'] == 1
+        with pytest.raises(web.HTTPTooManyRequests) as excinfo:
+            await controller.acquire(10)
+        assert excinfo.value.headers['Retry-After'] == '7'
+        await asyncio.gather(first, second)
+
+    run(scenario())
+    assert order == ['first', 'second']
+    assert controller.metrics() == {'capacity': 100, 'in-use': 0, 'active': 0, 'queue-depth': 0, 'admitted': 2,
+                                    'rejected': 1, 'timed-out': 0}
+
+
+def test_admission_timeout():
+    controller = AdmissionController(capacity=100, max_queue=1, timeout=0.01, retry_after=7)
+
+    async def scenario():
+        weight = await controller.acquire(100)
+        with pytest.raises(web.HTTPServiceUnavailable):
+            await controller.acquire(1)
+        controller.release(weight)
+
+    run(scenario())
+    assert controller.metrics()['timed-out'] == 1
+    assert controller.in_use == 0
+
+
+def posted_files(content):
+    return {'file[0]': UploadedFile('file[0]', 'upload.csv', BytesIO(content), 'text/csv'), 'file[1]': None}
+
+
+def upload_form(what, content):
+    form = aiohttp.FormData()
+    form.add_field('project_id', '1')
+    form.add_field('what', what)
+    form.add_field('file[0]', content, filename='upload.csv', content_type='text/csv')
+    return form
+
+
+def test_request_weight_from_form():
+    weights = []
+
+    async def weigh(request):
+        weights.append(request_weight(await read_form(request)))
+        return web.json_response(None)
+
+    async def scenario():
+        server = TestServer(web.Application())
+        server.app.router.add_route('POST', '/weigh', weigh)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                for what in ('strains', 'screen', 'spam'):
+                    async with session.post(server.make_url('/weigh'), data=upload_form(what, b'x' * 100)) as response:
+                        assert response.status == 200
+        finally:
+            await server.close()
+
+    run(scenario())
+    assert weights == [200, 600, 600]
+
+
+def test_upload_does_not_block_admission(monkeypatch):
+    monkeypatch.setattr(admission, 'capacity', 1)
+    monkeypatch.setattr(admission, 'max_queue', 0)
+    clients = []
+    monkeypatch.setattr(app, 'iloop_client', lambda api, token: clients.append(token))
+    monkeypatch.setattr(app, 'get_project', lambda iloop, data: Project(1, 'DEM'))
+
+    def slow_upload(iloop, project, data, mode):
+        time.sleep(0.5)
+        return None, {'valid': True}
+
+    monkeypatch.setattr(app, 'process_upload', slow_upload)
+
+    async def scenario():
+        server = TestServer(app.get_app())
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                first = asyncio.ensure_future(session.post(server.make_url('/upload'),
+                                                           data=upload_form('strains', b'strain\nfoo\n')))
+                started = time.monotonic()
+                while True:
+                    async with session.get(server.make_url('/upload/metrics')) as response:
+                        if (await response.json())['active'] == 1:
+                            break
+                    await asyncio.sleep(0.01)
+                async with session.post(server.make_url('/upload'),
+                                        data=upload_form('strains', b'strain\nbar\n')) as response:
+                    assert response.status == 429
+                    assert response.headers['Retry-After']
+                # the rejection was answered while the first upload was still being processed
+                assert time.monotonic() - started < 0.5
+                response = await first
+                assert response.status == 200
+                assert (await response.json()) == {'valid': True}
+                response.release()
+        finally:
+            await server.close()
+
+    run(scenario())
+    assert admission.metrics()['active'] == 0
+    # the rejected request was turned away before creating an iloop client
+    assert len(clients) == 1
+
+
+def test_admitted_by_content_length():
+    held = []
+
+    @admitted
+    async def handler(request, data):
+        held.append(admission.in_use)
+        return web.json_response(None)
+
+    async def scenario():
+        server = TestServer(web.Application())
+        server.app.router.add_route('POST', '/upload', handler)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(server.make_url('/upload'),
+                                        data=upload_form('strains', b'x' * 100)) as response:
+                    assert response.status == 200
+        finally:
+            await server.close()
+
+    request = type('Request', (), {'content_length': 1000})()
+    assert content_weight(request) == 6000
+    request.content_length = None
+    assert content_weight(request) == admission.capacity
+    run(scenario())
+    # the weight held was lowered from that of the Content-Length to that of the posted file
+    assert held == [200]
+    assert admission.in_use == 0
+
+
+def test_form_size_limits():
+    async def limited(request):
+        await read_form(request, max_file_size=500, max_request_size=1000)
+        return web.json_response(None)
+
+    async def scenario():
+        server = TestServer(web.Application())
+        server.app.router.add_route('POST', '/limited', limited)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                url = server.make_url('/limited')
+                async with session.post(url, data=upload_form('strains', b'x' * 450)) as response:
+                    assert response.status == 200
+                async with session.post(url, data=upload_form('strains', b'x' * 501)) as response:
+                    assert response.status == 413
+                    assert 'file upload.csv' in await response.text()
+                form = upload_form('strains', b'x' * 450)
+                form.add_field('file[1]', b'x' * 450, filename='other.csv', content_type='text/csv')
+                form.add_field('file[2]', b'x' * 450, filename='third.csv', content_type='text/csv')
+                async with session.post(url, data=form) as response:
+                    assert response.status == 413
+                    assert 'request exceeds' in await response.text()
+        finally:
+            await server.close()
+
+    run(scenario())
+
+
+def test_temporary_files_removed(monkeypatch, tmpdir):
+    monkeypatch.setattr(Default, 'CHECKPOINT_DIR', str(tmpdir))
+    monkeypatch.setattr('upload.checks.iloop_cache.update', lambda *args, **kwargs: None)
+    posted = []
+    temp_files = []
+
+    class FakeUploader(object):
+        results = {}
+
+        def upload(self, iloop):
+            pass
+
+    def make_uploader(what, project, files, mode='replace', temp_dir=None):
+        temp_files.append(app.read_table(files['file[0]'], temp_dir=temp_dir)[0])
+        return FakeUploader()
+
+    @admitted
+    async def handler(request, data):
+        posted.append(data['file[0]'].file)
+        return web.json_response(None)
+
+    async def scenario():
+        server = TestServer(web.Application())
+        server.app.router.add_route('POST', '/upload', handler)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(server.make_url('/upload'), data=upload_form('strains', b'x')) as response:
+                    assert response.status == 200
+        finally:
+            await server.close()
+
+    run(scenario())
+    assert posted[0].closed
+    monkeypatch.setattr(app, 'make_uploader', make_uploader)
+    items = [('strains', posted_files(b'strain\nfoo\n')), ('media', posted_files(b'medium\nbar\n'))]
+    assert app.process_batch(None, Project(1, 'DEM'), items, 'replace') is None
+    assert app.process_upload(None, Project(1, 'DEM'), dict(posted_files(b'strain\nfoo\n'), what='strains'),
+                              'replace') == (None, app.success_data(FakeUploader()))
+    assert len(temp_files) == 3
+    assert not any(os.path.exists(name) for name in temp_files)
@@ -0,0 +1,106 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for the asyncio iloop client, against a minimal Potion style api
+
+ """
+import asyncio
+import json
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from upload.aioiloop import SESSION_KEY, AsyncIloop, Reference, async_iloop_client, setup_session
+
+MEDIA = [{'$uri': '/api/medium/{}'.format(i), 'name': 'medium_{}'.format(i), 'ph': 7.0,
+          'organization': {'$ref': '/api/organization/1'}} for i in range(1, 4)]
+
+
+def potion_app(calls):
+    async def root_schema(request):
+        return web.json_response({'properties': {'medium': {'$ref': '/api/medium/schema#'}}})
+
+    async def medium_schema(request):
+        return web.json_response({'links': [{'rel': 'instances', 'href': '/api/medium', 'method': 'GET'},
+                                            {'rel': 'updateContents', 'href': '/api/medium/{id}/contents',
+                                             'method': 'POST'}]})
+
+    async def media(request):
+        calls.append(('GET', dict(request.rel_url.query)))
+        page, per_page = int(request.rel_url.query['page']), int(request.rel_url.query['per_page'])
+        where = json.loads(request.rel_url.query.get('where', '{}'))
+        selected = [medium for medium in MEDIA if all(medium[key] == value for key, value in where.items())]
+        return web.json_response(selected[(page - 1) * per_page:page * per_page],
+                                 headers={'X-Total-Count': str(len(selected))})
+
+    async def contents(request):
+        calls.append(('POST', request.match_info['id'], await request.json(), request.headers['Authorization']))
+        return web.json_response(None)
+
+    app = web.Application()
+    app.router.add_route('GET', '/api/schema', root_schema)
+    app.router.add_route('GET', '/api/medium/schema', medium_schema)
+    app.router.add_route('GET', '/api/medium', media)
+    app.router.add_route('POST', '/api/medium/{id}/contents', contents)
+    return app
+
+
+def test_async_iloop():
+    calls = []
+
+    async def scenario():
+        server = TestServer(potion_app(calls))
+        await server.start_server()
+        session = aiohttp.ClientSession()
+        try:
+            iloop = await AsyncIloop(str(server.make_url('/api')), 'secret', session).load()
+            names = [medium.name async for medium in iloop.Medium.instances(per_page=2)]
+            assert names == ['medium_1', 'medium_2', 'medium_3']
+            medium = await iloop.Medium.one(where={'name': 'medium_2'})
+            assert medium.id == 2
+            assert medium.organization == Reference(iloop, '/api/organization/1')
+            await medium.update_contents([{'compound': 'glucose', 'concentration': 1.0}])
+        finally:
+            await session.close()
+            await server.close()
+
+    asyncio.get_event_loop().run_until_complete(scenario())
+    assert calls[-1] == ('POST', '2', [{'compound': 'glucose', 'concentration': 1.0}], 'Bearer secret')
+    assert len([call for call in calls if call[0] == 'GET']) == 3
+
+
+def test_app_session():
+    calls = []
+    app = web.Application()
+    setup_session(app)
+
+    async def scenario():
+        api = TestServer(potion_app(calls))
+        server = TestServer(app)
+        await api.start_server()
+        await server.start_server()
+        try:
+            session = app[SESSION_KEY]
+            iloop = await async_iloop_client(app, str(api.make_url('/api')), 'secret')
+            assert iloop.session is session
+            assert [medium.name async for medium in iloop.Medium.instances()] == ['medium_1', 'medium_2', 'medium_3']
+        finally:
+            await server.close()
+            await api.close()
+        assert session.closed
+
+    asyncio.get_event_loop().run_until_complete(scenario())
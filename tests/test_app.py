@@ -0,0 +1,109 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for the upload handlers of the app
+
+ """
+import asyncio
+from collections import namedtuple
+from io import BytesIO
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+
+import upload.app as app
+from upload.multipart import UploadedFile
+from upload.settings import Default
+from upload.validation import ValidationError
+
+Project = namedtuple('Project', ['id', 'code'])
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def posted_files(content):
+    return {'file[0]': UploadedFile('file[0]', 'upload.csv', BytesIO(content), 'text/csv'), 'file[1]': None}
+
+
+def test_batch_stages(monkeypatch, tmpdir):
+    monkeypatch.setattr(Default, 'CHECKPOINT_DIR', str(tmpdir))
+    created = set()
+    events = []
+
+    class FakeUploader(object):
+        def __init__(self, what):
+            self.what = what
+            self.results = {}
+            # what earlier stages created, as seen by the checks validating this file
+            self.known = set(created)
+            events.append(('validate', what))
+
+        def upload(self, iloop):
+            events.append(('upload', self.what))
+            created.add(self.what)
+
+    uploaders = {}
+
+    def make_uploader(what, project, files, mode='replace', temp_dir=None):
+        uploaders[what] = FakeUploader(what)
+        return uploaders[what]
+
+    monkeypatch.setattr(app, 'make_uploader', make_uploader)
+    items = [('fermentation', posted_files(b'f')), ('strains', posted_files(b's')), ('media', posted_files(b'm'))]
+    assert app.run_batch(items, Project(1, 'DEM'), None, 'replace') is None
+    assert set(events[:2]) == {('validate', 'strains'), ('validate', 'media')}
+    assert events[2:] == [('upload', 'strains'), ('upload', 'media'), ('validate', 'fermentation'),
+                          ('upload', 'fermentation')]
+    assert uploaders['fermentation'].known == {'strains', 'media'}
+    assert uploaders['strains'].known == set()
+
+
+def test_unparsable_csv(tmpdir):
+    with pytest.raises(ValidationError) as excinfo:
+        app.read_table(posted_files(b'medium,pH\nfoo,7\nbar,7,1,2\n')['file[0]'], temp_dir=str(tmpdir))
+    assert excinfo.value.report['tables'][0]['errors'][0]['message'].startswith('failed to parse csv file upload.csv')
+
+
+def test_invalid_upload_report(monkeypatch):
+    monkeypatch.setattr(app, 'REPORT_CHUNK_SIZE', 16)
+    monkeypatch.setattr(app, 'iloop_client', lambda api, token: None)
+    monkeypatch.setattr(app, 'get_project', lambda iloop, data: Project(1, 'DEM'))
+    monkeypatch.setattr('upload.checks.iloop_cache.update', lambda *args, **kwargs: None)
+    form = aiohttp.FormData()
+    form.add_field('project_id', '1')
+    form.add_field('what', 'strains')
+    form.add_field('file[0]', b'strain,parent\nfoo,bar\nbaz,bar,spam,eggs\n', filename='strains.csv',
+                   content_type='text/csv')
+
+    async def scenario():
+        server = TestServer(app.get_app())
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(server.make_url('/upload'), data=form,
+                                        headers={'Accept-Encoding': 'gzip'}) as response:
+                    assert response.status == 200
+                    assert response.headers['Content-Encoding'] == 'gzip'
+                    return await response.json()
+        finally:
+            await server.close()
+
+    report = run(scenario())
+    assert not report['valid']
+    assert report['tables'][0]['errors'][0]['message'].startswith('failed to parse csv file strains.csv')
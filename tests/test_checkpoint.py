@@ -0,0 +1,58 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for upload checkpoints
+
+ """
+from os.path import exists, join
+
+from upload.checkpoint import Checkpoint
+
+
+def test_checkpoint_resume(tmpdir):
+    path = join(str(tmpdir), 'checkpoint')
+    checkpoint = Checkpoint(path)
+    checkpoint.mark('strain', 'foo')
+    checkpoint.mark('medium-created', 'bar', value='bar_1')
+    with open(path, 'a') as checkpoint_file:
+        checkpoint_file.write('["interrupted')
+    resumed = Checkpoint(path)
+    assert resumed.done('strain', 'foo')
+    assert not resumed.done('strain', 'bar')
+    assert resumed.get('medium-created', 'bar') == 'bar_1'
+    assert len(resumed) == 2
+    resumed.clear()
+    assert not exists(path)
+    assert not Checkpoint(path).done('strain', 'foo')
+
+
+def test_checkpoint_marks_after_torn_line(tmpdir):
+    path = join(str(tmpdir), 'checkpoint')
+    Checkpoint(path).mark('strain', 'foo')
+    with open(path, 'a') as checkpoint_file:
+        checkpoint_file.write('["interrupted')
+    resumed = Checkpoint(path)
+    resumed.mark('strain', 'bar')
+    again = Checkpoint(path)
+    assert again.done('strain', 'foo')
+    assert again.done('strain', 'bar')
+    assert len(again) == 2
+    with open(path) as checkpoint_file:
+        assert all(line.endswith('\n') for line in checkpoint_file)
+    with open(path, 'a') as checkpoint_file:
+        checkpoint_file.write('["[\\"strain\\", \\"baz\\"]", true]')
+    Checkpoint(path).mark('strain', 'spam')
+    assert len(Checkpoint(path)) == 4
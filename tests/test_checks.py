@@ -0,0 +1,92 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for the identifier cache and checks
+
+ """
+from collections import namedtuple
+
+from upload.checks import IloopCache, recipe_fingerprint
+
+
+def test_recipe_fingerprint():
+    compound = namedtuple('ChemicalEntity', ['chebi_name'])
+    recipe = [{'compound': 'glucose', 'concentration': 5}, {'compound': 'sodium chloride', 'concentration': 1.0}]
+    same = [{'compound': compound('sodium chloride'), 'concentration': '1'},
+            {'compound': compound('Glucose '), 'concentration': 5.0}]
+    assert recipe_fingerprint(recipe, 5) == recipe_fingerprint(same, 5.0)
+    assert recipe_fingerprint(recipe, 5) != recipe_fingerprint(recipe, 6)
+    assert recipe_fingerprint(recipe, 5) != recipe_fingerprint(recipe[:1], 5)
+
+
+class FakeResource(object):
+    def __init__(self, items):
+        self.items = items
+        self.queries = []
+
+    def instances(self, where=None):
+        self.queries.append(where)
+        return [item for item in self.items if where is None or item.project == where['project']]
+
+
+def test_project_identifiers():
+    project = namedtuple('Project', ['id'])
+    strain = namedtuple('Strain', ['alias', 'project'])
+    experiment = namedtuple('Experiment', ['identifier', 'project'])
+    first, second = project(1), project(2)
+    iloop = namedtuple('Iloop', ['Strain', 'Experiment'])(
+        FakeResource([strain('a', first), strain('b', second)]), FakeResource([experiment('e', second)]))
+    cache = IloopCache(max_projects=1)
+    assert cache.project_identifiers('strain', first, iloop) == {'a'}
+    assert cache.project_identifiers('experiment', first, iloop) == frozenset()
+    assert iloop.Strain.queries == [{'project': first}]
+    cache.add('strain', ['c'], project=first)
+    assert cache.project_identifiers('strain', first, iloop) == {'a', 'c'}
+    assert cache.project_identifiers('experiment', second, iloop) == {'e'}
+    # only the most recently used project is kept
+    assert list(cache._projects) == [2]
+
+
+def test_lite_update_keeps_fresh_identifiers(monkeypatch):
+    project = namedtuple('Project', ['id'])(1)
+    medium = namedtuple('Medium', ['name', 'project'])
+    strain = namedtuple('Strain', ['alias', 'project'])
+    iloop = namedtuple('Iloop', ['Medium', 'Strain', 'Experiment'])(
+        FakeResource([medium('LB', None)]), FakeResource([strain('a', project)]), FakeResource([]))
+    now = [100.0]
+    monkeypatch.setattr('upload.checks.time.monotonic', lambda: now[0])
+    cache = IloopCache(ttl=60)
+    cache._identifiers = {'medium': frozenset()}
+    cache.update(iloop, lite=True, project=project)
+    assert cache.identifiers['medium'] == {'LB'}
+    assert cache.project_identifiers('strain', project, iloop) == {'a'}
+    now[0] = 159.0
+    cache.update(iloop, lite=True, project=project)
+    assert len(iloop.Medium.queries) == 1 and len(iloop.Strain.queries) == 1
+    now[0] = 160.0
+    cache.update(iloop, lite=True, project=project)
+    assert len(iloop.Medium.queries) == 2 and len(iloop.Strain.queries) == 2
+
+
+def test_add_identifiers():
+    cache = IloopCache()
+    # not loaded yet, nothing to update and no request to iloop
+    cache.add('medium', ['LB'])
+    cache.add('strain', ['a'], project=namedtuple('Project', ['id'])(1))
+    assert cache._identifiers is None and not cache._projects
+    cache._identifiers = {'medium': frozenset(['M9'])}
+    cache.add('medium', ['LB'])
+    assert cache._identifiers['medium'] == {'M9', 'LB'}
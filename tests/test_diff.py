@@ -0,0 +1,42 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for diffing the scalars of an experiment
+
+ """
+from upload.diff import diff_scalars, scalar_values, select_scalars
+
+OD = {'type': 'physiology', 'parameter': 'OD', 'unit': 'a.u.'}
+RATE = {'type': 'physiology', 'parameter': 'rate', 'unit': 'mmol/gDW/h'}
+
+
+def test_diff_scalars():
+    current = [{'test': OD, 'measurements': {'A1': [0.5], 'A2': [0.7]}},
+               {'test': RATE, 'phase': {'start': 0, 'end': 1}, 'measurements': {'A1': [1.0]}}]
+    upload = [{'test': dict(reversed(list(OD.items()))), 'measurements': {'A1': [0.5], 'A2': [0.8], 'A3': [0.1]}},
+              {'test': RATE, 'phase': {'start': 0.0, 'end': 2.0}, 'measurements': {'A1': [1.0]}}]
+    diff = diff_scalars(current, upload)
+    # the order of the test properties does not matter, the phase does
+    assert diff.changed == {key for key in scalar_values(upload) if key[0] != 'A1'} | set(scalar_values(upload[1:]))
+    assert diff.removed == set(scalar_values(current[1:]))
+    assert diff_scalars(current, current) == (set(), set())
+
+
+def test_select_scalars():
+    scalars = [{'test': OD, 'measurements': {'A1': [0.5], 'A2': [0.7]}},
+               {'test': RATE, 'measurements': {'A1': [1.0]}}]
+    keys = {key for key in diff_scalars([], scalars).changed if key[0] == 'A2'}
+    assert select_scalars(scalars, keys) == [{'test': OD, 'measurements': {'A2': [0.7]}}]
@@ -0,0 +1,79 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for the long format measurement frames
+
+ """
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from upload.frames import join_columns, map_categorical, melt_samples
+
+ID_VARS = ['phase_start', 'phase_end', 'quantity', 'parameter', 'denominator_compound_name',
+           'numerator_compound_name', 'unit']
+SAMPLE_COLS = ['experiment', 'reactor', 'operation', 'feed_medium', 'batch_medium', 'strain']
+
+
+def physiology(n_rows, n_samples):
+    sample_ids = ['exp_r{}'.format(i) for i in range(n_samples)]
+    wide = pd.DataFrame({'phase_start': np.arange(n_rows) // 10 * 1.0,
+                         'phase_end': np.arange(n_rows) // 10 + 1.0,
+                         'quantity': ['rate'] * n_rows,
+                         'parameter': ['parameter_{}'.format(i % 10) for i in range(n_rows)],
+                         'denominator_compound_name': [np.nan] * n_rows,
+                         'numerator_compound_name': ['compound_{}'.format(i % 7) for i in range(n_rows)],
+                         'unit': ['mmol/gDW/h'] * n_rows})
+    for i, sample_id in enumerate(sample_ids):
+        wide[sample_id] = (np.arange(n_rows) + i) / 4
+    samples = pd.DataFrame({'sample_id': sample_ids, 'experiment': 'exp',
+                            'reactor': ['r{}'.format(i) for i in range(n_samples)], 'operation': 'none',
+                            'feed_medium': 'feed', 'batch_medium': 'batch', 'strain': 'strain'})
+    return wide, samples
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_melt_samples():
+    wide, samples = physiology(20, 3)
+    expected = pd.melt(wide, id_vars=ID_VARS, var_name='sample_id').merge(samples, on='sample_id')
+    df = melt_samples(wide, ID_VARS, samples, SAMPLE_COLS)
+    assert len(df) == len(expected)
+    assert df['value'].dtype == np.float32
+    assert isinstance(df['reactor'].dtype, pd.CategoricalDtype)
+    assert df['value'].tolist() == expected['value'].tolist()
+    assert df['sample_id'].tolist() == expected['sample_id'].tolist()
+    assert df['reactor'].tolist() == expected['reactor'].tolist()
+    test_id = join_columns(df, ['unit', 'parameter', 'denominator_compound_name'])
+    assert test_id[0] == 'mmol/gDW/h_parameter_0_nan'
+    mapped = map_categorical(df['denominator_compound_name'], lambda name: str(name).upper())
+    assert set(mapped) == {'NAN'}
+
+
+def test_melt_samples_memory():
+    wide, samples = physiology(2000, 48)
+    melt_merge = peak_memory(lambda: pd.melt(wide, id_vars=ID_VARS, var_name='sample_id')
+                             .merge(samples, on='sample_id'))
+    compact = peak_memory(lambda: melt_samples(wide, ID_VARS, samples, SAMPLE_COLS))
+    assert compact * 2 < melt_merge
@@ -0,0 +1,56 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for the cold start of the service, use `python -X importtime -c 'import upload.app'` to find what regressed
+
+ """
+import json
+import os
+import subprocess
+import sys
+from os.path import abspath, dirname
+
+import upload
+
+HEAVY_MODULES = ['pandas', 'goodtables', 'potion_client', 'gnomic', 'raven', 'openpyxl', 'xlrd']
+IMPORT_TIME_BUDGET = float(os.environ.get('IMPORT_TIME_BUDGET', 1.0))
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import %s
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'heavy': [name for name in %r if name in sys.modules]}))
+'''
+
+
+def cold_import(module='upload.app'):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([dirname(dirname(abspath(upload.__file__))), env.get('PYTHONPATH', '')])
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT % (module, HEAVY_MODULES)], env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def test_import_does_not_load_heavy_modules():
+    assert cold_import()['heavy'] == []
+
+
+def test_checks_import_does_not_load_heavy_modules():
+    assert cold_import('upload.checks')['heavy'] == []
+
+
+def test_import_time_budget():
+    seconds = min(cold_import()['seconds'] for _ in range(3))
+    assert seconds < IMPORT_TIME_BUDGET, 'importing upload.app took {:.2f}s'.format(seconds)
@@ -13,25 +13,166 @@
 # limitations under the License.
 
 """
-Tests for the inspecting files
+Tests for the inspecting and uploading files
 
  """
-import json
 from collections import namedtuple
+from itertools import count
 from os.path import join
 import functools
+import threading
 
 import pandas as pd
 import pytest
+from potion_client.exceptions import ItemNotFound
+from requests import HTTPError
 
 import upload.upload as cup
+from upload.checks import IloopCache, recipe_fingerprint
 from upload.checks import check_safe_partial as partial
 from upload.checks import (compound_name_unknown, medium_name_unknown,
                            protein_id_unknown, reaction_id_unknown,
                            strain_alias_unknown, synonym_to_chebi_name)
+from upload.diff import scalar_values
+from upload.validation import ValidationError
 
 TEST_PROJECT = 'DEM'  # TODO: use project part of default fixture
-PROJECT_OBJECT = namedtuple('Project', ['code'])(code=TEST_PROJECT)
+PROJECT_OBJECT = namedtuple('Project', ['id', 'code', 'organization'])(id=1, code=TEST_PROJECT, organization=None)
+
+
+class FakeItem(object):
+    """an object in a `FakeIloop`, writes to it are recorded by the iloop
+
+    Experiments keep their samples and scalars like iloop does: values added for a sample, test and phase that
+    already has values are appended to them, and samples are only defined once.
+    """
+
+    def __init__(self, iloop, kind, **properties):
+        self.iloop = iloop
+        self.kind = kind
+        self.scalars = []
+        self.__dict__.update(properties)
+
+    @property
+    def label(self):
+        for key in ('name', 'identifier', 'barcode', 'title'):
+            if key in self.__dict__:
+                return self.__dict__[key]
+
+    def samples(self):
+        return [item for item in self.iloop.resources['Sample'].items if getattr(item, 'experiment', None) is self]
+
+    def stored_scalar(self, scalar):
+        for stored in self.scalars:
+            if stored['test'] == scalar['test'] and stored.get('phase') == scalar.get('phase'):
+                return stored
+
+    def add_samples(self, data):
+        self.iloop.record(self.kind, 'add_samples', self.label, data)
+        defined = {sample.name for sample in self.samples()} & set(data['samples'])
+        if defined:
+            raise HTTPError('samples {} of {} already exist'.format(', '.join(sorted(defined)), self.label))
+        for name in data['samples']:
+            self.iloop.resources['Sample'].items.append(FakeItem(self.iloop, 'Sample', name=name, experiment=self))
+        for scalar in data['scalars']:
+            stored = self.stored_scalar(scalar)
+            if stored is None:
+                self.scalars.append(dict(scalar, measurements={}))
+                stored = self.scalars[-1]
+            for sample, values in scalar['measurements'].items():
+                stored['measurements'].setdefault(sample, []).extend(values)
+
+    def read_contents(self):
+        return self.contents
+
+    def read_scalars(self):
+        return self.scalars
+
+    def remove_scalars(self, data):
+        self.iloop.record(self.kind, 'remove_scalars', self.label, data)
+        for scalar in data['scalars']:
+            stored = self.stored_scalar(scalar)
+            for sample in scalar['measurements']:
+                stored['measurements'].pop(sample, None)
+        self.scalars = [stored for stored in self.scalars if stored['measurements']]
+
+    def update_contents(self, contents):
+        self.iloop.record(self.kind, 'update_contents', self.label, contents)
+
+    def add_xref_measurements(self, **measurements):
+        self.iloop.record(self.kind, 'add_xref_measurements', self.label, measurements)
+
+    def delete(self):
+        self.iloop.record(self.kind, 'delete', self.label)
+        self.iloop.resources[self.kind].items.remove(self)
+        experiment = getattr(self, 'experiment', None)
+        if self.kind == 'Sample' and experiment is not None:
+            for stored in experiment.scalars:
+                stored['measurements'].pop(self.name, None)
+            experiment.scalars = [stored for stored in experiment.scalars if stored['measurements']]
+
+
+class FakeResource(object):
+    """a type of object in a `FakeIloop`, with the calls of the potion client resources used by the uploaders"""
+
+    def __init__(self, iloop, kind):
+        self.iloop = iloop
+        self.kind = kind
+        self.items = []
+
+    def instances(self, where=None):
+        self.iloop.record(self.kind, 'instances')
+        return [item for item in list(self.items)
+                if all(getattr(item, key, None) == value for key, value in (where or {}).items())]
+
+    def one(self, where):
+        matches = self.instances(where)
+        if not matches:
+            raise ItemNotFound
+        return matches[0]
+
+    def create(self, **properties):
+        item = FakeItem(self.iloop, self.kind, id=next(self.iloop.ids), **properties)
+        self.iloop.record(self.kind, 'create', item.label)
+        self.items.append(item)
+        return item
+
+
+class FakeIloop(object):
+    """iloop client keeping objects in memory and recording the calls made to it
+
+    :param failing: (kind, method, label) of the calls that raise an HTTPError, e.g. ('Sample', 'create', 'a')
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.ids = count(1)
+        self.calls = []
+        self.lock = threading.Lock()
+        self.resources = {kind: FakeResource(self, kind)
+                          for kind in ('Experiment', 'ExperimentPhase', 'Medium', 'Plate', 'Sample', 'Strain')}
+
+    def __getattr__(self, kind):
+        if kind in self.__dict__.get('resources', {}):
+            return self.resources[kind]
+        raise AttributeError(kind)
+
+    def record(self, kind, method, label=None, *args):
+        with self.lock:
+            self.calls.append((kind, method, label, threading.current_thread()))
+        if (kind, method, label) in self.failing:
+            raise HTTPError('{} of {} {} failed'.format(method, kind, label))
+
+    def called(self, kind, method):
+        return [label for call_kind, call_method, label, _ in self.calls if (call_kind, call_method) == (kind, method)]
+
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    cache = IloopCache()
+    cache._identifiers = {'medium': frozenset()}
+    monkeypatch.setattr(cup, 'iloop_cache', cache)
+    return cache
 
 
 def test_media_inspection(examples):
@@ -42,9 +183,9 @@ def test_media_inspection(examples):
         assert all(key in info for key in ['name', 'identifier', 'ph'])
         assert isinstance(ingredients, list)
         assert isinstance(name, str)
-    with pytest.raises(ValueError) as excinfo:
+    with pytest.raises(ValidationError) as excinfo:
         cup.MediaUploader(PROJECT_OBJECT, join(examples, 'media-invalid.csv'), [])
-    report = json.loads(str(excinfo.value))
+    report = excinfo.value.report
     assert report['error-count'] == 1
     error = report['tables'][0]['errors'].pop()
     assert 'does not conform to the maximum' in error['message']
@@ -55,9 +196,9 @@ def test_strains_inspection(examples):
     assert isinstance(up.df, pd.DataFrame)
     assert len(up.iloop_args) == len(up.df)
     assert set(strain['strain_alias'] for strain in up.iloop_args) == set(up.df['strain'])
-    with pytest.raises(ValueError) as excinfo:
+    with pytest.raises(ValidationError) as excinfo:
         cup.StrainsUploader(PROJECT_OBJECT, join(examples, 'strains-invalid.csv'))
-    report = json.loads(str(excinfo.value))
+    report = excinfo.value.report
     assert report['error-count'] == 1
     error = report['tables'][0]['errors'].pop()
     assert 'bad expected gnomic' in error['message']
@@ -88,17 +229,40 @@ def test_fluxomics_inspection(examples, project):
     up = cup.XrefMeasurementUploader(project, join(examples, 'fluxes.csv'),
                                      subject_type='reaction', custom_checks=checks)
     assert isinstance(up.df, pd.DataFrame)
-    with pytest.raises(ValueError) as excinfo:
+    with pytest.raises(ValidationError) as excinfo:
         cup.XrefMeasurementUploader(project,
                                     join(examples, 'fluxes-invalid.csv'),
                                     subject_type='reaction',
                                     custom_checks=checks)
-    report = json.loads(str(excinfo.value))
+    report = excinfo.value.report
     assert report['error-count'] == 2
     error = report['tables'][0]['errors'].pop()
     assert 'unknown reaction identifier' in error['message']
 
 
+def test_experiment_without_values(examples, tmpdir):
+    screen = pd.read_csv(join(examples, 'screening.csv'))
+    empty = screen.copy()
+    empty['experiment'] = 'screen0'
+    empty['plate_name'] = 'plate0'
+    empty['value'] = None
+    file_name = str(tmpdir.join('screening.csv'))
+    pd.concat([empty, screen]).to_csv(file_name, index=False)
+    up = cup.ScreenUploader(PROJECT_OBJECT, file_name, [])
+    assert [exp_id for exp_id, _, _ in up.experiment_properties()] == ['screen1']
+
+
+def test_flux_matrix_inspection(examples, project):
+    checks = [partial(medium_name_unknown, None),
+              partial(reaction_id_unknown, None),
+              partial(strain_alias_unknown, project)]
+    up = cup.XrefMatrixUploader(project, join(examples, 'fluxes-samples.csv'), join(examples, 'fluxes-matrix.csv'),
+                                subject_type='reaction', custom_checks=checks)
+    assert list(up.df['sample_name']) == cup.read_sample_names(join(examples, 'fluxes-samples.csv'))
+    assert up.db_name == 'bigg.reaction'
+    assert list(up.accessions) == ['DHAD1m', 'ENO', 'NH4t', 'SUCCtm']
+
+
 def test_proteomics_inspection(examples, project):
     checks = [partial(medium_name_unknown, None),
               partial(protein_id_unknown, None),
@@ -107,12 +271,199 @@ def test_proteomics_inspection(examples, project):
                                      join(examples, 'protein_abundances.csv'),
                                      subject_type='protein', custom_checks=checks)
     assert isinstance(up.df, pd.DataFrame)
-    with pytest.raises(ValueError) as excinfo:
+    with pytest.raises(ValidationError) as excinfo:
         cup.XrefMeasurementUploader(project,
                                     join(examples, 'protein_abundances-invalid.csv'),
                                     subject_type='reaction',
                                     custom_checks=checks)
-    report = json.loads(str(excinfo.value))
+    report = excinfo.value.report
     assert report['error-count'] == 1
     error = report['tables'][0]['errors'].pop()
     assert 'unknown protein identifier' in error['message']
+
+
+def test_media_upload(examples, empty_cache):
+    up = cup.MediaUploader(PROJECT_OBJECT, join(examples, 'media.csv'), [])
+    iloop = FakeIloop(failing=[('Medium', 'create', 'my-feed')])
+    with pytest.raises(cup.UploadError) as excinfo:
+        up.upload(iloop)
+    report = excinfo.value.report
+    assert report['error-count'] == 1
+    assert 'failed to upload medium my-feed' in report['tables'][0]['errors'][0]['message']
+    assert report['results'] == {'my-batch': 'created', 'my-feed': 'failed'}
+    assert iloop.called('Medium', 'update_contents') == ['my-batch']
+    assert all(thread is not threading.main_thread() for _, method, _, thread in iloop.calls if method == 'create')
+    assert empty_cache.identifiers['medium'] == {'my-batch'}
+    # uploading again creates only the medium that failed
+    iloop.failing.clear()
+    up.upload(iloop)
+    assert up.results == {'my-batch': 'done', 'my-feed': 'created'}
+    assert iloop.called('Medium', 'create') == ['my-batch', 'my-feed', 'my-feed']
+
+
+def test_find_medium(empty_cache):
+    iloop = FakeIloop()
+    contents = [{'compound': 'glucose', 'concentration': 2}]
+    iloop.Medium.create(name='batch', identifier='batch-1', contents=contents, ph=7)
+    empty_cache._identifiers = {'medium': frozenset(['batch'])}
+    fingerprint = recipe_fingerprint(contents, 7)
+    assert empty_cache.find_medium(iloop, 'batch', fingerprint) == 'batch-1'
+    assert empty_cache.find_medium(iloop, 'batch', recipe_fingerprint(contents, 6)) is None
+    assert empty_cache.find_medium(iloop, 'feed', fingerprint) is None
+    empty_cache.add_recipe('batch-2', 'batch', recipe_fingerprint(contents, 6))
+    assert empty_cache.find_medium(iloop, 'batch', recipe_fingerprint(contents, 6)) == 'batch-2'
+    # the media named batch are listed once
+    assert len(iloop.called('Medium', 'instances')) == 1
+
+
+def test_incremental_upload_deletes_samples():
+    iloop = FakeIloop()
+    experiment = iloop.Experiment.create(identifier='exp', project=PROJECT_OBJECT)
+    for name in ('a', 'b', 'c'):
+        iloop.Sample.create(name=name, experiment=experiment)
+    test = {'type': 'compound', 'numerator': 'glucose'}
+    # sample c has no values
+    experiment.scalars = [{'test': test, 'measurements': {'a': [1.0], 'b': [2.0]}}]
+    up = cup.ExperimentUploader(PROJECT_OBJECT, type='screening', sample_name='well', incremental=True)
+    up.checkpoint.mark('experiment', 'exp', value='existing')
+    up.add_samples(iloop, 'exp', experiment, {'a': {'name': 'a'}}, [{'test': test, 'measurements': {'a': [1.5]}}])
+    assert iloop.called('Sample', 'delete') == ['b', 'c']
+    assert [sample.name for sample in iloop.Sample.items] == ['a']
+    # the value of b goes with the sample, the changed value of a is replaced
+    assert iloop.called('Experiment', 'remove_scalars') == ['exp']
+    assert iloop.called('Experiment', 'add_samples') == ['exp']
+    assert experiment.scalars == [{'test': test, 'measurements': {'a': [1.5]}}]
+
+
+def test_incremental_upload_changes_values():
+    iloop = FakeIloop()
+    experiment = iloop.Experiment.create(identifier='exp', project=PROJECT_OBJECT)
+    for name in ('a', 'b'):
+        iloop.Sample.create(name=name, experiment=experiment)
+    glucose = {'type': 'compound', 'numerator': 'glucose'}
+    growth = {'type': 'growth-rate'}
+    experiment.scalars = [{'test': glucose, 'measurements': {'a': [1.0], 'b': [2.0]}},
+                          {'test': growth, 'measurements': {'a': [0.1]}}]
+    samples = {name: {'name': name} for name in ('a', 'b', 'c', 'd')}
+    scalars = [{'test': glucose, 'measurements': {'a': [1.5], 'b': [2.0], 'c': [3.0]}}]
+    up = cup.ExperimentUploader(PROJECT_OBJECT, type='screening', sample_name='well', incremental=True)
+    up.checkpoint.mark('experiment', 'exp', value='existing')
+    up.add_samples(iloop, 'exp', experiment, samples, scalars)
+    # the new samples are defined, including d without values, the existing ones are not defined again
+    assert sorted(sample.name for sample in iloop.Sample.items) == ['a', 'b', 'c', 'd']
+    assert iloop.called('Sample', 'delete') == []
+    assert dict(scalar_values(experiment.scalars)) == dict(scalar_values(scalars))
+
+
+def test_sample_upload(examples):
+    up = cup.XrefMeasurementUploader(PROJECT_OBJECT, join(examples, 'fluxes.csv'), subject_type='reaction',
+                                     custom_checks=[])
+    iloop = FakeIloop(failing=[('Sample', 'create', 'flux1C1')])
+    experiment = iloop.Experiment.create(identifier='flux1', project=PROJECT_OBJECT)
+    iloop.Medium.create(name='my-batch')
+    iloop.Strain.create(alias='spam', project=PROJECT_OBJECT)
+    iloop.Sample.create(name='flux1A1', experiment=experiment)
+    iloop.calls.clear()
+    with pytest.raises(cup.UploadError) as excinfo:
+        up.upload_sample_info(iloop)
+    report = excinfo.value.report
+    assert report['error-count'] == 1
+    assert 'failed to create sample flux1C1 of experiment flux1' in report['tables'][0]['errors'][0]['message']
+    assert sorted(iloop.called('Sample', 'create')) == ['flux1B1', 'flux1C1', 'flux1D1']
+    # each experiment, medium and strain is looked up once, the samples of an experiment are listed once
+    assert len(iloop.called('Sample', 'instances')) == 1
+    assert len(iloop.called('Medium', 'instances')) == 1
+    assert len(iloop.called('Strain', 'instances')) == 1
+    assert all(up.checkpoint.done('sample', 'flux1', name) for name in ('flux1A1', 'flux1B1', 'flux1D1'))
+    assert not up.checkpoint.done('sample', 'flux1', 'flux1C1')
+    # uploading again only creates the sample that failed
+    iloop.failing.clear()
+    iloop.calls.clear()
+    up.upload_sample_info(iloop)
+    assert iloop.called('Sample', 'create') == ['flux1C1']
+
+
+def test_phase_registry():
+    iloop = FakeIloop()
+    experiment = iloop.Experiment.create(identifier='exp', project=PROJECT_OBJECT)
+    other = iloop.Experiment.create(identifier='other', project=PROJECT_OBJECT)
+    existing = iloop.ExperimentPhase.create(experiment=experiment, start=0.0, end=10.0, title='0.0__10.0')
+    iloop.calls.clear()
+    phases = cup.PhaseRegistry(iloop)
+    phases.prepare(experiment, [(0, 10), ('10', '20'), (10.0, 20.0)])
+    assert phases.get(experiment, 0, 10) is existing
+    created = phases.get(experiment, 10, 20)
+    assert created.title == '10.0__20.0'
+    assert phases.get(experiment, '10.0', 20) is created
+    # missing phases are created when first asked for, phases of other experiments are kept apart
+    assert phases.get(other, 0, 10) is not existing
+    assert phases.get(other, 0, 10).experiment is other
+    assert iloop.called('ExperimentPhase', 'create') == ['10.0__20.0', '0.0__10.0']
+    assert len(iloop.called('ExperimentPhase', 'instances')) == 2
+
+
+def test_pipeline(monkeypatch):
+    monkeypatch.setattr(cup.Default, 'EXPERIMENT_UPLOAD_CONCURRENCY', 2)
+    up = cup.ExperimentUploader(PROJECT_OBJECT, type='screening', sample_name='well')
+    lock = threading.Lock()
+    prepared = []
+    sent = []
+    waiting = []
+
+    def prepare(key, df):
+        with lock:
+            waiting.append(len(prepared) - len(sent))
+        prepared.append((key, threading.current_thread()))
+        return key * 10
+
+    def send(key, payload):
+        try:
+            if key == 3:
+                raise HTTPError('bad experiment')
+            assert payload == key * 10
+        finally:
+            with lock:
+                sent.append(key)
+
+    with pytest.raises(cup.UploadError) as excinfo:
+        up.pipeline('experiment', ((key, None) for key in range(8)), prepare, send)
+    assert [key for key, _ in prepared] == list(range(8))
+    assert all(thread is threading.main_thread() for _, thread in prepared)
+    # no more payloads wait to be sent than are sent at a time
+    assert max(waiting) <= 2
+    assert sorted(sent) == list(range(8))
+    report = excinfo.value.report
+    assert report['error-count'] == 1
+    assert report['tables'][0]['errors'][0]['message'] == 'failed to upload experiment 3: bad experiment'
+
+    def broken(key, payload):
+        raise ValueError('not an iloop error')
+
+    with pytest.raises(ValueError):
+        up.pipeline('experiment', ((key, None) for key in range(3)), prepare, broken)
+
+
+def test_flux_matrix_upload(examples, empty_cache, tmpdir):
+    up = cup.XrefMatrixUploader(PROJECT_OBJECT, join(examples, 'fluxes-samples.csv'),
+                                join(examples, 'fluxes-matrix.csv'), subject_type='reaction', custom_checks=[])
+    iloop = FakeIloop()
+    iloop.Medium.create(name='my-batch')
+    iloop.Strain.create(alias='spam', project=PROJECT_OBJECT)
+    up.upload(iloop)
+    assert iloop.called('Experiment', 'create') == ['flux1']
+    assert iloop.called('Sample', 'create') == ['flux1A1', 'flux1B1', 'flux1C1', 'flux1D1']
+    assert iloop.called('Sample', 'add_xref_measurements') == ['flux1A1', 'flux1B1', 'flux1C1', 'flux1D1']
+    matrix = pd.read_csv(join(examples, 'fluxes-matrix.csv'))
+    for xref_ids, message in ((['bigg.reaction:DHAD1m', 'ENO', 'bigg.reaction:NH4t', 'bigg.reaction:SUCCtm'],
+                               'does not conform to the pattern constraint'),
+                              (['bigg.reaction:DHAD1m', 'bigg.reaction:ENO', 'metanetx.reaction:MNXR1',
+                                'bigg.reaction:SUCCtm'], 'expected identifiers of one database')):
+        matrix['xref_id'] = xref_ids
+        file_name = str(tmpdir.join('fluxes-matrix.csv'))
+        matrix.to_csv(file_name, index=False)
+        with pytest.raises(ValidationError) as excinfo:
+            cup.XrefMatrixUploader(PROJECT_OBJECT, join(examples, 'fluxes-samples.csv'), file_name,
+                                   subject_type='reaction', custom_checks=[])
+        report = excinfo.value.report
+        assert report['error-count'] == 1
+        assert any(message in error['message'] for table in report['tables'] for error in table['errors'])
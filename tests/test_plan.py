@@ -0,0 +1,38 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for upload plans
+
+ """
+import pytest
+
+from upload.plan import UploadPlan
+
+
+def test_upload_plan():
+    plan = UploadPlan()
+    plan.add('pool', 'create', 'pool_a', writes=1)
+    for alias in ('a', 'b', 'c'):
+        plan.add('strain', 'create', alias, writes=1)
+    plan.add('strain', 'reuse', 'd')
+    assert plan.count('strain', 'create') == 3
+    assert plan.count('medium', 'create') == 0
+    summary = plan.as_dict(max_items=2)
+    assert summary['write-calls'] == 4
+    assert summary['counts'] == {'pool': {'create': 1}, 'strain': {'create': 3, 'reuse': 1}}
+    assert summary['objects']['strain']['create'] == ['a', 'b']
+    with pytest.raises(ValueError):
+        plan.add('strain', 'overwrite', 'a')
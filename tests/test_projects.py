@@ -0,0 +1,38 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for the project listing cache
+
+ """
+from upload.projects import ProjectListCache
+
+
+def test_project_list_cache():
+    cache = ProjectListCache(ttl=60)
+    listing = cache.put('api', 'token', [{'display': 'Demo', 'value': 1}])
+    assert cache.get('api', 'token') is listing
+    assert cache.get('api', 'other-token') is None
+    assert listing.body == b'[{"display":"Demo","value":1}]'
+    cache.saw_project('api', 'token', 1)
+    assert cache.get('api', 'token') is listing
+    cache.saw_project('api', 'token', 2)
+    assert cache.get('api', 'token') is None
+
+
+def test_project_list_cache_expiry():
+    cache = ProjectListCache(ttl=-1)
+    cache.put('api', 'token', [])
+    assert cache.get('api', 'token') is None
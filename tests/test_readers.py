@@ -0,0 +1,107 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for reading uploaded files
+
+ """
+import csv
+from os.path import join
+
+import pytest
+
+from upload.app import write_temp_csvs
+from upload.multipart import UploadedFile
+from upload.readers import WorkbookReader, columnar_format, read_columnar, workbook_format
+from upload.schemas import schema_registry
+from upload.validation import ValidationError, inspect_table
+
+
+def test_workbook_format():
+    assert workbook_format('application/octet-stream', 'media.XLSX') == 'xlsx'
+    assert workbook_format('application/vnd.ms-excel', 'media') == 'xls'
+    assert workbook_format('text/csv', 'media.csv') is None
+
+
+@pytest.mark.parametrize('file_name, excel_format', [('media.xlsx', 'xlsx'), ('media.xls', 'xls')])
+def test_workbook_to_csv(examples, file_name, excel_format):
+    with open(join(examples, file_name), 'rb') as workbook_file:
+        with WorkbookReader(workbook_file, excel_format) as workbook:
+            assert workbook.find_sheet('spam') is None
+            csv_file_name, _ = workbook.to_csv(workbook.find_sheet('media'))
+    with open(csv_file_name) as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows[0] == ['medium', 'compound_name', 'pH', 'concentration', 'comment']
+    assert all(len(row) == len(rows[0]) for row in rows)
+    assert rows[1][:2] == ['my-batch', '(NH4)2SO4']
+
+
+def test_errors_refer_to_sheet_rows(tmpdir):
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'media'
+    sheet.append(['medium', 'compound_name', 'pH', 'concentration', 'comment'])
+    sheet.append(['my-batch', 'glucose', 7, 1, None])
+    sheet.append([])
+    sheet.append([])
+    sheet.append(['my-batch', 'water', 'spam', 1, None])
+    sheet.append([])
+    sheet.append(['my-feed', 'glucose', 'spam', 2, None])
+    path = str(tmpdir.join('media.xlsx'))
+    workbook.save(path)
+    with open(path, 'rb') as workbook_file:
+        with WorkbookReader(workbook_file, 'xlsx') as reader:
+            csv_file_name, row_numbers = reader.to_csv('media')
+    assert [row_numbers(row) for row in range(1, 5)] == [1, 2, 5, 7]
+    report = inspect_table(csv_file_name, schema_registry['media'].descriptor(), row_numbers=row_numbers)
+    errors = report['tables'][0]['errors']
+    assert [error['row-ranges'] for error in errors] == [[[5, 5], [7, 7]]]
+    assert errors[0]['message'].startswith('Rows 5, 7 has non castable value')
+
+
+def test_workbook_with_unsupported_sheets(tmpdir):
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'samples'
+    workbook.create_sheet('Physiology')
+    workbook.create_sheet('media')
+    workbook.create_sheet('notes')
+    path = str(tmpdir.join('fermentation.xlsx'))
+    workbook.save(path)
+    with open(path, 'rb') as workbook_file:
+        content = UploadedFile('file[0]', 'fermentation.xlsx', workbook_file, 'application/octet-stream')
+        with pytest.raises(ValidationError) as excinfo:
+            write_temp_csvs(content, ['samples', 'physiology'], temp_dir=str(tmpdir))
+    message = excinfo.value.report['tables'][0]['errors'][0]['message']
+    assert message.startswith('sheet(s) media of fermentation.xlsx are not uploaded together')
+
+
+def test_columnar_format():
+    assert columnar_format('application/octet-stream', 'fluxes.parquet') == 'parquet'
+    assert columnar_format('application/vnd.apache.arrow.file', 'fluxes') == 'feather'
+    assert columnar_format('text/csv', 'fluxes.csv') is None
+
+
+@pytest.mark.parametrize('columnar', ['parquet', 'feather'])
+def test_read_columnar(examples, tmpdir, columnar):
+    pytest.importorskip('pyarrow')
+    import pandas as pd
+    df = pd.read_csv(join(examples, 'fluxes.csv'))
+    path = str(tmpdir.join('fluxes.' + columnar))
+    getattr(df, 'to_' + columnar)(path)
+    with open(path, 'rb') as columnar_file:
+        read = read_columnar(columnar_file, columnar)
+    pd.testing.assert_frame_equal(read, df)
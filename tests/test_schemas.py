@@ -0,0 +1,76 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for the compiled schema registry
+
+ """
+import gzip
+import json
+import os
+
+import pytest
+
+from upload.schemas import SCHEMA_FILES, SchemaRegistry, accepts_encoding, etag_matches, schema_registry
+
+
+def test_registry_compiles_all_schemas():
+    assert set(schema_registry) == set(SCHEMA_FILES)
+    for name in schema_registry:
+        compiled = schema_registry[name]
+        assert json.loads(compiled.body.decode()) == compiled.descriptor()
+        assert gzip.decompress(compiled.gzipped) == compiled.body
+        assert compiled.etag.startswith('"')
+    with pytest.raises(KeyError):
+        schema_registry['spam']
+
+
+def test_derived_descriptor_leaves_registry_untouched():
+    physiology = schema_registry['physiology']
+    n_fields = len(physiology.descriptor()['fields'])
+    extended = physiology.descriptor({'name': name, 'type': 'number'} for name in ['foo_A1', 'foo_A2'])
+    assert len(extended['fields']) == n_fields + 2
+    assert len(physiology.descriptor()['fields']) == n_fields
+
+
+def test_representation_per_encoding():
+    media = schema_registry['media']
+    assert media.representation('gzip, deflate') == (media.gzipped, media.gzip_etag, 'gzip')
+    assert media.representation(None) == (media.body, media.etag, None)
+    assert media.gzip_etag != media.etag
+    assert accepts_encoding('deflate, gzip;q=0.5', 'gzip')
+    assert not accepts_encoding('gzip;q=0, *', 'gzip')
+    assert not accepts_encoding('identity', 'gzip')
+    assert accepts_encoding('br, *;q=0.1', 'gzip')
+    assert not accepts_encoding('*;q=0', 'gzip')
+
+
+def test_etag_matches():
+    etag = schema_registry['media'].etag
+    assert etag_matches(etag, etag)
+    assert etag_matches('"other", W/{}'.format(etag), etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"x{}x"'.format(etag.strip('"')), etag)
+    assert not etag_matches(schema_registry['media'].gzip_etag, etag)
+
+
+def test_registry_independent_of_working_directory(tmpdir):
+    cwd = os.getcwd()
+    os.chdir(str(tmpdir))
+    try:
+        assert set(SchemaRegistry()) == set(SCHEMA_FILES)
+    finally:
+        os.chdir(cwd)
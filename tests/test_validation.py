@@ -0,0 +1,147 @@
+# Copyright 2018 Novo Nordisk Foundation Center for Biosustainability, DTU.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tests for bounded table inspection
+
+ """
+import csv
+import os
+from os.path import dirname, join
+
+from upload.schemas import schema_registry
+from upload.validation import _chunks, inspect_frame, inspect_table
+
+
+def write_media(path, n_rows, ph='5'):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['medium', 'compound_name', 'pH', 'concentration', 'comment'])
+        for i in range(n_rows):
+            writer.writerow(['medium-{}'.format(i), 'glucose', ph, i, ''])
+    return path
+
+
+def test_identical_errors_collapsed_across_chunks(tmpdir):
+    file_name = write_media(str(tmpdir.join('media.csv')), 250, ph='spam')
+    report = inspect_table(file_name, schema_registry['media'].descriptor(), chunk_size=100)
+    assert not report['valid']
+    assert report['error-count'] == 250
+    errors = report['tables'][0]['errors']
+    assert len(errors) == 1
+    assert errors[0]['row-ranges'] == [[2, 251]]
+    assert errors[0]['message'].startswith('Rows 2-251 ')
+    assert report['tables'][0]['row-count'] == 251
+
+
+def test_chunks_in_temp_dir(tmpdir):
+    file_name = write_media(str(tmpdir.join('media.csv')), 250, ph='spam')
+    chunk_dir = str(tmpdir.mkdir('chunks'))
+    offsets = []
+    for chunk_file_name, offset in _chunks(file_name, 100, temp_dir=chunk_dir):
+        assert dirname(chunk_file_name) == chunk_dir
+        offsets.append(offset)
+    assert offsets == [0, 100, 200]
+    report = inspect_table(file_name, schema_registry['media'].descriptor(), chunk_size=100, temp_dir=chunk_dir)
+    assert report['error-count'] == 250
+    assert os.listdir(chunk_dir) == []
+
+
+def test_error_limit_stops_inspection(tmpdir, examples):
+    file_name = write_media(str(tmpdir.join('media.csv')), 250)
+    report = inspect_table(file_name, schema_registry['media'].descriptor(), chunk_size=100, error_limit=1)
+    assert report['valid']
+    report = inspect_table(join(examples, 'media-invalid.csv'), schema_registry['media'].descriptor(),
+                           error_limit=1)
+    assert report['error-count'] == 1
+    assert 'does not conform to the maximum' in report['tables'][0]['errors'][0]['message']
+
+
+def test_frame_inspected_like_csv(examples):
+    import pandas as pd
+    schema = schema_registry['media'].descriptor()
+    file_name = join(examples, 'media-invalid.csv')
+    table = inspect_table(file_name, schema)['tables'][0]
+    frame = inspect_frame(pd.read_csv(file_name), schema)['tables'][0]
+    assert [error['message'] for error in frame['errors']] == [error['message'] for error in table['errors']]
+    assert frame['row-count'] == table['row-count']
+
+
+def test_frame_custom_checks_once_per_value():
+    import pandas as pd
+    checked = []
+
+    def unknown_compound(errors, columns, row_number, state):
+        for column in columns:
+            if column['header'] == 'compound_name':
+                checked.append(column['value'])
+                if column['value'] == 'spam':
+                    errors.append({'code': 'bad-value', 'message': 'Row {} has unknown compound'.format(row_number),
+                                   'row-number': row_number, 'column-number': column['number']})
+
+    df = pd.DataFrame({'medium': ['a', 'b', 'c'], 'compound_name': ['spam', 'glucose', 'spam'], 'pH': [5, 5, 'x'],
+                       'concentration': [1.0, 2.0, 3.0], 'comment': [None, None, None]})
+    report = inspect_frame(df, schema_registry['media'].descriptor(), custom_checks=[unknown_compound])
+    assert sorted(checked) == ['glucose', 'spam']
+    errors = {error['code']: error for error in report['tables'][0]['errors']}
+    assert errors['bad-value']['row-ranges'] == [[2, 2], [4, 4]]
+    assert errors['bad-value']['message'] == 'Rows 2, 4 has unknown compound'
+    assert errors['non-castable-value']['row-number'] == 4
+
+
+def test_matrix_columns_per_sample(tmpdir, examples):
+    import pandas as pd
+    sample_names = ['flux1A1', 'flux1B1', 'flux1C1', 'flux1D1']
+    schema = schema_registry['xref_matrix'].descriptor({'name': name, 'type': 'number'} for name in sample_names)
+    assert inspect_table(join(examples, 'fluxes-matrix.csv'), schema)['valid']
+    matrix = pd.read_csv(join(examples, 'fluxes-matrix.csv'), dtype={'flux1B1': object})
+    matrix.loc[1, 'xref_id'] = matrix.loc[0, 'xref_id']
+    matrix.loc[2, 'flux1B1'] = 'spam'
+    file_name = str(tmpdir.join('matrix.csv'))
+    matrix.to_csv(file_name, index=False)
+    table = inspect_table(file_name, schema)['tables'][0]
+    frame = inspect_frame(matrix, schema)['tables'][0]
+    assert sorted(error['code'] for error in frame['errors']) == ['non-castable-value', 'unique-constraint']
+    assert sorted(error['message'] for error in frame['errors']) == \
+        sorted(error['message'] for error in table['errors'])
+
+
+def test_error_cap_per_check():
+    import pandas as pd
+
+    def unknown(header, label):
+        def check(errors, columns, row_number, state):
+            for column in columns:
+                if column['header'] == header:
+                    errors.append({'code': 'bad-value', 'message': 'Row {} has unknown {} {}'.format(
+                        row_number, label, column['value']), 'row-number': row_number,
+                        'column-number': column['number']})
+        check.__name__ = '{}_unknown'.format(label)
+        return check
+
+    df = pd.DataFrame({'medium': ['medium-{}'.format(i) for i in range(5)],
+                       'compound_name': ['compound-{}'.format(i) for i in range(5)],
+                       'pH': [5.0] * 5, 'concentration': [1.0] * 5, 'comment': [None] * 5})
+    checks = [unknown('medium', 'medium'), unknown('compound_name', 'compound')]
+    report = inspect_frame(df, schema_registry['media'].descriptor(), custom_checks=checks, check_error_limit=2)
+    messages = [error['message'] for error in report['tables'][0]['errors']]
+    assert len([message for message in messages if 'unknown medium' in message]) == 2
+    assert len([message for message in messages if 'unknown compound' in message]) == 2
+    assert report['error-count'] == 10
+    assert report['warnings'] == [
+        '3 further "bad-value" error(s) of compound_unknown not reported, limit of 2 errors per check or 1000 errors '
+        'in total reached',
+        '3 further "bad-value" error(s) of medium_unknown not reported, limit of 2 errors per check or 1000 errors '
+        'in total reached']